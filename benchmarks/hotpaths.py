@@ -0,0 +1,223 @@
+"""
+How many calls per second kspy's per-tick maths and planning functions manage, with a history to
+catch regressions in
+
+Each benchmark times one function on fixed inputs: recorded values for the pure maths, and vessels
+in a kspy.sim.Simulation for anything that takes a vessel or a node. Every run is appended to a JSON
+lines history (one record per benchmark) and compared against the median of the last few runs on
+the same host, so run this before and after touching maths, rover, landing, launch, rendezvous, node
+or pid.
+
+    python benchmarks/hotpaths.py
+    python benchmarks/hotpaths.py --check --tolerance 0.2
+    python benchmarks/hotpaths.py --only maths.angleBetween pid.PID.update --no-record
+"""
+from __future__ import print_function, absolute_import, division
+
+import argparse
+import datetime
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+
+from kspy import bodies
+from kspy import landing
+from kspy import launch
+from kspy import maths
+from kspy import node
+from kspy import orbit
+from kspy import pid
+from kspy import rendezvous
+from kspy import rover
+from kspy.sim import Simulation, Stage
+
+HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history.jsonl')
+
+# how many of the latest runs on this host make up the baseline
+BASELINE_RUNS = 5
+
+# a rocket on the pad at KSC
+KSC = maths.latlon(-0.0972, -74.5577)
+PROBE = [Stage(dryMass=500, fuelMass=1000, thrust=20000, isp=320)]
+
+
+def angleBetween():
+    # the vessel's facing and its surface prograde, partway through a gravity turn
+    facing = np.array([0.5735, 0.8191, 0.0])
+    prograde = np.array([0.6018, 0.7986, 0.0123])
+    return lambda: maths.angleBetween(facing, prograde)
+
+
+def distance():
+    sim = Simulation()
+    vessel = sim.addOrbitingVessel('Chaser', PROBE, 100000)
+    target = sim.addOrbitingVessel('Target', PROBE, 100000, trueAnomaly=2.0)
+    return lambda: maths.distance(vessel, target)
+
+
+def headingForLatLon():
+    # a rover a few kilometres out from KSC, heading back to the pad
+    location = maths.latlon(-0.1523, -74.4812)
+    return lambda: rover.headingForLatLon(KSC, location)
+
+
+def coordsDownBearing():
+    # with the body's constants already on hand, as Descend has them
+    kerbin = bodies.constants(Simulation().body)
+    return lambda: landing.coordsDownBearing(KSC.lat, KSC.lon, 90.0, 1500.0, kerbin)
+
+
+def launchAzimuth():
+    sim = Simulation()
+    vessel = sim.addLandedVessel('Rocket', PROBE, KSC.lat, KSC.lon)
+    calculator = launch.LaunchAzimuthCalculator(80000, 6.0, sim.connection, vessel)
+    # as Ascend calls it every tick, with the latitude already on hand
+    return lambda: calculator(-0.0721)
+
+
+def timeTransfer():
+    sim = Simulation()
+    vessel = orbit.LocalOrbit.fromOrbit(sim.addOrbitingVessel('Chaser', PROBE, 100000).orbit)
+    target = orbit.LocalOrbit.fromOrbit(sim.addOrbitingVessel('Target', PROBE, 250000, trueAnomaly=90.0).orbit)
+    return lambda: rendezvous.timeTransfer(vessel, target, sim.ut, math.radians(30))
+
+
+def calculateBurnTime():
+    sim = Simulation()
+    vessel = sim.addOrbitingVessel('Probe', PROBE, 100000)
+    vessel.control.activate_next_stage()
+    maneuver = vessel.control.add_node(sim.ut + 60.0, prograde=250.0)
+    return lambda: node.calculateBurnTime(vessel, maneuver)
+
+
+def pidUpdate():
+    controller = pid.PID(0.25, 0.025, 0.0025)
+    controller.setpoint(20.0)
+    return lambda: controller.update(17.5)
+
+
+# name -> makes the function to time, which takes no arguments
+BENCHMARKS = (('maths.angleBetween', angleBetween),
+              ('maths.distance', distance),
+              ('rover.headingForLatLon', headingForLatLon),
+              ('landing.coordsDownBearing', coordsDownBearing),
+              ('launch.LaunchAzimuthCalculator.__call__', launchAzimuth),
+              ('rendezvous.timeTransfer', timeTransfer),
+              ('node.calculateBurnTime', calculateBurnTime),
+              ('pid.PID.update', pidUpdate))
+
+
+def callsPerSecond(func, minTime=0.5):
+    """
+    :param func: the thing to time
+    :return: calls per second, best of three runs of at least minTime each
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(number, int(math.ceil(number * minTime / 0.2)))
+    best = min(timer.repeat(repeat=3, number=number))
+    return number / best
+
+
+def gitCommit():
+    """
+    :return: the commit being benchmarked, or None outside a git checkout
+    """
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                         cwd=os.path.dirname(HISTORY), stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode().strip()
+
+
+def readHistory(path):
+    """
+    :return: list of the records in the history file, oldest first
+    """
+    if not os.path.exists(path):
+        return []
+
+    with open(path) as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def baseline(history, name, host):
+    """
+    :return: median calls per second over the latest BASELINE_RUNS runs of name on host, or None
+    """
+    runs = [record['callsPerSecond'] for record in history
+            if record['benchmark'] == name and record['host'] == host]
+    if not runs:
+        return None
+    return float(np.median(runs[-BASELINE_RUNS:]))
+
+
+def main():
+    names = [name for name, _ in BENCHMARKS]
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--only', nargs='+', choices=names, default=names, help="benchmarks to run")
+    parser.add_argument('--history', default=HISTORY, help="JSON lines file to compare against and append to")
+    parser.add_argument('--no-record', action='store_true', help="compare against the history without appending")
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help="fraction slower than the baseline that counts as a regression")
+    parser.add_argument('--check', action='store_true', help="exit with status 1 if anything regressed")
+    parser.add_argument('--min-time', type=float, default=0.5, help="seconds per timing run")
+    args = parser.parse_args()
+
+    # bodies.constants caches on disk, which shouldn't outlive a benchmark
+    os.environ.setdefault('KSPY_DATA', tempfile.mkdtemp(prefix='kspy-bench-'))
+
+    history = readHistory(args.history)
+    host = platform.node()
+    stamp = {'time': datetime.datetime.now().isoformat(timespec='seconds'),
+             'commit': gitCommit(),
+             'host': host,
+             'python': platform.python_version()}
+
+    records = []
+    regressions = []
+    print("{0:<42}{1:>16}{2:>16}{3:>10}".format('benchmark', 'calls/s', 'baseline', 'change'))
+    for name, setup in BENCHMARKS:
+        if name not in args.only:
+            continue
+
+        rate = callsPerSecond(setup(), args.min_time)
+        previous = baseline(history, name, host)
+
+        record = dict(stamp, benchmark=name, callsPerSecond=rate)
+        records.append(record)
+
+        if previous is None:
+            print("{0:<42}{1:>16,.0f}{2:>16}{3:>10}".format(name, rate, '-', '-'))
+            continue
+
+        change = rate / previous - 1.0
+        flag = ''
+        if change < -args.tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print("{0:<42}{1:>16,.0f}{2:>16,.0f}{3:>+9.1%}{4}".format(name, rate, previous, change, flag))
+
+    if not args.no_record:
+        with open(args.history, 'a') as fh:
+            for record in records:
+                fh.write(json.dumps(record, sort_keys=True) + '\n')
+
+    if regressions:
+        print("\n{0} slower than the last {1} runs on {2} by more than {3:.0%}".format(
+            ', '.join(regressions), BASELINE_RUNS, host, args.tolerance))
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
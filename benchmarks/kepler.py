@@ -0,0 +1,60 @@
+"""
+How many Kepler's equation solutions per second kspy.kepler manages, scalar and batched
+
+Run this before sizing a grid search: a porkchop plot or phase search costs roughly
+(grid points / solutions per second) seconds of solving.
+
+    python benchmarks/kepler.py
+"""
+from __future__ import print_function, absolute_import, division
+
+import math
+import timeit
+
+import numpy as np
+
+from kspy import kepler
+
+BATCH_SIZES = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+def solutionsPerSecond(func, count, minTime=0.5):
+    """
+    :param func: the thing to time, solving count equations per call
+    :param count: how many solutions one call to func produces
+    :return: solutions per second, best of three runs of at least minTime each
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(number, int(math.ceil(number * minTime / 0.2)))
+    best = min(timer.repeat(repeat=3, number=number))
+    return count * number / best
+
+
+def main():
+    random = np.random.RandomState(0)
+
+    print("{0:<28}{1:>10}{2:>18}".format('solver', 'batch', 'solutions/s'))
+
+    M, e = 1.234, 0.3
+    print("{0:<28}{1:>10}{2:>18,.0f}".format('eccentricFromMean (float)', 1,
+                                             solutionsPerSecond(lambda: kepler.eccentricFromMean(M, e), 1)))
+    print("{0:<28}{1:>10}{2:>18,.0f}".format('hyperbolicFromMean (float)', 1,
+                                             solutionsPerSecond(lambda: kepler.hyperbolicFromMean(M, 1.5), 1)))
+    print("{0:<28}{1:>10}{2:>18,.0f}".format('trueFromMean (float)', 1,
+                                             solutionsPerSecond(lambda: kepler.trueFromMean(M, e), 1)))
+
+    for size in BATCH_SIZES:
+        M = random.uniform(-4 * math.pi, 4 * math.pi, size)
+        elliptic = random.uniform(0.0, 0.95, size)
+        hyperbolic = random.uniform(1.05, 5.0, size)
+        mixed = np.where(random.rand(size) < 0.5, elliptic, hyperbolic)
+
+        for name, func in (('eccentricFromMean', lambda: kepler.eccentricFromMean(M, elliptic)),
+                           ('hyperbolicFromMean', lambda: kepler.hyperbolicFromMean(M, hyperbolic)),
+                           ('trueFromMean (mixed)', lambda: kepler.trueFromMean(M, mixed))):
+            print("{0:<28}{1:>10}{2:>18,.0f}".format(name, size, solutionsPerSecond(func, size)))
+
+
+if __name__ == '__main__':
+    main()
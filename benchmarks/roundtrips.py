@@ -0,0 +1,133 @@
+"""
+How fast kspy's programs tick, and how many round trips each tick costs, as the link to the game slows
+
+Each scenario runs a real program through the real krpc client against a simulated vessel served
+over TCP by kspy.sim.server.SimServer, once per latency setting. Run this after touching anything a
+program does per tick: requests per tick should stay flat, and ticks per second shouldn't fall off a
+cliff as latency grows.
+
+    python benchmarks/roundtrips.py
+    python benchmarks/roundtrips.py --latency 0 1 5 --jitter 0.5 --json results.json
+"""
+from __future__ import print_function, absolute_import, division
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from kspy import instrument
+from kspy import landing
+from kspy import programs
+from kspy import scheduler
+from kspy.sim import Simulation, Stage, MUN
+from kspy.sim.server import SimServer
+
+# milliseconds of latency per round trip, between the loopback baseline and the slowest production link
+LATENCIES = (0.0, 1.0, 2.0, 5.0)
+
+
+def executeNextManeuver(connection, duration):
+    """
+    A short prograde burn on a probe in low Kerbin orbit, with autostaging watching over it
+    """
+    vessel = connection.space_center.active_vessel
+    vessel.control.add_node(connection.space_center.ut + 3.0, prograde=10.0)
+    programs.ExecuteNextManeuver(connection, vessel)
+    return 'Maneuver'
+
+
+def hover(connection, duration):
+    """
+    Lift off from the Mun and hold a hover for duration seconds
+    """
+    vessel = connection.space_center.active_vessel
+    program = landing.Hover(connection, vessel, targetAlt=20)
+    end = time.monotonic() + duration
+    scheduler.Scheduler.forProgram(program).runWhile(lambda: program() and time.monotonic() < end)
+    program.release()
+    return 'Hover'
+
+
+def orbitingProbe():
+    sim = Simulation()
+    vessel = sim.addOrbitingVessel('Probe', [Stage(dryMass=500, fuelMass=1000, thrust=20000, isp=320)], 100000)
+    vessel.control.activate_next_stage()
+    return sim
+
+
+def munLander():
+    sim = Simulation(body=MUN)
+    vessel = sim.addLandedVessel('Lander', [Stage(dryMass=1500, fuelMass=2000, thrust=60000, isp=320)], 0.0, 0.0)
+    vessel.control.activate_next_stage()
+    return sim
+
+
+# name -> (makes the simulation, runs the program and returns the name it ticks under)
+SCENARIOS = {'ExecuteNextManeuver': (orbitingProbe, executeNextManeuver),
+             'Hover': (munLander, hover)}
+
+
+def measure(scenario, latency, jitter=0.0, duration=5.0):
+    """
+    :param scenario: name from SCENARIOS
+    :param latency: seconds of latency per round trip
+    :param jitter: +/- seconds of variation on it
+    :param duration: how long to run open-ended programs for, in seconds
+    :return: dictionary of what the run cost
+    """
+    makeSim, run = SCENARIOS[scenario]
+
+    with SimServer(makeSim(), latency=latency, jitter=jitter, seed=0) as server:
+        connection = server.connectTcp(scenario)
+        try:
+            with instrument.Instrument(connection) as recorder:
+                start = time.monotonic()
+                name = run(connection, duration)
+                elapsed = time.monotonic() - start
+                stats = recorder.program(name)
+        finally:
+            connection.close()
+
+    ticks = stats.ticks if stats else 0
+    return {'scenario': scenario,
+            'latency': latency,
+            'jitter': jitter,
+            'seconds': elapsed,
+            'ticks': ticks,
+            'ticksPerSecond': ticks / elapsed if elapsed else 0.0,
+            'requestsPerTick': stats.requests / ticks if ticks else 0.0,
+            'callsPerTick': stats.calls / ticks if ticks else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--latency', type=float, nargs='+', default=LATENCIES, help="milliseconds per round trip")
+    parser.add_argument('--jitter', type=float, default=0.0, help="+/- milliseconds of jitter on the latency")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds to run open-ended programs for")
+    parser.add_argument('--scenario', nargs='+', default=sorted(SCENARIOS), choices=sorted(SCENARIOS))
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    # programs cache terrain and body constants on disk, which shouldn't outlive a benchmark
+    os.environ.setdefault('KSPY_DATA', tempfile.mkdtemp(prefix='kspy-bench-'))
+
+    results = []
+    print("{0:<22}{1:>12}{2:>10}{3:>14}{4:>16}{5:>14}".format('scenario', 'latency ms', 'ticks', 'ticks/s',
+                                                               'requests/tick', 'calls/tick'))
+    for scenario in args.scenario:
+        for latency in args.latency:
+            result = measure(scenario, latency / 1000.0, args.jitter / 1000.0, args.duration)
+            results.append(result)
+            print("{0:<22}{1:>12.1f}{2:>10}{3:>14.1f}{4:>16.2f}{5:>14.2f}".format(
+                scenario, latency, result['ticks'], result['ticksPerSecond'], result['requestsPerTick'],
+                result['callsPerTick']))
+
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump(results, fh, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""
+Batched RPCs: pack many procedure calls into a single kRPC request
+
+The kRPC protocol lets one Request carry any number of ProcedureCalls, and the server answers
+them all in one Response. Collecting the calls a loop needs and sending them together turns N
+round trips into one, which is most of the cost of a tick when the game is on another machine.
+
+    with batch.Batch(connection) as b:
+        heights = [b.add(body.surface_height, lat, lon) for lat, lon in points]
+
+    highest = max(height() for height in heights)
+"""
+from __future__ import print_function, absolute_import, division
+
+from krpc.decoder import Decoder
+import krpc.schema.KRPC_pb2 as KRPC
+
+
+class BatchError(Exception):
+    pass
+
+
+class Future(object):
+    """
+    The eventual result of one call in a Batch. Call it (or use result) once the batch has run
+    """
+    __slots__ = ('_done', '_value', '_error')
+
+    def __init__(self):
+        self._done = False
+        self._value = None
+        self._error = None
+
+    @property
+    def done(self):
+        return self._done
+
+    def setResult(self, value):
+        self._value = value
+        self._done = True
+
+    def setError(self, error):
+        self._error = error
+        self._done = True
+
+    def result(self):
+        """
+        :return: the value the server sent back, raising whatever error it sent back instead
+        """
+        if not self._done:
+            raise BatchError("Batch has not been executed yet")
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    def __call__(self):
+        return self.result()
+
+
+def clientOf(obj):
+    """
+    :param obj: a remote object (vessel, body, orbit...) or a krpc connection
+    :return: the krpc connection that owns the input object
+    """
+    return getattr(obj, '_client', obj)
+
+
+def isRemote(connection):
+    """
+    :param connection: anything that looks like a connection
+    :return: True if this is a real krpc client we can send raw requests over
+    """
+    return hasattr(connection, '_rpc_connection') and hasattr(connection, 'get_call')
+
+
+class Batch(object):
+    """
+    Collects calls and sends them to the server as one request
+
+    Calls are added with the same (func, *args) convention as connection.add_stream, so
+    add(getattr, vessel, 'mass') reads a property and add(body.surface_height, lat, lon) calls a method.
+    Connections that aren't real krpc clients (like the offline simulator) just evaluate the calls
+    one after another when the batch executes, so code written against Batch works against both.
+    """
+    def __init__(self, connection):
+        """
+        :param connection: krpc.Connection to send the calls over, or any remote object living on it
+        """
+        self.connection = clientOf(connection)
+        self.remote = isRemote(self.connection)
+        self.pending = []
+        self.executed = False
+
+    def __len__(self):
+        return len(self.pending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        # don't bother the server if whatever built the batch blew up
+        if excType is None:
+            self.execute()
+
+    def add(self, func, *args):
+        """
+        Queue up a call
+
+        :param func: getattr, or a bound method of a remote object
+        :param args: the arguments to func
+        :return: a Future for the result
+        """
+        if self.executed:
+            raise BatchError("Can't add calls to a batch that has already been executed")
+
+        future = Future()
+
+        if self.remote:
+            call = self.connection.get_call(func, *args)
+            returnType = self.connection._get_return_type(func, *args)
+            self.pending.append((call, returnType, future))
+        else:
+            self.pending.append(((func, args), None, future))
+
+        return future
+
+    def addCall(self, call, returnType=None):
+        """
+        Queue up a prebuilt KRPC.ProcedureCall
+
+        :param call: the procedure call message
+        :param returnType: krpc TypeBase to decode the result with, None for calls without a result
+        :return: a Future for the result
+        """
+        if not self.remote:
+            raise BatchError("Prebuilt procedure calls need a real krpc connection")
+        if self.executed:
+            raise BatchError("Can't add calls to a batch that has already been executed")
+
+        future = Future()
+        self.pending.append((call, returnType, future))
+        return future
+
+    def execute(self):
+        """
+        Send every queued call in one request and resolve their futures
+
+        :return: the list of futures, in the order the calls were added
+        """
+        if self.executed:
+            raise BatchError("Batch has already been executed")
+        self.executed = True
+
+        futures = [future for _, _, future in self.pending]
+
+        if not self.pending:
+            return futures
+
+        if self.remote:
+            self._executeRemote()
+        else:
+            self._executeLocal()
+
+        del self.pending[:]
+        return futures
+
+    def _executeLocal(self):
+        for (func, args), _, future in self.pending:
+            try:
+                future.setResult(func(*args))
+            except Exception as e:
+                future.setError(e)
+
+    def _executeRemote(self):
+        client = self.connection
+
+        request = KRPC.Request()
+        request.calls.extend([call for call, _, _ in self.pending])
+
+        with client._rpc_connection_lock:
+            client._rpc_connection.send_message(request)
+            response = client._rpc_connection.receive_message(KRPC.Response)
+
+        # the whole request failed, so every call did
+        if response.HasField('error'):
+            error = client._build_error(response.error)
+            for _, _, future in self.pending:
+                future.setError(error)
+            return
+
+        for (call, returnType, future), result in zip(self.pending, response.results):
+            if result.HasField('error'):
+                future.setError(client._build_error(result.error))
+            elif returnType is None:
+                future.setResult(None)
+            else:
+                future.setResult(Decoder.decode(client, result.value, returnType))
+
+
+def gather(connection, calls):
+    """
+    Run a list of calls in a single round trip
+
+    :param connection: the krpc.Connection (or a remote object on it)
+    :param calls: iterable of (func, arg, arg...) tuples, as for Batch.add
+    :return: list of results, in the same order as the calls
+    """
+    with Batch(connection) as b:
+        futures = [b.add(*call) for call in calls]
+
+    return [future() for future in futures]
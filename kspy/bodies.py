@@ -0,0 +1,219 @@
+"""
+Constants of every celestial body, fetched once and kept on disk
+
+A body's radius, mass, gravitational parameter and so on never change during a save, so a
+BodyCatalog pulls them for every body in the system in a single batched request and writes them to a
+small JSON file under kspy's data directory. The next time we connect to the same system the catalog
+is read straight back off disk, and the only round trips left are the one listing the system's bodies
+and one batch fingerprinting it.
+
+Body names alone don't tell two systems apart (a rescale mod keeps Kerbin called Kerbin), so each
+catalog is kept under a fingerprint of every body's gravitational parameter and equatorial radius,
+and a file whose fingerprint doesn't match the server's is fetched again rather than trusted.
+
+    radius = bodies.constants(vessel.orbit.body).equatorial_radius
+
+BodyConstants uses krpc's attribute names, so it can be handed to anything that only reads constants
+off a body (like landing.coordsDownBearing) in place of the CelestialBody itself.
+"""
+from __future__ import print_function, absolute_import, division
+
+import collections
+import hashlib
+import json
+import os
+import weakref
+
+from . import batch
+from . import utils
+
+VERSION = 2
+
+NAMES = ('name', 'equatorial_radius', 'gravitational_parameter', 'surface_gravity', 'rotational_period',
+         'mass', 'sphere_of_influence', 'has_atmosphere', 'atmosphere_depth')
+
+BodyConstants = collections.namedtuple('BodyConstants', NAMES)
+
+# what tells one solar system from another
+FINGERPRINT = ('gravitational_parameter', 'equatorial_radius')
+
+
+class BodyCatalog(object):
+    """
+    Every body's constants for one save, loaded in one pass and persisted between sessions
+    """
+    # keyed weakly by connection, and a catalog only holds its connection weakly, so neither outlives it
+    _catalogs = weakref.WeakKeyDictionary()
+
+    def __init__(self, connection, save='default', path=None):
+        """
+        :param connection: krpc.Connection to the game
+        :param save: name to keep this save's constants under, purely for telling the files apart
+        :param path: file to keep the constants in, defaults to bodies/<save>-<system>.json in kspy's data
+                     directory, where system is a digest of the fingerprint
+        """
+        self._connection = weakref.ref(connection)
+        self.save = save
+
+        # object id -> name, so looking a body up doesn't need its name over RPC
+        bodies = dict(connection.space_center.bodies)
+        self.names = dict((getattr(body, '_object_id', id(body)), name) for name, body in bodies.items())
+
+        self.fingerprint = self._fingerprint(bodies)
+        self.path = path or utils.dataPath('bodies', '{0}-{1}.json'.format(save, self.system))
+
+        self.constants = self._load()
+        if set(self.constants) != set(bodies):
+            self.constants = self._fetch(bodies)
+            self._store()
+
+    @classmethod
+    def forConnection(cls, connection, **kwargs):
+        """
+        Get the catalog for the input connection, making it if this is the first time we've asked
+
+        :param connection: krpc.Connection
+        :param kwargs: passed to the constructor if the catalog doesn't exist yet, and otherwise have to
+                       match the existing catalog's (None matches anything)
+        :return: the BodyCatalog for that connection
+        """
+        catalog = cls._catalogs.get(connection)
+        if catalog is None:
+            catalog = cls._catalogs[connection] = cls(connection, **kwargs)
+        else:
+            for name, value in kwargs.items():
+                if value is not None and getattr(catalog, name) != value:
+                    raise ValueError("This connection's catalog already has {0}={1!r}, not {2!r}".format(
+                        name, getattr(catalog, name), value))
+        return catalog
+
+    @property
+    def connection(self):
+        """
+        :return: the catalog's krpc.Connection, or None once nothing else holds on to it
+        """
+        return self._connection()
+
+    def _fingerprint(self, bodies):
+        """
+        :param bodies: name -> CelestialBody for every body in the system
+        :return: sorted [[name, gravitational parameter, equatorial radius], ...] for every body, in one batch
+        """
+        with batch.Batch(self.connection) as b:
+            futures = [(name, [b.add(getattr, body, attribute) for attribute in FINGERPRINT])
+                       for name, body in sorted(bodies.items())]
+
+        return [[name] + [future() for future in values] for name, values in futures]
+
+    @property
+    def system(self):
+        """
+        :return: short digest of the fingerprint, the same for every save with this solar system
+        """
+        return _digest(self.fingerprint)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+
+        try:
+            with open(self.path) as fh:
+                data = json.load(fh)
+        except ValueError:
+            # half-written or hand-mangled, we'll just fetch it all again
+            return {}
+
+        if data.get('version') != VERSION or data.get('fingerprint') != self.fingerprint:
+            # an older file, or another solar system's constants under the same name
+            return {}
+
+        try:
+            return dict((name, BodyConstants(**values)) for name, values in data['bodies'].items())
+        except TypeError:
+            # written with a different set of constants
+            return {}
+
+    def _fetch(self, bodies):
+        with batch.Batch(self.connection) as b:
+            futures = dict((name, [b.add(getattr, body, attribute) for attribute in NAMES[1:]])
+                           for name, body in bodies.items())
+
+        return dict((name, BodyConstants(name, *[future() for future in values]))
+                    for name, values in futures.items())
+
+    def _store(self):
+        data = {'version': VERSION,
+                'fingerprint': self.fingerprint,
+                'bodies': dict((name, constants._asdict()) for name, constants in self.constants.items())}
+
+        # write to a temporary file and move it into place, so another process never reads half of it
+        temporary = '{0}.{1}.tmp'.format(self.path, os.getpid())
+        with open(temporary, 'w') as fh:
+            json.dump(data, fh, indent=1, sort_keys=True)
+        os.replace(temporary, self.path)
+
+    def refresh(self):
+        """
+        Fetch everything from the server again and rewrite the file
+        """
+        self.constants = self._fetch(dict(self.connection.space_center.bodies))
+        self._store()
+
+    def get(self, body):
+        """
+        :param body: krpc CelestialBody, its name, or BodyConstants
+        :return: BodyConstants for that body
+        """
+        if isinstance(body, BodyConstants):
+            return body
+
+        if isinstance(body, str):
+            return self.constants[body]
+
+        name = self.names.get(getattr(body, '_object_id', id(body)))
+        if name is None:
+            # not a body we listed when we started, so it has to cost us a round trip
+            name = body.name
+        return self.constants[name]
+
+    def __getitem__(self, body):
+        return self.get(body)
+
+
+def _digest(fingerprint):
+    return hashlib.sha1(json.dumps(fingerprint).encode('utf-8')).hexdigest()[:12]
+
+
+def system(body):
+    """
+    Tell body's solar system apart from any other, for keying what we keep on disk about it
+
+    :param body: krpc CelestialBody
+    :return: short digest, the catalog's for the body's connection. Offline there's no catalog, so the
+             body's own fingerprint stands in for the system's, unless the connection has a system
+             attribute saying which one it stands in for
+    """
+    connection = batch.clientOf(body)
+    if batch.isRemote(connection):
+        return BodyCatalog.forConnection(connection).system
+    if getattr(connection, 'system', None):
+        return connection.system
+    return _digest([[body.name] + [getattr(body, attribute) for attribute in FINGERPRINT]])
+
+
+def constants(body):
+    """
+    Get the constants for the input body from its connection's catalog
+
+    :param body: krpc CelestialBody, or BodyConstants (which are handed straight back)
+    :return: BodyConstants for that body
+    """
+    if isinstance(body, BodyConstants):
+        return body
+
+    connection = batch.clientOf(body)
+    if not batch.isRemote(connection):
+        # nothing to save over an offline connection, read them straight off the body
+        return BodyConstants(*[getattr(body, attribute) for attribute in NAMES])
+
+    return BodyCatalog.forConnection(connection).get(body)
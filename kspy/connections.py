@@ -0,0 +1,196 @@
+"""
+Separate connections for telemetry, control and everything slow, so a long call can't stall a control loop
+
+Every krpc client sends one RPC at a time, so when streams, control writes and the odd warp_to or
+quicksave all share the connection from utils.defaultConnection, a hover loop's throttle update can sit
+behind a call that takes seconds. A ConnectionBundle keeps one connection per role:
+
+    STREAM   owns every stream, so stream setup and updates arrive on their own connection
+    COMMAND  control and autopilot writes, and the reads control loops can't wait on
+    BULK     anything that takes a while: warp_to, saves, maneuver planning, batches of body constants
+
+    bundle = connections.connect('Mun landing')
+    lander = bundle.rebind(bundle.command.space_center.active_vessel, connections.COMMAND)
+    hover = landing.Hover(bundle.stream, lander)
+    bundle.bulk.space_center.quicksave()
+
+Programs take the stream connection as their connection (so utils.streams puts their streams there)
+and a vessel bound to the command connection (so vessel.control writes, and controls.ControlBuffer
+batches, go there). rebind hands back the same remote object on another role's connection; object
+ids are the server's, so they're good on every connection to it.
+
+The bundle owns its connections and closes them. A krpc client already locks around each RPC, so
+any role can be used from any thread; exclusive holds a role for a sequence of calls that mustn't be
+interleaved with anyone else's. Stream update callbacks are fanned out from the one stream connection
+through subscribe.
+"""
+from __future__ import print_function, absolute_import, division
+
+import contextlib
+import threading
+
+import krpc
+
+from . import batch
+
+STREAM = 'stream'
+COMMAND = 'command'
+BULK = 'bulk'
+ROLES = (STREAM, COMMAND, BULK)
+
+
+class ConnectionBundle(object):
+    """
+    One connection per role, owned and closed together
+    """
+    def __init__(self, stream, command=None, bulk=None):
+        """
+        :param stream: connection for streams
+        :param command: connection for control, defaults to the stream connection
+        :param bulk: connection for slow calls, defaults to the command connection
+        """
+        command = command or stream
+        bulk = bulk or command
+
+        self.connections = {STREAM: stream, COMMAND: command, BULK: bulk}
+        self._locks = dict((role, threading.RLock()) for role in ROLES)
+
+        self._subscribers = []
+        self._subscribersLock = threading.Lock()
+        self._fanningOut = False
+
+    @property
+    def stream(self):
+        return self.connections[STREAM]
+
+    @property
+    def command(self):
+        return self.connections[COMMAND]
+
+    @property
+    def bulk(self):
+        return self.connections[BULK]
+
+    def __getitem__(self, role):
+        if role not in self.connections:
+            raise KeyError("No connection role {0}, roles are {1}".format(role, ', '.join(ROLES)))
+        return self.connections[role]
+
+    def roleOf(self, obj):
+        """
+        :param obj: a remote object, or a connection
+        :return: the first role whose connection owns obj, None if it isn't one of ours
+        """
+        client = batch.clientOf(obj)
+        for role in ROLES:
+            if self.connections[role] is client:
+                return role
+        return None
+
+    def rebind(self, obj, role):
+        """
+        Get the same remote object (a vessel, its control, a body...) on another role's connection
+
+        :param obj: the remote object, from any of the bundle's connections
+        :param role: STREAM, COMMAND or BULK
+        :return: the object on that role's connection
+        """
+        client = self[role]
+        if batch.clientOf(obj) is client:
+            return obj
+
+        objectId = getattr(obj, '_object_id', None)
+        if objectId is not None:
+            return type(obj)(client, objectId)
+
+        # services (space_center, drawing...) have no id, just a type per client
+        for service in vars(client).values():
+            if type(service) is type(obj):
+                return service
+
+        raise TypeError("Can't rebind {0!r} onto the {1} connection".format(obj, role))
+
+    @contextlib.contextmanager
+    def exclusive(self, role):
+        """
+        Hold a role's connection for a sequence of calls nobody else's should interleave with.
+        Only other exclusive holders wait, plain calls go straight through
+
+        :param role: STREAM, COMMAND or BULK
+        :return: context manager giving the connection
+        """
+        with self._locks[role]:
+            yield self[role]
+
+    def subscribe(self, callback):
+        """
+        Have callback called (on the stream connection's update thread) after every stream update
+
+        :param callback: function taking no arguments, keep it quick
+        """
+        with self._subscribersLock:
+            self._subscribers = self._subscribers + [callback]
+            if not self._fanningOut and hasattr(self.stream, 'add_stream_update_callback'):
+                self.stream.add_stream_update_callback(self._fanOut)
+                self._fanningOut = True
+
+    def unsubscribe(self, callback):
+        with self._subscribersLock:
+            self._subscribers = [subscriber for subscriber in self._subscribers if subscriber is not callback]
+
+    def _fanOut(self):
+        # the list is replaced rather than changed, so we can walk it without the lock
+        for callback in self._subscribers:
+            try:
+                callback()
+            except Exception as e:
+                # one broken subscriber mustn't starve the rest of updates
+                print("Stream update callback {0!r} failed: {1!r}".format(callback, e))
+
+    def close(self):
+        """
+        Close every connection the bundle owns, once each
+        """
+        with self._subscribersLock:
+            if self._fanningOut:
+                self.stream.remove_stream_update_callback(self._fanOut)
+                self._fanningOut = False
+            self._subscribers = []
+
+        closed = []
+        for role in ROLES:
+            connection = self.connections[role]
+            if any(connection is other for other in closed):
+                continue
+            closed.append(connection)
+            connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+
+def connect(name, address='127.0.0.1', rpcPort=50000, streamPort=50001, connect=krpc.connect):
+    """
+    Open a ConnectionBundle with a connection of its own for each role
+
+    :param name: shown in KSP, suffixed with each connection's role
+    :param address: the kRPC server's address
+    :param rpcPort: its RPC port
+    :param streamPort: its stream port
+    :param connect: function making a connection, taking krpc.connect's arguments
+    :return: the ConnectionBundle
+    """
+    opened = []
+    try:
+        for role in ROLES:
+            opened.append(connect(name='{0} ({1})'.format(name, role), address=address,
+                                  rpc_port=rpcPort, stream_port=streamPort))
+    except Exception:
+        for connection in opened:
+            connection.close()
+        raise
+
+    return ConnectionBundle(*opened)
@@ -0,0 +1,231 @@
+"""
+Write-behind control inputs, so a tick only sends the controls that actually moved
+
+Control loops set the throttle, steering or autopilot direction every tick whether or not the value
+has changed, and every one of those sets is its own round trip. A ControlBuffer remembers the last
+value it sent for each channel, drops writes that are within that channel's epsilon of it, and sends
+whatever is left in one batched request when it's flushed.
+
+    controls = controls.ControlBuffer(vessel)
+    controls.control.throttle = 0.5
+    controls.autoPilot.target_direction = (0, 1, 0)
+    controls.flush()
+
+The buffer only knows what it sent itself. Anything that writes the same channels around it (like
+a program setting the throttle directly) should either go through the buffer too, or invalidate it.
+"""
+from __future__ import print_function, absolute_import, division
+
+import math
+import types
+
+import numpy as np
+
+from . import batch
+
+# how far a value can move before it's worth sending again, channels not listed here have to change exactly
+EPSILONS = {'throttle': 1e-3,
+            'wheel_throttle': 1e-3,
+            'wheel_steering': 1e-3,
+            'pitch': 1e-3,
+            'yaw': 1e-3,
+            'roll': 1e-3,
+            'up': 1e-3,
+            'right': 1e-3,
+            'forward': 1e-3,
+            'target_direction': 1e-4,
+            'target_pitch': 0.01,
+            'target_heading': 0.01,
+            'target_roll': 0.01}
+
+# (class, attribute) -> (service, procedure, parameter names, parameter types) for property setters
+_setters = {}
+
+
+class _Recorder(object):
+    """
+    Stands in for a remote object (and its client) so calling a property setter on it records the
+    procedure call the setter would have made instead of making it
+    """
+    def __init__(self, client):
+        self._client = self
+        self._types = client._types
+        self.recorded = None
+
+    def _invoke(self, service, procedure, args, names, paramTypes, returnType):
+        self.recorded = (service, procedure, names, paramTypes)
+
+    def record(self, fset):
+        """
+        Call a property setter against the recorder
+
+        krpc's pregenerated service stubs go through self._client._invoke, so they find us on their own.
+        Services generated at connection time call an invoke bound to the real client when the class was
+        made, so we call a copy of the setter with ours in its place.
+
+        :param fset: the property's setter
+        :return: (service, procedure, parameter names, parameter types) of the call it would have made
+        """
+        if fset.__closure__:
+            # deprecated setters are wrapped to warn first, the one that invokes is inside
+            inner = [cell.cell_contents for cell in fset.__closure__
+                     if isinstance(cell.cell_contents, types.FunctionType)]
+            if inner:
+                return self.record(inner[0])
+
+        if 'invoke' in fset.__globals__:
+            fset = types.FunctionType(fset.__code__, dict(fset.__globals__, invoke=self._invoke),
+                                      fset.__name__, fset.__defaults__)
+        fset(self, None)
+        return self.recorded
+
+
+def _setter(obj, attribute):
+    """
+    Find the procedure behind a remote property's setter, since krpc won't build a call for a setter itself
+    """
+    key = (type(obj), attribute)
+    if key not in _setters:
+        fset = getattr(type(obj), attribute).fset
+        if fset is None:
+            raise AttributeError("{0}.{1} can't be set".format(type(obj).__name__, attribute))
+
+        recorded = _Recorder(obj._client).record(fset)
+        if recorded is None:
+            raise AttributeError("Couldn't tell which procedure sets {0}.{1}".format(type(obj).__name__, attribute))
+        _setters[key] = recorded
+
+    return _setters[key]
+
+
+def setterCall(obj, attribute, value):
+    """
+    :param obj: remote object, like a vessel's Control or AutoPilot
+    :param attribute: name of the property to set
+    :param value: what to set it to
+    :return: KRPC.ProcedureCall setting the property, for batch.Batch.addCall
+    """
+    service, procedure, names, types = _setter(obj, attribute)
+    return obj._client._build_call(service, procedure, [obj, value], names, types, None)
+
+
+def _changed(old, new, epsilon):
+    if isinstance(new, (list, tuple)):
+        if not isinstance(old, (list, tuple)) or len(old) != len(new):
+            return True
+        return any(_changed(a, b, epsilon) for a, b in zip(old, new))
+
+    if isinstance(new, float) or isinstance(old, float):
+        if isinstance(old, bool) or isinstance(new, bool):
+            return old != new
+        if math.isnan(old) or math.isnan(new):
+            return math.isnan(old) != math.isnan(new)
+        return abs(new - old) > epsilon
+
+    return old != new
+
+
+class Channels(object):
+    """
+    Stands in for a Control or AutoPilot, sending property sets through a ControlBuffer and
+    passing everything else through to the real object
+    """
+    def __init__(self, buffer, target):
+        object.__setattr__(self, '_buffer', buffer)
+        object.__setattr__(self, '_target', target)
+
+    def __setattr__(self, attribute, value):
+        self._buffer.set(self._target, attribute, value)
+
+    def __getattr__(self, attribute):
+        return getattr(self._target, attribute)
+
+
+class ControlBuffer(object):
+    """
+    Coalesces control and autopilot writes, sending only the changed ones, all at once
+    """
+    def __init__(self, vessel, epsilons=None):
+        """
+        :param vessel: the vessel whose control and autopilot we're writing to
+        :param epsilons: {attribute: epsilon} to use in place of (or as well as) EPSILONS
+        """
+        self.vessel = vessel
+        self.connection = batch.clientOf(vessel)
+
+        self.epsilons = dict(EPSILONS)
+        self.epsilons.update(epsilons or {})
+
+        self.control = Channels(self, vessel.control)
+        self.autoPilot = Channels(self, vessel.auto_pilot)
+
+        # (object id, attribute) -> value, for what we last sent and what's waiting to go
+        self.sent = {}
+        self.dirty = {}
+
+        # how many writes we've been asked for and how many actually went out
+        self.writes = 0
+        self.sends = 0
+        self.flushes = 0
+
+    def set(self, obj, attribute, value):
+        """
+        Queue a property write, if it's far enough from what we last sent
+
+        :param obj: remote object, like vessel.control
+        :param attribute: the property to set
+        :param value: what to set it to
+        """
+        self.writes += 1
+
+        key = (getattr(obj, '_object_id', id(obj)), attribute)
+        if isinstance(value, (list, np.ndarray)):
+            value = tuple(float(x) for x in value)
+
+        if key in self.sent and not _changed(self.sent[key], value, self.epsilons.get(attribute, 0.0)):
+            # nothing worth sending, and forget anything queued since it'd just put this value back
+            self.dirty.pop(key, None)
+            return
+
+        self.dirty[key] = (obj, attribute, value)
+
+    def flush(self):
+        """
+        Send every queued write in one request
+
+        :return: how many writes went out
+        """
+        if not self.dirty:
+            return 0
+
+        pending = list(self.dirty.items())
+        self.dirty.clear()
+
+        if batch.isRemote(self.connection):
+            with batch.Batch(self.connection) as b:
+                futures = [b.addCall(setterCall(obj, attribute, value)) for _, (obj, attribute, value) in pending]
+            for future in futures:
+                future()
+        else:
+            for _, (obj, attribute, value) in pending:
+                setattr(obj, attribute, value)
+
+        for key, (_, _, value) in pending:
+            self.sent[key] = value
+
+        self.sends += len(pending)
+        self.flushes += 1
+        return len(pending)
+
+    def invalidate(self, attribute=None):
+        """
+        Forget what we've sent, so the next write goes out whatever it is.
+        For when something else may have written to the vessel's controls
+
+        :param attribute: only forget this property, defaults to all of them
+        """
+        if attribute is None:
+            self.sent.clear()
+        else:
+            for key in [key for key in self.sent if key[1] == attribute]:
+                del self.sent[key]
@@ -5,7 +5,9 @@ import time
 
 from .maths import Vector3
 from . import maths
+from . import controls
 from . import drawing
+from . import frames
 from .pid import PID
 
 
@@ -71,14 +73,16 @@ def orbitalTraverseToPoint(connection, vessel, targetPoint, targetReferenceFrame
     :param targetReferenceFrame:
     :return:
     """
-    def getReferenceFrame(connection, vessel, targetPoint, targetReferenceFrame):
-        return connection.space_center.ReferenceFrame.create_relative(targetReferenceFrame, position=targetPoint, rotation=vessel.rotation(targetReferenceFrame))
-
+    # the frame follows our rotation every tick, so keep it on our side instead of making a new one on the server
+    frame = frames.OffsetFrame(targetReferenceFrame, targetPoint, vessel.rotation(targetReferenceFrame))
 
     ap = vessel.auto_pilot
 
+    # RCS inputs and pointing only go to the server when they've moved
+    buffer = controls.ControlBuffer(vessel)
+
     # Setup Auto Pilot
-    ap.reference_frame = getReferenceFrame(connection, vessel, targetPoint, targetReferenceFrame)
+    ap.reference_frame = frame.frame
     ap.target_direction = getDirectionBetweenPoints(vessel, targetPoint, targetReferenceFrame)
     ap.target_roll = 90
     ap.engage()
@@ -95,13 +99,13 @@ def orbitalTraverseToPoint(connection, vessel, targetPoint, targetReferenceFrame
         connection.drawing.clear()
 
         # always keep us pointed at our target
-        rf = getReferenceFrame(connection, vessel, targetPoint, targetReferenceFrame)
-        ap.reference_frame = targetReferenceFrame
-        ap.target_direction = getDirectionBetweenPoints(vessel, targetPoint, targetReferenceFrame)
+        frame.update(rotation=vessel.rotation(targetReferenceFrame))
+        buffer.autoPilot.reference_frame = targetReferenceFrame
+        buffer.autoPilot.target_direction = getDirectionBetweenPoints(vessel, targetPoint, targetReferenceFrame)
 
-        offset = getOffsetBetweenPoints(vessel.position(rf), targetPoint)
+        offset = getOffsetBetweenPoints(frame.positionToLocal(vessel.position(targetReferenceFrame)), targetPoint)
         offset = Vector3._make(offset)
-        velocity = Vector3._make(vessel.flight(rf).velocity)
+        velocity = Vector3._make(frame.velocityToLocal(vessel.velocity(targetReferenceFrame)))
         setpoints = getSetPoints(offset, 1.0)
 
         print(offset)
@@ -114,21 +118,22 @@ def orbitalTraverseToPoint(connection, vessel, targetPoint, targetReferenceFrame
         rightMag = rightPID.update(velocity.right) * 20.0
         forwardMag = forwardPID.update(velocity.forward) * 40.0
 
-        upDir = (0,0,1)
-        rightDir = (1,0,0)
-        fowardDir = (0,1,0)
-        connection.drawing.add_direction(fowardDir, rf, length=forwardMag)
-        connection.drawing.add_direction(rightDir, rf, length=rightMag)
-        connection.drawing.add_direction(upDir, rf, length=upMag)
+        upDir = tuple(frame.directionToParent((0, 0, 1)))
+        rightDir = tuple(frame.directionToParent((1, 0, 0)))
+        fowardDir = tuple(frame.directionToParent((0, 1, 0)))
+        connection.drawing.add_direction(fowardDir, targetReferenceFrame, length=forwardMag)
+        connection.drawing.add_direction(rightDir, targetReferenceFrame, length=rightMag)
+        connection.drawing.add_direction(upDir, targetReferenceFrame, length=upMag)
 
         # right-control still isn't working quite right. Maybe verify that "right" actually means right.
         # it looks like when printing the vectors that right and up creep up but forward decreases.
         # we ideally want to travel a straight line relative to the target vessel
         # which necessarily means we'll be traversing up and right to counteract orbital motion
 
-        vessel.control.up = upPID.update(velocity.up)  # steer vessel
-        vessel.control.right = -rightPID.update(velocity.right)
-        vessel.control.forward = forwardPID.update(velocity.forward)
+        buffer.control.up = upPID.update(velocity.up)  # steer vessel
+        buffer.control.right = -rightPID.update(velocity.right)
+        buffer.control.forward = forwardPID.update(velocity.forward)
+        buffer.flush()
 
         drawing.draw_cube(connection, targetPoint, 5, targetReferenceFrame)
 
@@ -0,0 +1,262 @@
+"""
+Cooperative execution of several programs at once, each at its own rate
+
+An Executor hosts any number of programs (utils.Program objects, or plain callables like
+utils.AutoStage) and ticks each one at its own rate off the monotonic clock. Whenever some programs come
+due together they run in priority order against one shared TelemetryFrame, so a safety check ticking
+at 50Hz doesn't drag the rest of the launch along with it, and a 1Hz fairing check doesn't cost as
+much as guidance does.
+
+    ex = executor.Executor(connection, vessel)
+    ex.add(utils.Abort(vessel), rate=50, priority=10, background=True, final=True)
+    ex.add(ascend, rate=20, then=circularize)
+    ex.add(utils.Fairing(connection, vessel), rate=1, background=True)
+    ex.run()
+
+Programs finish according to their finishOn: True for programs that return True when they're done
+(Ascend, ExecuteManeuver), False for ones that return False when they're done (Hover, Descend), and
+None for ones that never finish by themselves (AutoStage). A finished program is released and its
+successor, if it has one, takes its place.
+"""
+from __future__ import print_function, absolute_import, division
+
+import time
+
+from . import instrument
+from . import scheduler
+from . import telemetry
+from . import utils
+
+
+class Task(object):
+    """
+    One program hosted by an Executor, with its own scheduler
+    """
+    def __init__(self, program, rate, priority, finishOn, then, background, final, name, clock, sleep):
+        self.program = program
+        self.priority = priority
+        self.finishOn = finishOn
+        self.then = then
+        self.background = background
+        self.final = final
+        self.scheduler = scheduler.Scheduler(rate, name=name, clock=clock, sleep=sleep)
+
+        self.finished = False
+        self.result = None
+
+    @property
+    def name(self):
+        return self.scheduler.name
+
+    def __repr__(self):
+        return 'Task({0}, {1}Hz)'.format(self.name, self.scheduler.rate)
+
+
+class Executor(object):
+    """
+    Ticks several programs at their own rates, sharing one telemetry snapshot per pass
+    """
+    def __init__(self, connection=None, vessel=None, referenceFrame=None, clock=time.monotonic, sleep=time.sleep):
+        """
+        :param connection: krpc.Connection for the shared telemetry, leave out to not share any
+        :param vessel: the vessel the shared telemetry is for
+        :param referenceFrame: reference frame for the telemetry's flight fields, see telemetry.TelemetrySource
+        :param clock: monotonic clock returning seconds
+        :param sleep: function sleeping for a number of seconds
+        """
+        self.connection = connection
+        self.vessel = vessel
+        self.referenceFrame = referenceFrame
+        self.clock = clock
+        self.sleep = sleep
+
+        self.tasks = []
+        self.stopped = False
+        self.finalTask = None
+
+        # every task we've hosted, finished or not, for stats
+        self.history = []
+
+        self.telemetry = None
+        self._fields = set()
+
+    def add(self, program, rate=None, priority=0, finishOn=True, then=None, background=False, final=False,
+            name=None):
+        """
+        Start hosting a program
+
+        :param program: utils.Program, or any callable taking no arguments
+        :param rate: ticks per second, defaults to the program's declared rate
+        :param priority: programs due at the same time run highest priority first
+        :param finishOn: what the program returns once it's done (True or False), None if it never finishes
+        :param then: successor to start once this one finishes. Either a utils.Program, or a function taking
+                     the finished Task and returning the program to start (or None for no successor)
+        :param background: don't keep the executor running just for this program
+        :param final: stop the whole executor once this program finishes, e.g. for aborts
+        :param name: for display, defaults to the program's prettyName or class name
+
+        :return: the Task hosting the program
+        """
+        if rate is None:
+            rate = getattr(program, 'rate', utils.Program.rate)
+        if name is None:
+            name = getattr(program, 'prettyName', type(program).__name__)
+
+        task = Task(program, rate, priority, finishOn, then, background, final, name, self.clock, self.sleep)
+        self.tasks.append(task)
+        self.history.append(task)
+        self._updateTelemetry()
+        return task
+
+    def remove(self, task):
+        """
+        Stop hosting the input task, without releasing its program or starting its successor
+        """
+        if task in self.tasks:
+            self.tasks.remove(task)
+
+    def stop(self):
+        """
+        Have run return after the current pass
+        """
+        self.stopped = True
+
+    def _updateTelemetry(self):
+        """
+        Make sure the shared telemetry covers every field the hosted programs read
+        """
+        if self.connection is None or self.vessel is None:
+            return
+
+        fields = telemetry.fieldsFor(*[task.program for task in self.tasks])
+        if fields <= self._fields:
+            return
+
+        fields |= self._fields
+        if self.telemetry is not None:
+            self.telemetry.release()
+        self.telemetry = telemetry.TelemetrySource(self.connection, self.vessel, fields, self.referenceFrame)
+        self._fields = fields
+
+    def _finish(self, task):
+        task.finished = True
+        self.remove(task)
+
+        if hasattr(task.program, 'release'):
+            task.program.release()
+
+        if task.final:
+            self.finalTask = task
+            self.stop()
+            return
+
+        successor = task.then
+        if successor is not None and not isinstance(successor, utils.Program):
+            successor = successor(task)
+
+        if successor is not None:
+            self.add(successor, priority=task.priority, background=task.background)
+
+    def step(self):
+        """
+        Run every task that's due, in priority order, against one telemetry snapshot
+
+        :return: the tasks that ran
+        """
+        now = self.clock()
+        due = [task for task in self.tasks if task.scheduler.due(now)]
+        if not due:
+            return []
+
+        due.sort(key=lambda task: -task.priority)
+
+        frame = None
+        if self.telemetry is not None and any(_readsTelemetry(task.program) for task in due):
+            with instrument.ticking('telemetry'):
+                frame = self.telemetry()
+
+        for task in due:
+            if task.finished:
+                continue
+
+            start = self.clock()
+            with instrument.ticking(task.name):
+                if _readsTelemetry(task.program):
+                    task.result = task.program(frame)
+                else:
+                    task.result = task.program()
+            task.scheduler.record(start, self.clock())
+
+            if task.finishOn is not None and bool(task.result) == task.finishOn:
+                self._finish(task)
+                if self.stopped:
+                    break
+
+        return due
+
+    def nextDeadline(self):
+        """
+        :return: clock time the next task comes due, None if nothing is hosted
+        """
+        deadlines = [task.scheduler.deadline for task in self.tasks]
+        if not deadlines:
+            return None
+        if None in deadlines:
+            return self.clock()
+        return min(deadlines)
+
+    def running(self):
+        """
+        :return: True while there's a foreground task left and nothing has stopped us
+        """
+        return not self.stopped and any(not task.background for task in self.tasks)
+
+    def run(self):
+        """
+        Tick every hosted program until the foreground ones have all finished, or a final one has
+
+        :return: the final Task that stopped the run, None if everything finished normally
+        """
+        self.stopped = False
+        self.finalTask = None
+
+        try:
+            while self.running():
+                deadline = self.nextDeadline()
+                remaining = deadline - self.clock()
+                if remaining > 0:
+                    self.sleep(remaining)
+
+                self.step()
+        finally:
+            self.release()
+
+        return self.finalTask
+
+    def release(self):
+        """
+        Release every program still hosted and the shared telemetry
+        """
+        for task in list(self.tasks):
+            if hasattr(task.program, 'release'):
+                task.program.release()
+        del self.tasks[:]
+
+        if self.telemetry is not None:
+            self.telemetry.release()
+            self.telemetry = None
+            self._fields = set()
+
+    def stats(self):
+        """
+        :return: list of scheduler.Scheduler stats dictionaries, one per task we've hosted
+        """
+        return [task.scheduler.stats() for task in self.history]
+
+
+def _readsTelemetry(program):
+    """
+    :return: True if program's __call__ takes a TelemetryFrame, which programs say by declaring the fields
+             they read (plenty of utils.Programs read nothing and take no arguments)
+    """
+    return bool(getattr(program, 'telemetryFields', None))
@@ -0,0 +1,334 @@
+"""
+Append-only binary flight logs with a UT index, read back through memory maps
+
+A flight log is what recorder.Recorder writes when it's given a FlightLogWriter: typed columns of
+telemetry, one chunk at a time, ready to be pulled back out by UT without parsing the whole file.
+
+    writer = flightlog.FlightLogWriter(flightlog.logPath('Mun landing'), metadata={'vessel': 'Lander'})
+    rec = recorder.Recorder(connection, channels, interval=0.1, writer=writer)
+    ...
+    with flightlog.FlightLog(flightlog.logPath('Mun landing')) as log:
+        altitude = log.read('alt', 1200.0, 1260.0)
+
+File layout (little endian, everything 8 byte aligned):
+
+    header   magic, version, JSON length, then JSON {'channels': [[name, dtype, shape], ...], 'metadata': {...}}
+    chunks   magic, sample count, first UT, last UT, then each channel's samples as one contiguous column
+    index    magic, chunk count, then (first UT, last UT, offset, count) per chunk
+    trailer  index offset, end magic
+
+The first channel is always 'ut'. Chunks are only ever appended and the index and trailer are written
+on close, so a log whose writer died still has all of its complete chunks: the reader notices the
+missing trailer and rebuilds the index by hopping from chunk header to chunk header.
+"""
+from __future__ import print_function, absolute_import, division
+
+import bisect
+import collections
+import json
+import mmap
+import struct
+
+import numpy as np
+
+from . import utils
+
+MAGIC = b'KSPYFLOG'
+VERSION = 1
+HEADER = struct.Struct('<8sII')
+CHUNK_MAGIC = b'CHNK'
+CHUNK = struct.Struct('<4sIdd')
+INDEX_MAGIC = b'INDX'
+INDEX = struct.Struct('<4sI')
+ENTRY = np.dtype([('first', '<f8'), ('last', '<f8'), ('offset', '<u8'), ('count', '<u8')])
+TRAILER_MAGIC = b'KSPYFEND'
+TRAILER = struct.Struct('<Q8s')
+ALIGNMENT = 8
+
+
+class FlightLogError(Exception):
+    pass
+
+
+def logPath(name):
+    """
+    :param name: what to call the log, a mission name say
+    :return: where that log lives in kspy's data directory
+    """
+    return utils.dataPath('flightlogs', name + '.flightlog')
+
+
+def _padding(size):
+    return -size % ALIGNMENT
+
+
+def _decodeChannels(channels):
+    return collections.OrderedDict((name, np.dtype((np.dtype(dtype), tuple(shape))) if shape else np.dtype(dtype))
+                                   for name, dtype, shape in channels)
+
+
+class FlightLogWriter(object):
+    """
+    Appends chunks of columns to a new flight log, usable as a recorder.Recorder writer
+    """
+    def __init__(self, path, metadata=None):
+        """
+        :param path: the file to write, replaced if it exists
+        :param metadata: anything JSON serializable to keep alongside the telemetry
+        """
+        self.path = path
+        self.metadata = metadata or {}
+        self.fh = None
+        self.channels = None
+        self.entries = []
+
+    def open(self, columns):
+        """
+        :param columns: ordered {name: numpy dtype} of everything we'll be given, starting with 'ut'
+        """
+        columns = collections.OrderedDict(columns)
+        if not columns or list(columns)[0] != 'ut':
+            raise FlightLogError("A flight log's first channel has to be 'ut'")
+
+        self.channels = collections.OrderedDict((name, np.dtype(dtype).newbyteorder('<'))
+                                                for name, dtype in columns.items())
+        header = json.dumps({'channels': [[name, dtype.base.str, list(dtype.shape)]
+                                          for name, dtype in self.channels.items()],
+                             'metadata': self.metadata}).encode('utf-8')
+        header += b' ' * _padding(HEADER.size + len(header))
+
+        self.fh = open(self.path, 'wb')
+        self.fh.write(HEADER.pack(MAGIC, VERSION, len(header)))
+        self.fh.write(header)
+        self.fh.flush()
+
+    def write(self, columns):
+        """
+        Append one chunk
+
+        :param columns: ordered {name: array} with every channel, all the same length, in UT order
+        """
+        ut = columns['ut']
+        count = len(ut)
+        if not count:
+            return
+
+        offset = self.fh.tell()
+        self.fh.write(CHUNK.pack(CHUNK_MAGIC, count, ut[0], ut[-1]))
+        for name, dtype in self.channels.items():
+            data = np.ascontiguousarray(columns[name], dtype=dtype.base)
+            if data.shape != (count,) + dtype.shape:
+                raise FlightLogError("Channel {0} should have shape {1}, got {2}".format(
+                    name, (count,) + dtype.shape, data.shape))
+            data = data.tobytes()
+            self.fh.write(data)
+            self.fh.write(b'\0' * _padding(len(data)))
+        self.fh.flush()
+
+        self.entries.append((ut[0], ut[-1], offset, count))
+
+    def close(self):
+        """
+        Write the index and trailer, after which the log is complete
+        """
+        if self.fh is None:
+            return
+
+        offset = self.fh.tell()
+        self.fh.write(INDEX.pack(INDEX_MAGIC, len(self.entries)))
+        self.fh.write(np.array(self.entries, dtype=ENTRY).tobytes())
+        self.fh.write(TRAILER.pack(offset, TRAILER_MAGIC))
+        self.fh.close()
+        self.fh = None
+
+
+class FlightLog(object):
+    """
+    A memory-mapped flight log, read by UT range. Reading within one chunk hands back views straight
+    onto the file, spanning several chunks costs one copy of just the samples asked for
+    """
+    def __init__(self, path):
+        """
+        :param path: the flight log to open
+        """
+        self.path = path
+        self._fh = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._fh.close()
+            raise FlightLogError("{0} is empty".format(path))
+
+        if len(self._map) < HEADER.size:
+            self.close()
+            raise FlightLogError("{0} is not a kspy flight log".format(path))
+
+        magic, version, length = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise FlightLogError("{0} is not a kspy flight log".format(path))
+        if version != VERSION:
+            self.close()
+            raise FlightLogError("{0} is flight log version {1}, we only read {2}".format(path, version, VERSION))
+
+        header = json.loads(self._map[HEADER.size:HEADER.size + length].decode('utf-8'))
+        self.channels = _decodeChannels(header['channels'])
+        self.metadata = header['metadata']
+        self._dataStart = HEADER.size + length
+
+        self.complete = True
+        index = self._readIndex()
+        if index is None:
+            self.complete = False
+            index = self._scan()
+
+        self.first = index['first']
+        self.last = index['last']
+        self.offsets = index['offset']
+        self.counts = index['count']
+        self._lastUTs = self.last.tolist()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Let go of the file. Views handed out by read and chunk stay valid, the mapping goes away once
+        the last of them does
+        """
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # somebody still holds a view onto it
+                pass
+            self._map = None
+        self._fh.close()
+
+    def _chunkSize(self, count):
+        return CHUNK.size + sum(count * dtype.itemsize + _padding(count * dtype.itemsize)
+                                for dtype in self.channels.values())
+
+    def _readIndex(self):
+        size = len(self._map)
+        if size < self._dataStart + TRAILER.size:
+            return None
+
+        offset, magic = TRAILER.unpack_from(self._map, size - TRAILER.size)
+        if magic != TRAILER_MAGIC or offset + INDEX.size > size:
+            return None
+
+        magic, count = INDEX.unpack_from(self._map, offset)
+        if magic != INDEX_MAGIC:
+            return None
+
+        return np.frombuffer(self._map, dtype=ENTRY, count=count, offset=offset + INDEX.size).copy()
+
+    def _scan(self):
+        """
+        Rebuild the index of a log that was never closed, ignoring any chunk that was cut short
+        """
+        entries = []
+        offset = self._dataStart
+        size = len(self._map)
+        while offset + CHUNK.size <= size:
+            magic, count, first, last = CHUNK.unpack_from(self._map, offset)
+            chunkSize = self._chunkSize(count)
+            if magic != CHUNK_MAGIC or offset + chunkSize > size:
+                break
+            entries.append((first, last, offset, count))
+            offset += chunkSize
+
+        return np.array(entries, dtype=ENTRY)
+
+    def __len__(self):
+        """
+        :return: how many samples there are in the log
+        """
+        return int(self.counts.sum())
+
+    @property
+    def chunks(self):
+        return len(self.offsets)
+
+    def chunk(self, index, names=None):
+        """
+        :param index: which chunk, in UT order
+        :param names: channels to read, defaults to all of them
+        :return: ordered {name: array} of read-only views onto the file
+        """
+        offset = int(self.offsets[index]) + CHUNK.size
+        count = int(self.counts[index])
+
+        result = collections.OrderedDict()
+        for name, dtype in self.channels.items():
+            if names is None or name in names:
+                result[name] = np.frombuffer(self._map, dtype=dtype, count=count, offset=offset)
+            offset += count * dtype.itemsize + _padding(count * dtype.itemsize)
+        return result
+
+    def _span(self, start, end):
+        """
+        :return: [(chunk index, first sample, end sample), ...] covering start <= ut <= end
+        """
+        spans = []
+        index = bisect.bisect_left(self._lastUTs, start)
+        while index < self.chunks and self.first[index] <= end:
+            ut = self.chunk(index, ('ut',))['ut']
+            spans.append((index, int(np.searchsorted(ut, start, 'left')), int(np.searchsorted(ut, end, 'right'))))
+            index += 1
+        return spans
+
+    def read(self, names, start=None, end=None):
+        """
+        Get channels between two UTs, inclusive
+
+        :param names: channel name, or a list of them
+        :param start: UT to start at, defaults to the start of the log
+        :param end: UT to stop at, defaults to the end of the log
+        :return: the array for a single name, or ordered {name: array} for a list. Views onto the
+                 file if the range sits inside one chunk, copies otherwise
+        """
+        single = isinstance(names, str)
+        wanted = [names] if single else list(names)
+        for name in wanted:
+            if name not in self.channels:
+                raise KeyError("No channel {0} in {1}".format(name, self.path))
+
+        start = -np.inf if start is None else start
+        end = np.inf if end is None else end
+
+        pieces = collections.OrderedDict((name, []) for name in wanted)
+        for index, first, last in self._span(start, end):
+            columns = self.chunk(index, wanted)
+            for name in wanted:
+                pieces[name].append(columns[name][first:last])
+
+        result = collections.OrderedDict()
+        for name in wanted:
+            parts = pieces[name]
+            if len(parts) == 1:
+                result[name] = parts[0]
+            elif parts:
+                result[name] = np.concatenate(parts)
+            else:
+                result[name] = np.zeros((0,) + self.channels[name].shape, dtype=self.channels[name].base)
+
+        return result[names] if single else result
+
+    def sampleAt(self, ut):
+        """
+        :return: ordered {name: value} of the last sample taken at or before ut, None if there isn't one
+        """
+        index = bisect.bisect_left(self._lastUTs, ut)
+        if index == self.chunks or self.first[index] > ut:
+            index -= 1
+        if index < 0:
+            return None
+
+        columns = self.chunk(index)
+        position = int(np.searchsorted(columns['ut'], ut, 'right')) - 1
+        return collections.OrderedDict((name, column[position]) for name, column in columns.items())
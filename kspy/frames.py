@@ -0,0 +1,196 @@
+"""
+Shared reference frames, so building the same frame twice doesn't make a second remote object
+
+Every ReferenceFrame.create_relative or create_hybrid call is a round trip, and the server keeps the
+frame it made around for as long as the connection lives, whether or not we ever look at it again. A
+FrameCache hands back the same ReferenceFrame for the same (kind, parent, position, rotation...)
+inputs, with positions and rotations rounded to a resolution so tiny float differences still land on
+the same frame.
+
+    cache = frames.FrameCache.forConnection(connection)
+    surface = cache.hybrid(position=body.reference_frame, rotation=vessel.surface_reference_frame)
+
+Frames whose offset moves every tick (like one that follows the vessel's rotation) shouldn't be made
+on the server at all. An OffsetFrame keeps the offset on our side, and turns positions, directions and
+velocities measured in its parent frame into its own, so updating it costs nothing.
+"""
+from __future__ import print_function, absolute_import, division
+
+import collections
+
+import numpy as np
+
+from . import batch
+from . import maths
+
+IDENTITY = (0.0, 0.0, 0.0, 1.0)
+ZERO = (0.0, 0.0, 0.0)
+
+
+def _objectKey(obj):
+    return getattr(obj, '_object_id', id(obj))
+
+
+def _vectorKey(vector, resolution):
+    if vector is None:
+        return None
+    return tuple(int(round(x / resolution)) for x in vector)
+
+
+class FrameCache(object):
+    """
+    Keyed store of the relative and hybrid reference frames made over one connection
+    """
+    _caches = {}
+
+    def __init__(self, connection, resolution=1e-6, maxFrames=256):
+        """
+        :param connection: krpc.Connection to make the frames over
+        :param resolution: positions, rotations and velocities closer than this share a frame
+        :param maxFrames: how many frames to hold on to, the least recently used go first.
+                          krpc can't delete a frame from the server, so this only bounds our side
+        """
+        self.connection = batch.clientOf(connection)
+        self.resolution = resolution
+        self.maxFrames = maxFrames
+
+        self.frames = collections.OrderedDict()
+        self.created = 0
+        self.hits = 0
+
+    @classmethod
+    def forConnection(cls, connection, **kwargs):
+        """
+        Get the frame cache for the input connection, making it if this is the first time we've asked
+
+        :param connection: krpc.Connection, or any remote object living on it
+        :param kwargs: passed to the constructor if the cache doesn't exist yet
+        :return: the FrameCache for that connection
+        """
+        connection = batch.clientOf(connection)
+        key = id(connection)
+        if key not in cls._caches:
+            cls._caches[key] = cls(connection, **kwargs)
+        return cls._caches[key]
+
+    def _get(self, key, create):
+        frame = self.frames.get(key)
+        if frame is not None:
+            self.frames.move_to_end(key)
+            self.hits += 1
+            return frame
+
+        frame = create()
+        self.created += 1
+        self.frames[key] = frame
+        if len(self.frames) > self.maxFrames:
+            self.frames.popitem(last=False)
+        return frame
+
+    def relative(self, parent, position=ZERO, rotation=IDENTITY, velocity=ZERO, angularVelocity=ZERO):
+        """
+        Same arguments as ReferenceFrame.create_relative
+
+        :return: the shared ReferenceFrame for those arguments
+        """
+        r = self.resolution
+        key = ('relative', _objectKey(parent), _vectorKey(position, r), _vectorKey(rotation, r),
+               _vectorKey(velocity, r), _vectorKey(angularVelocity, r))
+
+        def create():
+            return self.connection.space_center.ReferenceFrame.create_relative(
+                parent, position=tuple(position), rotation=tuple(rotation),
+                velocity=tuple(velocity), angular_velocity=tuple(angularVelocity))
+
+        return self._get(key, create)
+
+    def hybrid(self, position, rotation=None, velocity=None, angularVelocity=None):
+        """
+        Same arguments as ReferenceFrame.create_hybrid, frames that are left out default to position
+
+        :return: the shared ReferenceFrame for those frames
+        """
+        rotation = rotation or position
+        velocity = velocity or position
+        angularVelocity = angularVelocity or position
+
+        key = ('hybrid',) + tuple(_objectKey(frame) for frame in (position, rotation, velocity, angularVelocity))
+
+        def create():
+            return self.connection.space_center.ReferenceFrame.create_hybrid(
+                position, rotation=rotation, velocity=velocity, angular_velocity=angularVelocity)
+
+        return self._get(key, create)
+
+    def clear(self):
+        self.frames.clear()
+
+
+class OffsetFrame(object):
+    """
+    A frame offset and rotated from a parent frame, kept entirely on the client
+
+    Only static offsets are modelled, so velocities come out the same as in a relative frame made
+    with no velocity or angular velocity of its own.
+    """
+    def __init__(self, parent, position=ZERO, rotation=IDENTITY, cache=None):
+        """
+        :param parent: ReferenceFrame we're offset from, which is what to measure things in
+        :param position: our origin, in the parent frame
+        :param rotation: (x, y, z, w) quaternion rotating our axes into the parent's
+        :param cache: FrameCache to make a server-side copy from, if one's ever needed,
+                      defaults to the parent's connection's
+        """
+        self.parent = parent
+        self.cache = cache
+        self.update(position, rotation)
+
+    def update(self, position=None, rotation=None):
+        """
+        Move our origin and/or turn our axes, without going to the server
+        """
+        if position is not None:
+            self.position = np.asarray(position, dtype=float)
+        if rotation is not None:
+            self.rotation = tuple(rotation)
+            self.inverse = maths.conjugateQuaternion(self.rotation)
+
+    def directionToLocal(self, direction):
+        """
+        :param direction: float3 direction, or velocity, in the parent frame
+        :return: the same direction in this frame
+        """
+        return maths.rotateByQuaternion(direction, self.inverse)
+
+    def directionToParent(self, direction):
+        """
+        :param direction: float3 direction, or velocity, in this frame
+        :return: the same direction in the parent frame
+        """
+        return maths.rotateByQuaternion(direction, self.rotation)
+
+    def positionToLocal(self, position):
+        """
+        :param position: float3 position in the parent frame
+        :return: the same position in this frame
+        """
+        return self.directionToLocal(np.asarray(position, dtype=float) - self.position)
+
+    def positionToParent(self, position):
+        """
+        :param position: float3 position in this frame
+        :return: the same position in the parent frame
+        """
+        return self.directionToParent(position) + self.position
+
+    def velocityToLocal(self, velocity):
+        return self.directionToLocal(velocity)
+
+    @property
+    def frame(self):
+        """
+        :return: a server-side ReferenceFrame matching where we are right now, for things like the
+                 autopilot and drawing that need one. Each distinct offset still costs a remote object
+        """
+        cache = self.cache or FrameCache.forConnection(self.parent)
+        return cache.relative(self.parent, position=self.position, rotation=self.rotation)
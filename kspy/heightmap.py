@@ -0,0 +1,252 @@
+"""
+Persistent, memory-mapped heightmaps, one file per celestial body
+
+Terrain doesn't change between sessions, so every surface_height sample we pay a round trip for is
+written into an on-disk grid and reused by later runs. The grid is memory-mapped, so several processes
+flying over the same body share the same pages instead of each loading their own copy.
+
+File layout (little endian):
+
+    header   64 bytes: magic, version, rows, cols, resolution, origin latitude, origin longitude, padding
+    samples  rows x cols float32 heights, row-major from the origin, all zero bits where we haven't
+             sampled yet (a height of exactly zero is stored as -0.0)
+
+Rows run from the south pole to the north pole inclusive; columns start at the origin longitude and
+wrap all the way around, so the grid covers the whole body.
+
+Since unsampled points are all zero bits, a new heightmap is just a header and a truncate: the file
+system hands back zeros for the rest without writing them, so a body's first landing doesn't stop to
+write out the whole grid. Heightmaps are kept per solar system (bodies.system), so a rescaled Kerbin
+never reads the stock one's terrain. Two processes creating the same heightmap can't clobber each
+other's: the file only appears under its name once it's complete, and only the first one to get there
+wins. After that they may both write samples, but only ever the same height for the same point.
+"""
+from __future__ import print_function, absolute_import, division
+
+import math
+import os
+import struct
+
+import numpy as np
+
+from . import batch
+from . import bodies
+from . import utils
+
+MAGIC = b'KSPYHMAP'
+VERSION = 2
+HEADER = struct.Struct('<8sIIIddd')
+HEADER_SIZE = 64
+DTYPE = np.float32
+
+
+class HeightmapError(Exception):
+    pass
+
+
+class HeightmapStore(object):
+    """
+    A memory-mapped grid of terrain heights for one body
+    """
+    _stores = {}
+
+    def __init__(self, path, resolution=0.1):
+        """
+        Open the heightmap at path, creating an empty one if it doesn't exist yet
+
+        :param path: file to keep the heightmap in
+        :param resolution: grid spacing in degrees, only used when creating a new file
+        """
+        self.path = path
+
+        if not os.path.exists(path):
+            create(path, resolution)
+
+        with open(path, 'rb') as fh:
+            header = fh.read(HEADER.size)
+
+        magic, version, rows, cols, resolution, lat0, lon0 = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise HeightmapError("{0} is not a kspy heightmap".format(path))
+        if version != VERSION:
+            raise HeightmapError("{0} is heightmap version {1}, we only read {2}".format(path, version, VERSION))
+
+        self.rows = rows
+        self.cols = cols
+        self.resolution = resolution
+        self.lat0 = lat0
+        self.lon0 = lon0
+
+        # raw samples, see decode
+        self.samples = np.memmap(path, dtype=DTYPE, mode='r+', offset=HEADER_SIZE, shape=(rows, cols))
+
+        self.samplesFetched = 0
+
+    @classmethod
+    def forBody(cls, body, directory=None, resolution=0.1, system=None):
+        """
+        Get the heightmap for the input body, opened once per process
+
+        :param body: krpc CelestialBody (or its name, given the system)
+        :param directory: where heightmaps live, defaults to the heightmaps folder in kspy's data directory
+        :param resolution: grid spacing in degrees for a new heightmap
+        :param system: which solar system the body is in, defaults to bodies.system for it
+        :return: the HeightmapStore for that body
+        """
+        if isinstance(body, str):
+            if system is None:
+                raise ValueError("Looking a heightmap up by body name needs the body's system")
+            name = body
+        else:
+            name = bodies.constants(body).name
+            if system is None:
+                system = bodies.system(body)
+
+        path = cls.pathFor(name, system, directory)
+        if path not in cls._stores:
+            cls._stores[path] = cls(path, resolution)
+        return cls._stores[path]
+
+    @staticmethod
+    def pathFor(name, system, directory=None):
+        """
+        :param name: the body's name
+        :param system: which solar system it's in, see bodies.system
+        :param directory: where heightmaps live, as for forBody
+        :return: absolute path the body's heightmap is kept at, whether or not it exists yet
+        """
+        if directory is None:
+            path = utils.dataPath('heightmaps', system, name + '.heightmap')
+        else:
+            path = os.path.join(directory, system, name + '.heightmap')
+        return os.path.abspath(path)
+
+    def index(self, lat, lon):
+        """
+        :return: (row, col) of the grid point nearest to the input latitude/longitude
+        """
+        row = int(round((max(-90.0, min(90.0, lat)) - self.lat0) / self.resolution))
+        col = int(round((lon - self.lon0) / self.resolution)) % self.cols
+        return min(max(row, 0), self.rows - 1), col
+
+    def position(self, row, col):
+        """
+        :return: (latitude, longitude) of the input grid point
+        """
+        return self.lat0 + row * self.resolution, self.lon0 + (col % self.cols) * self.resolution
+
+    def block(self, row, col, size):
+        """
+        Read a size x size block of samples starting at (row, col), wrapping around in longitude
+
+        :return: float array of heights, NaN for anything we haven't sampled
+        """
+        rows = np.clip(np.arange(row, row + size), 0, self.rows - 1)
+        cols = np.arange(col, col + size) % self.cols
+        return decode(self.samples[np.ix_(rows, cols)])
+
+    def missing(self, row, col, size):
+        """
+        :return: list of (row, col) grid points in the block we haven't sampled yet
+        """
+        values = self.block(row, col, size)
+        return [(min(max(row + i, 0), self.rows - 1), (col + j) % self.cols)
+                for i, j in zip(*np.nonzero(np.isnan(values)))]
+
+    def fill(self, body, points):
+        """
+        Sample every input grid point from the server in one request and write it to disk
+
+        :param body: the krpc CelestialBody this heightmap belongs to
+        :param points: list of (row, col) grid points
+        """
+        points = sorted(set(points))
+        if not points:
+            return
+
+        with batch.Batch(body) as b:
+            futures = [b.add(body.surface_height, *self.position(row, col)) for row, col in points]
+
+        for (row, col), future in zip(points, futures):
+            self.samples[row, col] = encode(future())
+
+        self.samplesFetched += len(points)
+
+    def height(self, lat, lon):
+        """
+        :return: bilinear interpolated height at the input point, NaN if any surrounding sample is missing
+        """
+        y = (max(-90.0, min(90.0, lat)) - self.lat0) / self.resolution
+        x = ((lon - self.lon0) % 360.0) / self.resolution
+        row = min(int(math.floor(y)), self.rows - 2)
+        col = int(math.floor(x))
+        fy = y - row
+        fx = x - col
+
+        values = self.block(row, col, 2)
+        south = values[0, 0] * (1 - fx) + values[0, 1] * fx
+        north = values[1, 0] * (1 - fx) + values[1, 1] * fx
+        return float(south * (1 - fy) + north * fy)
+
+    def coverage(self):
+        """
+        :return: fraction of the grid we have samples for
+        """
+        return float(np.count_nonzero(self.samples.view(np.uint32))) / self.samples.size
+
+    def flush(self):
+        self.samples.flush()
+
+
+def encode(height):
+    """
+    :return: height as it's kept on disk, keeping zero bits free to mean unsampled
+    """
+    return DTYPE(-0.0) if height == 0 else DTYPE(height)
+
+
+def decode(samples):
+    """
+    :param samples: float32 array straight off the disk
+    :return: float64 copy of the heights, NaN where we haven't sampled
+    """
+    samples = np.ascontiguousarray(samples, dtype=DTYPE)
+    heights = samples.astype(np.float64)
+    heights[samples.view(np.uint32) == 0] = np.nan
+    return heights
+
+
+def create(path, resolution=0.1):
+    """
+    Write out an empty whole-body heightmap, sparse where the file system allows
+
+    :param path: file to create
+    :param resolution: grid spacing in degrees, has to divide evenly into 180
+    """
+    if resolution <= 0 or abs(180.0 / resolution - round(180.0 / resolution)) > 1e-9:
+        raise HeightmapError("Heightmap resolution has to divide evenly into 180 degrees")
+
+    rows = int(round(180.0 / resolution)) + 1  # both poles
+    cols = int(round(360.0 / resolution))  # +180 wraps back onto -180
+
+    try:
+        os.makedirs(os.path.dirname(path))
+    except OSError:
+        # it's there already
+        pass
+
+    # make it under a temporary name and link it into place, so another process never sees half a
+    # heightmap, and a link (unlike a rename) fails rather than replacing one someone else already made
+    temporary = '{0}.{1}.tmp'.format(path, os.getpid())
+    try:
+        with open(temporary, 'wb') as fh:
+            fh.write(HEADER.pack(MAGIC, VERSION, rows, cols, resolution, -90.0, -180.0).ljust(HEADER_SIZE, b'\0'))
+            fh.truncate(HEADER_SIZE + rows * cols * np.dtype(DTYPE).itemsize)
+
+        try:
+            os.link(temporary, path)
+        except FileExistsError:
+            # someone made it while we were making ours
+            pass
+    finally:
+        os.remove(temporary)
@@ -0,0 +1,438 @@
+"""
+Opt-in accounting of every RPC a connection makes, per procedure and per program tick
+
+An Instrument slips in between a krpc client and its socket, so every request (plain calls, kspy
+batches, stream setup) is counted on its way out without any changes to the code making it. For each
+procedure it keeps a call count, bytes each way and a latency histogram, and every call is charged to
+whichever program is ticking at the time, so we can see which program is hammering the server.
+
+    inst = instrument.Instrument(connection)
+    with inst:
+        programs.Launch(connection, vessel)
+    print(inst.summary())
+    inst.dump('launch.json')
+
+Schedulers and executors mark their ticks with instrument.ticking, which costs next to nothing when no
+Instrument is installed. Tests can hold a program to a budget:
+
+    inst.assertBudget('Ascend', calls=4, requests=2)
+
+With several connections instrumented at once (a connections.ConnectionBundle, say), each Instrument
+counts every tick but only charges it with the calls made on its own connection.
+
+Stream updates arrive over the separate stream connection and aren't counted here.
+"""
+from __future__ import print_function, absolute_import, division
+
+import collections
+import contextlib
+import json
+import threading
+import time
+
+import numpy as np
+
+from . import batch
+
+# latency histogram bucket edges in seconds, log spaced from 10us to 10s
+EDGES = np.logspace(-5, 1, 61)
+
+# what calls made outside any program's tick get charged to
+UNATTRIBUTED = '<none>'
+
+_installed = []
+_local = threading.local()
+
+
+class BudgetExceeded(AssertionError):
+    """
+    Raised by Instrument.assertBudget when a program's ticks cost more than they're allowed
+    """
+    pass
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def currentProgram():
+    """
+    :return: name of the program ticking on this thread, None outside any tick
+    """
+    stack = _stack()
+    return stack[-1].name if stack else None
+
+
+class _Tick(object):
+    """
+    One program tick in progress, and what it's cost so far on each instrumented connection
+    """
+    def __init__(self, name):
+        self.name = name
+        # Instrument -> [calls, requests, bytes]
+        self.costs = {}
+
+    def cost(self, instrument):
+        """
+        :return: (calls, requests, bytes) the tick has made on instrument's connection
+        """
+        return tuple(self.costs.get(instrument, (0, 0, 0)))
+
+
+@contextlib.contextmanager
+def _tracking(name):
+    tick = _Tick(name)
+    stack = _stack()
+    stack.append(tick)
+    try:
+        yield tick
+    finally:
+        stack.pop()
+        for inst in list(_installed):
+            inst._endTick(tick)
+
+
+@contextlib.contextmanager
+def _notTracking():
+    yield None
+
+
+def ticking(name):
+    """
+    Mark one tick of a program, so the RPCs made inside it are charged to that program
+
+    :param name: the program's name
+    :return: context manager
+    """
+    if not _installed:
+        return _notTracking()
+    return _tracking(name)
+
+
+class LatencyHistogram(object):
+    """
+    Counts of latencies in log-spaced buckets, cheap enough to update on every call
+    """
+    def __init__(self):
+        self.counts = np.zeros(len(EDGES) + 1, dtype=np.int64)
+        self.total = 0.0
+        self.count = 0
+        self.min = np.inf
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[np.searchsorted(EDGES, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p):
+        """
+        :param p: percentile, 0-100
+        :return: upper edge of the bucket the percentile falls in, in seconds
+        """
+        if not self.count:
+            return 0.0
+
+        index = int(np.searchsorted(np.cumsum(self.counts), self.count * p / 100.0))
+        if index >= len(EDGES):
+            return self.max
+        return min(float(EDGES[index]), self.max)
+
+    def toDict(self):
+        return {'count': self.count,
+                'mean': self.mean,
+                'min': self.min if self.count else 0.0,
+                'max': self.max,
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99),
+                'edges': EDGES.tolist(),
+                'counts': self.counts.tolist()}
+
+
+class ProcedureStats(object):
+    """
+    Everything we've seen of one procedure
+    """
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.bytesSent = 0
+        self.bytesReceived = 0
+        self.errors = 0
+        self.latency = LatencyHistogram()
+        self.programs = collections.Counter()
+
+    def toDict(self):
+        return {'name': self.name,
+                'calls': self.calls,
+                'bytesSent': self.bytesSent,
+                'bytesReceived': self.bytesReceived,
+                'errors': self.errors,
+                'latency': self.latency.toDict(),
+                'programs': dict(self.programs)}
+
+
+class ProgramStats(object):
+    """
+    What one program's ticks have cost, tick by tick for the recent ones
+    """
+    def __init__(self, name, historySize):
+        self.name = name
+        self.ticks = 0
+        self.calls = 0
+        self.requests = 0
+        self.bytes = 0
+        self.callsPerTick = collections.deque(maxlen=historySize)
+        self.requestsPerTick = collections.deque(maxlen=historySize)
+
+    def toDict(self):
+        calls = np.array(self.callsPerTick)
+        requests = np.array(self.requestsPerTick)
+        return {'name': self.name,
+                'ticks': self.ticks,
+                'calls': self.calls,
+                'requests': self.requests,
+                'bytes': self.bytes,
+                'meanCallsPerTick': float(calls.mean()) if calls.size else 0.0,
+                'maxCallsPerTick': int(calls.max()) if calls.size else 0,
+                'meanRequestsPerTick': float(requests.mean()) if requests.size else 0.0,
+                'maxRequestsPerTick': int(requests.max()) if requests.size else 0}
+
+
+class _InstrumentedConnection(object):
+    """
+    Wraps a krpc client's RPC connection, timing each request from send to response
+    """
+    def __init__(self, instrument, connection):
+        self.instrument = instrument
+        self.connection = connection
+        self.pending = None
+
+    def send_message(self, message):
+        calls = getattr(message, 'calls', None)
+        if calls is not None:
+            self.pending = ([(call.service + '.' + call.procedure, call.ByteSize()) for call in calls],
+                            time.perf_counter())
+        self.connection.send_message(message)
+
+    def receive_message(self, typ):
+        message = self.connection.receive_message(typ)
+        if self.pending is not None:
+            calls, start = self.pending
+            self.pending = None
+            self.instrument._record(calls, message, time.perf_counter() - start)
+        return message
+
+    def __getattr__(self, attribute):
+        return getattr(self.connection, attribute)
+
+
+class Instrument(object):
+    """
+    Records the RPC traffic on one krpc connection while installed
+    """
+    def __init__(self, connection, historySize=10000, clock=time.time):
+        """
+        :param connection: krpc.Connection to watch, or any remote object living on it
+        :param historySize: how many recent ticks per program to keep call counts for
+        :param clock: for timestamping the dump
+        """
+        self.connection = batch.clientOf(connection)
+        self.historySize = historySize
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.wrapped = None
+        self.reset()
+
+    def reset(self):
+        """
+        Forget everything we've recorded
+        """
+        self.procedures = {}
+        self.programs = {}
+        self.requests = 0
+        self.calls = 0
+        self.bytesSent = 0
+        self.bytesReceived = 0
+        self.started = self.clock()
+
+    def install(self):
+        """
+        Start recording the connection's RPCs
+        """
+        if self.wrapped is not None:
+            return
+
+        self.wrapped = _InstrumentedConnection(self, self.connection._rpc_connection)
+        with self.connection._rpc_connection_lock:
+            self.connection._rpc_connection = self.wrapped
+        _installed.append(self)
+
+    def uninstall(self):
+        """
+        Stop recording and put the connection back how we found it
+        """
+        if self.wrapped is None:
+            return
+
+        with self.connection._rpc_connection_lock:
+            self.connection._rpc_connection = self.wrapped.connection
+        self.wrapped = None
+        _installed.remove(self)
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.uninstall()
+
+    def _record(self, calls, response, latency):
+        stack = _stack()
+        tick = stack[-1] if stack else None
+        program = tick.name if tick is not None else UNATTRIBUTED
+
+        results = list(getattr(response, 'results', []))
+        if len(results) != len(calls):
+            # the whole request failed, so there's nothing per call to match up
+            results = [None] * len(calls)
+
+        # a batch's calls all come back at once, so they share its latency between them
+        share = latency / max(1, len(calls))
+        requestBytes = sum(size for _, size in calls)
+
+        with self.lock:
+            self.requests += 1
+            self.calls += len(calls)
+            self.bytesSent += requestBytes
+            self.bytesReceived += response.ByteSize()
+
+            for (name, size), result in zip(calls, results):
+                stats = self.procedures.get(name)
+                if stats is None:
+                    stats = self.procedures[name] = ProcedureStats(name)
+                stats.calls += 1
+                stats.bytesSent += size
+                if result is not None:
+                    stats.bytesReceived += result.ByteSize()
+                    if result.HasField('error'):
+                        stats.errors += 1
+                stats.latency.add(share)
+                stats.programs[program] += 1
+
+        if tick is not None:
+            # only ever touched by the thread doing the ticking, which is the one making the call
+            cost = tick.costs.setdefault(self, [0, 0, 0])
+            cost[0] += len(calls)
+            cost[1] += 1
+            cost[2] += requestBytes + response.ByteSize()
+
+    def _endTick(self, tick):
+        calls, requests, size = tick.cost(self)
+        with self.lock:
+            stats = self.programs.get(tick.name)
+            if stats is None:
+                stats = self.programs[tick.name] = ProgramStats(tick.name, self.historySize)
+            stats.ticks += 1
+            stats.calls += calls
+            stats.requests += requests
+            stats.bytes += size
+            stats.callsPerTick.append(calls)
+            stats.requestsPerTick.append(requests)
+
+    def program(self, name):
+        """
+        :return: ProgramStats for the program, None if it hasn't ticked while we were installed
+        """
+        return self.programs.get(name)
+
+    def assertBudget(self, name, calls=None, requests=None, mean=False):
+        """
+        Check that none of a program's ticks made more calls or requests than it's allowed
+
+        :param name: the program's name, as it ticks under
+        :param calls: most procedure calls a tick can make, None to not check
+        :param requests: most round trips a tick can make, None to not check
+        :param mean: check the mean over the recent ticks rather than the worst one
+        :raises BudgetExceeded: if the program went over either budget, or never ticked
+        """
+        stats = self.program(name)
+        if stats is None or not stats.ticks:
+            raise BudgetExceeded("{0} never ticked".format(name))
+
+        summary = stats.toDict()
+        key = 'mean{0}PerTick' if mean else 'max{0}PerTick'
+        for label, budget in (('Calls', calls), ('Requests', requests)):
+            if budget is None:
+                continue
+            spent = summary[key.format(label)]
+            if spent > budget:
+                raise BudgetExceeded("{0} made {1} {2} in a tick{3}, its budget is {4}".format(
+                    name, spent, label.lower(), ' on average' if mean else '', budget))
+
+    def toDict(self):
+        """
+        :return: everything we've recorded, as plain JSON-able types
+        """
+        with self.lock:
+            return {'started': self.started,
+                    'duration': self.clock() - self.started,
+                    'requests': self.requests,
+                    'calls': self.calls,
+                    'bytesSent': self.bytesSent,
+                    'bytesReceived': self.bytesReceived,
+                    'procedures': [stats.toDict() for stats in
+                                   sorted(self.procedures.values(), key=lambda s: -s.calls)],
+                    'programs': [stats.toDict() for stats in
+                                 sorted(self.programs.values(), key=lambda s: -s.calls)]}
+
+    def dump(self, path):
+        """
+        Write everything we've recorded out as JSON
+
+        :param path: file to write to
+        """
+        with open(path, 'w') as fh:
+            json.dump(self.toDict(), fh, indent=1)
+
+    def summary(self, limit=20):
+        """
+        :param limit: how many of the busiest procedures to list
+        :return: a table of the busiest procedures and what each program's ticks cost, for printing
+        """
+        data = self.toDict()
+
+        lines = ["{requests} requests, {calls} calls, {bytesSent} bytes sent, {bytesReceived} bytes received "
+                 "in {duration:.1f}s".format(**data),
+                 "",
+                 "{0:<48} {1:>8} {2:>10} {3:>10} {4:>9} {5:>9} {6:>9}  {7}".format(
+                     'procedure', 'calls', 'sent', 'received', 'mean ms', 'p99 ms', 'max ms', 'busiest program')]
+
+        for procedure in data['procedures'][:limit]:
+            latency = procedure['latency']
+            programs = procedure['programs']
+            busiest = max(programs, key=programs.get) if programs else ''
+            lines.append("{0:<48} {1:>8} {2:>10} {3:>10} {4:>9.3f} {5:>9.3f} {6:>9.3f}  {7}".format(
+                procedure['name'], procedure['calls'], procedure['bytesSent'], procedure['bytesReceived'],
+                latency['mean'] * 1000, latency['p99'] * 1000, latency['max'] * 1000, busiest))
+
+        if data['programs']:
+            lines += ["",
+                      "{0:<32} {1:>8} {2:>10} {3:>12} {4:>12} {5:>14}".format(
+                          'program', 'ticks', 'calls', 'calls/tick', 'max/tick', 'requests/tick')]
+            for program in data['programs']:
+                lines.append("{0:<32} {1:>8} {2:>10} {3:>12.1f} {4:>12} {5:>14.1f}".format(
+                    program['name'], program['ticks'], program['calls'], program['meanCallsPerTick'],
+                    program['maxCallsPerTick'], program['meanRequestsPerTick']))
+
+        return "\n".join(lines)
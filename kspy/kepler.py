@@ -0,0 +1,223 @@
+"""
+Batch solvers for Kepler's equation and the anomaly conversions built on it
+
+Everything here takes scalars or NumPy arrays. Arrays of anomalies and arrays of eccentricities
+broadcast against each other, so a whole grid of epochs across a whole set of orbits gets solved in
+one call. Plain float inputs skip NumPy entirely and take a scalar fast path, which is several times
+quicker for one-off calls than going through zero-dimensional arrays.
+
+Elliptic orbits (e < 1) use the eccentric anomaly E, with M = E - e sin E.
+Hyperbolic orbits (e > 1) use the hyperbolic anomaly H, with M = e sinh H - H.
+"""
+from __future__ import print_function, absolute_import, division
+
+import math
+
+import numpy as np
+
+TOLERANCE = 1e-12
+MAX_ITERATIONS = 50
+
+
+def _isScalar(*values):
+    return all(isinstance(value, (int, float)) for value in values)
+
+
+def _ellipticGuess(M, e):
+    # M + e sin M is good for most orbits, +-pi is safer for very eccentric ones
+    return np.where(e > 0.8, np.copysign(np.pi, M), M + e * np.sin(M))
+
+
+def _ellipticStep(E, m, e):
+    return (E - e * np.sin(E) - m) / (1.0 - e * np.cos(E))
+
+
+def _hyperbolicStep(H, M, e):
+    return (e * np.sinh(H) - H - M) / (e * np.cosh(H) - 1.0)
+
+
+def _newton(x, step, params, tolerance, maxIterations):
+    """
+    Run Newton-Raphson over a whole array, dropping each element out of the iteration once it's
+    converged, so a handful of slow, very eccentric orbits don't cost a full pass over everything
+
+    :param x: initial guesses
+    :param step: function of (x, *params) returning the Newton step
+    :param params: arrays the same shape as x, passed on to step
+    :return: the solved array, the same shape as x
+    """
+    shape = x.shape
+    x = x.ravel().copy()
+    params = [param.ravel() for param in params]
+    active = np.arange(x.size)
+
+    for _ in range(maxIterations):
+        xi = x[active]
+        delta = step(xi, *params)
+        x[active] = xi - delta
+
+        unconverged = np.abs(delta) >= tolerance
+        if not unconverged.any():
+            break
+        active = active[unconverged]
+        params = [param[unconverged] for param in params]
+
+    return x.reshape(shape)
+
+
+def eccentricFromMean(M, e, tolerance=TOLERANCE, maxIterations=MAX_ITERATIONS):
+    """
+    Solve M = E - e sin E for E with Newton-Raphson
+
+    :param M: mean anomaly in radians, any real value
+    :param e: eccentricity, 0 <= e < 1
+    :param tolerance: stop once every Newton step is smaller than this
+    :param maxIterations: and stop after this many steps regardless
+
+    :return: eccentric anomaly in radians, on the same revolution as M
+    """
+    if _isScalar(M, e):
+        # wrap to [-pi, pi) so the iteration starts close, then put the revolutions back
+        revolutions = math.floor((M + math.pi) / (2 * math.pi))
+        m = M - revolutions * 2 * math.pi
+        E = math.copysign(math.pi, m) if e > 0.8 else m + e * math.sin(m)
+        for _ in range(maxIterations):
+            step = (E - e * math.sin(E) - m) / (1.0 - e * math.cos(E))
+            E -= step
+            if abs(step) < tolerance:
+                break
+        return E + revolutions * 2 * math.pi
+
+    M, e = np.broadcast_arrays(np.asarray(M, dtype=np.float64), np.asarray(e, dtype=np.float64))
+    revolutions = np.floor((M + np.pi) / (2 * np.pi))
+    m = M - revolutions * 2 * np.pi
+    E = _newton(_ellipticGuess(m, e), _ellipticStep, (m, e), tolerance, maxIterations)
+    return E + revolutions * 2 * np.pi
+
+
+def hyperbolicFromMean(M, e, tolerance=TOLERANCE, maxIterations=MAX_ITERATIONS * 2):
+    """
+    Solve M = e sinh H - H for H with Newton-Raphson
+
+    :param M: hyperbolic mean anomaly in radians
+    :param e: eccentricity, e > 1
+
+    :return: hyperbolic anomaly in radians
+    """
+    if _isScalar(M, e):
+        H = math.asinh(M / e)
+        for _ in range(maxIterations):
+            step = (e * math.sinh(H) - H - M) / (e * math.cosh(H) - 1.0)
+            H -= step
+            if abs(step) < tolerance:
+                break
+        return H
+
+    M, e = np.broadcast_arrays(np.asarray(M, dtype=np.float64), np.asarray(e, dtype=np.float64))
+    return _newton(np.arcsinh(M / e), _hyperbolicStep, (M, e), tolerance, maxIterations)
+
+
+def meanFromEccentric(E, e):
+    """
+    :return: mean anomaly for the input eccentric anomaly
+    """
+    if _isScalar(E, e):
+        return E - e * math.sin(E)
+    return E - e * np.sin(E)
+
+
+def meanFromHyperbolic(H, e):
+    """
+    :return: hyperbolic mean anomaly for the input hyperbolic anomaly
+    """
+    if _isScalar(H, e):
+        return e * math.sinh(H) - H
+    return e * np.sinh(H) - H
+
+
+def trueFromEccentric(E, e):
+    """
+    :return: true anomaly in radians, on the same revolution as E
+    """
+    if _isScalar(E, e):
+        return 2.0 * math.atan2(math.sqrt(1.0 + e) * math.sin(E / 2.0), math.sqrt(1.0 - e) * math.cos(E / 2.0))
+    return 2.0 * np.arctan2(np.sqrt(1.0 + e) * np.sin(E / 2.0), np.sqrt(1.0 - e) * np.cos(E / 2.0))
+
+
+def eccentricFromTrue(nu, e):
+    """
+    :return: eccentric anomaly in radians, on the same revolution as nu
+    """
+    if _isScalar(nu, e):
+        return 2.0 * math.atan2(math.sqrt(1.0 - e) * math.sin(nu / 2.0), math.sqrt(1.0 + e) * math.cos(nu / 2.0))
+    return 2.0 * np.arctan2(np.sqrt(1.0 - e) * np.sin(nu / 2.0), np.sqrt(1.0 + e) * np.cos(nu / 2.0))
+
+
+def trueFromHyperbolic(H, e):
+    """
+    :return: true anomaly in radians, between the asymptotes
+    """
+    if _isScalar(H, e):
+        return 2.0 * math.atan(math.sqrt((e + 1.0) / (e - 1.0)) * math.tanh(H / 2.0))
+    return 2.0 * np.arctan(np.sqrt((e + 1.0) / (e - 1.0)) * np.tanh(H / 2.0))
+
+
+def hyperbolicFromTrue(nu, e):
+    """
+    :return: hyperbolic anomaly for a true anomaly between the asymptotes
+    """
+    if _isScalar(nu, e):
+        return 2.0 * math.atanh(math.sqrt((e - 1.0) / (e + 1.0)) * math.tan(nu / 2.0))
+    return 2.0 * np.arctanh(np.sqrt((e - 1.0) / (e + 1.0)) * np.tan(nu / 2.0))
+
+
+def trueFromMean(M, e, tolerance=TOLERANCE):
+    """
+    Mean anomaly straight to true anomaly, for any mix of elliptic and hyperbolic orbits
+
+    :param M: mean anomaly in radians
+    :param e: eccentricity
+    :return: true anomaly in radians
+    """
+    if _isScalar(M, e):
+        if e < 1.0:
+            return trueFromEccentric(eccentricFromMean(M, e, tolerance), e)
+        return trueFromHyperbolic(hyperbolicFromMean(M, e, tolerance), e)
+
+    M, e = np.broadcast_arrays(np.asarray(M, dtype=np.float64), np.asarray(e, dtype=np.float64))
+    nu = np.empty(M.shape)
+
+    closed = e < 1.0
+    if np.any(closed):
+        nu[closed] = trueFromEccentric(eccentricFromMean(M[closed], e[closed], tolerance), e[closed])
+    if not np.all(closed):
+        open_ = ~closed
+        nu[open_] = trueFromHyperbolic(hyperbolicFromMean(M[open_], e[open_], tolerance), e[open_])
+
+    return nu
+
+
+def meanFromTrue(nu, e):
+    """
+    True anomaly straight to mean anomaly, for any mix of elliptic and hyperbolic orbits
+
+    :param nu: true anomaly in radians
+    :param e: eccentricity
+    :return: mean anomaly in radians
+    """
+    if _isScalar(nu, e):
+        if e < 1.0:
+            return meanFromEccentric(eccentricFromTrue(nu, e), e)
+        return meanFromHyperbolic(hyperbolicFromTrue(nu, e), e)
+
+    nu, e = np.broadcast_arrays(np.asarray(nu, dtype=np.float64), np.asarray(e, dtype=np.float64))
+    M = np.empty(nu.shape)
+
+    closed = e < 1.0
+    if np.any(closed):
+        M[closed] = meanFromEccentric(eccentricFromTrue(nu[closed], e[closed]), e[closed])
+    if not np.all(closed):
+        open_ = ~closed
+        M[open_] = meanFromHyperbolic(hyperbolicFromTrue(nu[open_], e[open_]), e[open_])
+
+    return M
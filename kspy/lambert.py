@@ -0,0 +1,126 @@
+"""
+Lambert's problem: the orbit that gets from one position to another in a given time
+
+Solved with universal variables (Vallado's formulation), bisecting on the universal variable psi so
+the iteration is the same fixed sequence of array operations for every problem. That lets a whole
+grid of departure positions, arrival positions and flight times be solved in one vectorized call,
+which is what the porkchop generator leans on.
+
+Only zero-revolution transfers are solved. Positions and velocities are in any inertial frame
+centered on the body being orbited, e.g. the one orbit.LocalOrbit.position_at uses.
+"""
+from __future__ import print_function, absolute_import, division
+
+import math
+
+import numpy as np
+
+TOLERANCE = 1e-9
+MAX_ITERATIONS = 100
+
+
+def stumpff(psi):
+    """
+    :param psi: universal variable(s)
+    :return: (c2, c3) Stumpff functions of psi, as arrays
+    """
+    psi = np.asarray(psi, dtype=np.float64)
+    c2 = np.full(psi.shape, 0.5)
+    c3 = np.full(psi.shape, 1.0 / 6.0)
+
+    elliptic = psi > 1e-6
+    hyperbolic = psi < -1e-6
+
+    root = np.sqrt(psi[elliptic])
+    c2[elliptic] = (1.0 - np.cos(root)) / psi[elliptic]
+    c3[elliptic] = (root - np.sin(root)) / (root ** 3)
+
+    root = np.sqrt(-psi[hyperbolic])
+    c2[hyperbolic] = (1.0 - np.cosh(root)) / psi[hyperbolic]
+    c3[hyperbolic] = (np.sinh(root) - root) / (root ** 3)
+
+    return c2, c3
+
+
+def solve(r1, r2, timeOfFlight, gravitationalParameter, normal=None,
+          tolerance=TOLERANCE, maxIterations=MAX_ITERATIONS):
+    """
+    Find the velocities at each end of the transfer from r1 to r2 taking timeOfFlight seconds
+
+    Everything broadcasts: r1 and r2 are (..., 3) arrays and timeOfFlight is (...), so any mix of
+    one departure and many arrivals, many flight times, etc. is solved together.
+
+    :param r1: departure position(s), in meters
+    :param r2: arrival position(s), in meters
+    :param timeOfFlight: in seconds
+    :param gravitationalParameter: of the body being orbited
+    :param normal: orbit normal (angular momentum direction) of the departure orbit, so the transfer
+                   goes around the same way we're already going. Without it, takes the short way round
+    :param tolerance: how closely (relative to timeOfFlight) the transfer time has to match
+    :param maxIterations: most bisection steps to take
+
+    :return: (v1, v2), the departure and arrival velocities as (..., 3) arrays.
+             NaN for problems with no solution, like a transfer of exactly 180 degrees
+    """
+    r1 = np.asarray(r1, dtype=np.float64)
+    r2 = np.asarray(r2, dtype=np.float64)
+    timeOfFlight = np.asarray(timeOfFlight, dtype=np.float64)
+
+    shape = np.broadcast_shapes(r1.shape[:-1], r2.shape[:-1], timeOfFlight.shape)
+    r1 = np.broadcast_to(r1, shape + (3,))
+    r2 = np.broadcast_to(r2, shape + (3,))
+    timeOfFlight = np.broadcast_to(timeOfFlight, shape)
+
+    mu = float(gravitationalParameter)
+    sqrtMu = math.sqrt(mu)
+
+    R1 = np.linalg.norm(r1, axis=-1)
+    R2 = np.linalg.norm(r2, axis=-1)
+    cosNu = np.clip(np.sum(r1 * r2, axis=-1) / (R1 * R2), -1.0, 1.0)
+
+    # +1 for going the short way round, -1 for the long way
+    if normal is None:
+        direction = np.ones(shape)
+    else:
+        turning = np.sum(np.cross(r1, r2) * np.asarray(normal, dtype=np.float64), axis=-1)
+        direction = np.where(turning >= 0, 1.0, -1.0)
+
+    A = direction * np.sqrt(R1 * R2 * (1.0 + cosNu))
+
+    lower = np.full(shape, -4.0 * math.pi)
+    upper = np.full(shape, 4.0 * math.pi ** 2)
+    psi = np.zeros(shape)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for _ in range(maxIterations):
+            c2, c3 = stumpff(psi)
+            y = R1 + R2 + A * (psi * c3 - 1.0) / np.sqrt(c2)
+
+            chi = np.sqrt(np.abs(y) / c2)
+            dt = (chi ** 3 * c3 + A * np.sqrt(np.abs(y))) / sqrtMu
+
+            # y < 0 means psi is too small to be a solution at all, so it counts as arriving too soon
+            early = (y < 0) | (dt <= timeOfFlight)
+            lower = np.where(early, psi, lower)
+            upper = np.where(early, upper, psi)
+            psi = (lower + upper) / 2.0
+
+            if np.all(np.abs(dt - timeOfFlight) <= tolerance * timeOfFlight):
+                break
+
+        c2, c3 = stumpff(psi)
+        y = R1 + R2 + A * (psi * c3 - 1.0) / np.sqrt(c2)
+
+        f = 1.0 - y / R1
+        g = A * np.sqrt(y / mu)
+        gDot = 1.0 - y / R2
+
+        v1 = (r2 - f[..., np.newaxis] * r1) / g[..., np.newaxis]
+        v2 = (gDot[..., np.newaxis] * r2 - r1) / g[..., np.newaxis]
+
+    # A of zero is a transfer of exactly 180 degrees, where the transfer plane isn't defined
+    invalid = (np.abs(A) < 1e-9 * (R1 + R2)) | (y < 0)
+    v1[invalid] = np.nan
+    v2[invalid] = np.nan
+
+    return v1, v2
@@ -7,8 +7,16 @@ import math
 import numpy as np
 import time
 
+from . import batch
+from . import bodies
+from . import controls
+from . import frames
 from . import utils
 from . import maths
+from . import heightmap
+from . import orbit
+from . import telemetry
+from . import terrain
 
 
 def getLandingReferenceFrame(landingLongitude,
@@ -16,7 +24,8 @@ def getLandingReferenceFrame(landingLongitude,
                              landingAltitude=None,
                              connection=None,
                              vessel=None,
-                             body=None):
+                             body=None,
+                             terrainCache=None):
     """
     Constructs a reference frame object based on the vessel, body, and landing lat/long we're aiming for
 
@@ -29,6 +38,7 @@ def getLandingReferenceFrame(landingLongitude,
     :param connection: The connection to operate upon
     :param vessel: the vessel to check for
     :param body: the body we're orbiting
+    :param terrainCache: optional terrain.TerrainCache to look the landing altitude up in
 
     :return: the constructed reference frame
     """
@@ -41,18 +51,21 @@ def getLandingReferenceFrame(landingLongitude,
     if not body:
         body = vessel.orbit.body
     if not landingAltitude:
-        landingAltitude = body.surface_height(landingLatitude, landingLongitude)
+        if terrainCache:
+            landingAltitude = terrainCache.height(landingLatitude, landingLongitude)
+        else:
+            landingAltitude = body.surface_height(landingLatitude, landingLongitude)
 
-    # sneak the namespace in to make creation later easier
-    ReferenceFrame = connection.space_center.ReferenceFrame
+    # the same landing site always gets the same frame back, rather than three new ones on the server
+    cache = frames.FrameCache.forConnection(connection)
 
     # Determine landing site reference frame (orientation: x=zenith, y=north, z=east)
     landing_position = body.surface_position(landingLatitude, landingLongitude, body.reference_frame)
     q_long = (0, math.sin(-landingLongitude * 0.5 * math.pi / 180), 0, math.cos(-landingLongitude * 0.5 * math.pi / 180))
     q_lat = (0, 0, math.sin(landingLatitude * 0.5 * math.pi / 180), math.cos(landingLatitude * 0.5 * math.pi / 180))
-    landing_reference_frame = ReferenceFrame.create_relative(
-                                ReferenceFrame.create_relative(
-                                  ReferenceFrame.create_relative(
+    landing_reference_frame = cache.relative(
+                                cache.relative(
+                                  cache.relative(
                                     body.reference_frame,
                                     landing_position,
                                     q_long),
@@ -78,12 +91,12 @@ def coordsDownBearing(lat, lon, bearing, distance, body):
     :param lon: the longitude we're at
     :param bearing: the given heading
     :param distance: how far away we want to check from the input point
-    :param body: the body we're checking for
+    :param body: the body we're checking for, or its bodies.BodyConstants
 
     :return: (latitude, longitude) of the point x distance away down the bearing from the input lat/long
     """
     bearing = math.radians(bearing)
-    R = body.equatorial_radius
+    R = bodies.constants(body).equatorial_radius
     lat = math.radians(lat)
     lon = math.radians(lon)
 
@@ -99,7 +112,7 @@ def coordsDownBearing(lat, lon, bearing, distance, body):
     return lat2, lon2
 
 
-def checkTerrain(lat1, lon1, lat2, lon2, body):
+def checkTerrain(lat1, lon1, lat2, lon2, body, terrainCache=None):
     """
     Returns an estimate of the highest terrain altitude between
     two latitude / longitude points.
@@ -109,28 +122,22 @@ def checkTerrain(lat1, lon1, lat2, lon2, body):
     :param lat2: latitude of the second point, in degrees
     :param lon2: longitude of the second point, in degrees
     :param body: the body upon which to check
+    :param terrainCache: optional terrain.TerrainCache for the body, to skip asking the server every time
 
     :return: an estimate of the highest terrain altitude from COM between those two points
     """
-    lat = lat1
-    lon = lon1
-    highestLat = lat
-    highestLon = lon
-    highestAlt = body.surface_height(lat, lon)
     latstep = (lat2 - lat1) / 20
     lonstep = (lon2 - lon1) / 20
 
-    # test 20 points between where we started and where we're going
-    for x in range(20):
-        testAlt = body.surface_height(lat, lon)
-        if testAlt > highestAlt:
-            highestLat = lat
-            highestLon = lon
-            highestAlt = testAlt
-        lat = lat + latstep
-        lon = lon + lonstep
+    if terrainCache:
+        # the cache's samples are coarser than asking the server for each point, so stay on the safe side
+        return max(terrainCache.peaks([(lat1 + latstep * x, lon1 + lonstep * x) for x in range(20)]))
+
+    # test 20 points between where we started and where we're going, all in one round trip
+    with batch.Batch(body) as b:
+        heights = [b.add(body.surface_height, lat1 + latstep * x, lon1 + lonstep * x) for x in range(20)]
 
-    return highestAlt
+    return max(height() for height in heights)
 
 
 class SuicideBurnCalculator(object):
@@ -162,7 +169,13 @@ class SuicideBurnCalculator(object):
 
         self.desiredThrottle = 0.95
 
-        self.referenceFrame = self.spaceCenter.ReferenceFrame.create_hybrid(
+        # the body never changes under us, so these only need reading once
+        self.orbit = vessel.orbit
+        self.body = bodies.constants(vessel.orbit.body)
+        self.bodyRadius = self.body.equatorial_radius
+        self.mu = self.body.gravitational_parameter
+
+        self.referenceFrame = frames.FrameCache.forConnection(connection).hybrid(
             position=vessel.orbit.body.reference_frame,
             rotation=vessel.surface_reference_frame
         )
@@ -176,7 +189,7 @@ class SuicideBurnCalculator(object):
         self.angleFromHorizontal = maths.angleBetween(vesselVelocity, horizontalVelocity)
         sine = math.sin(self.angleFromHorizontal)
 
-        g = self.vessel.orbit.body.surface_gravity
+        g = self.body.surface_gravity
         thrust = (self.vessel.max_thrust / self.vessel.mass)
 
         # is it because of this line?
@@ -188,15 +201,18 @@ class SuicideBurnCalculator(object):
         # TODO: I'm not sure this is getting calculated right, as we end up cutting off so high
         # TODO: and any time we spend below about 95% throttle we might be using too much fuel
 
+        # snapshot the orbit in one round trip and do the anomaly maths locally
+        localOrbit = orbit.LocalOrbit.fromOrbit(self.orbit, self.mu)
+
         # the height of the highest point over our ground path from the body's COM
-        radius = self.vessel.orbit.body.equatorial_radius + self.altitude
-        TA = self.vessel.orbit.true_anomaly_at_radius(radius) * -1
-        self.timeToImpact = self.vessel.orbit.ut_at_true_anomaly(TA) - self.spaceCenter.ut
+        radius = self.bodyRadius + self.altitude
+        TA = localOrbit.true_anomaly_at_radius(radius) * -1
+        impactTime = localOrbit.ut_at_true_anomaly(TA)
+        self.timeToImpact = impactTime - localOrbit.ut
         self.timeToBurn = self.timeToImpact - self.decelerationTime
 
-        impactTime = self.vessel.orbit.ut_at_true_anomaly(TA)
         burnTime = impactTime - self.decelerationTime / 2
-        self.groundTrack = ((burnTime - self.spaceCenter.ut) * self.vessel.flight(self.referenceFrame).speed) + \
+        self.groundTrack = ((burnTime - localOrbit.ut) * self.vessel.flight(self.referenceFrame).speed) + \
                            (.5 * self.vessel.flight(self.referenceFrame).speed * self.decelerationTime)
 
         self.desiredThrottle = self.decelerationTime / self.timeToImpact
@@ -206,6 +222,8 @@ class Descend(utils.Program):
     """
     Program object to handle landing a vessel on a suborbital path over a body
     """
+    rate = 100
+
     def __init__(self, connection, vessel):
         """
         :param connection: The krpc.Connection to operate upon
@@ -216,6 +234,11 @@ class Descend(utils.Program):
         self.vessel = vessel
         self.flight = vessel.flight(vessel.orbit.body.reference_frame)
 
+        # the ground track barely moves between ticks, so keep the terrain under it cached locally,
+        # backed by the heightmap on disk so we remember it for the next landing here
+        body = vessel.orbit.body
+        self.terrainCache = terrain.TerrainCache.forBody(body, store=heightmap.HeightmapStore.forBody(body))
+
         self.sbc = SuicideBurnCalculator(connection, vessel, 5000)
         self.sbc()  # init call of the SBC
 
@@ -224,7 +247,7 @@ class Descend(utils.Program):
                                       self.sbc.groundTrack, self.vessel.orbit.body)
 
         self.sbc.altitude = checkTerrain(self.flight.latitude, self.flight.longitude, touchdown[0], touchdown[1],
-                                         self.vessel.orbit.body)
+                                         self.vessel.orbit.body, self.terrainCache)
         self.sbc()
 
         self.burning = False
@@ -242,7 +265,7 @@ class Descend(utils.Program):
                                       self.sbc.groundTrack, self.vessel.orbit.body)
 
         self.sbc.altitude = checkTerrain(self.flight.latitude, self.flight.longitude, touchdown[0], touchdown[1],
-                                         self.vessel.orbit.body)
+                                         self.vessel.orbit.body, self.terrainCache)
 
         self.sbc()  # call the SBC to update itself
 
@@ -269,6 +292,8 @@ class SoftTouchdown(utils.Program):
     Program object to take us from the suicide burn/descend program (which seems to leave us a little high)
     all the way down to softly touch down on the surface of the body we're orbiting
     """
+    rate = 100
+
     def __init__(self, vessel):
         """
         :param vessel: the vessel to guide to a soft touchdown
@@ -277,7 +302,8 @@ class SoftTouchdown(utils.Program):
 
         self.vessel = vessel
         self.autoPilot = vessel.auto_pilot
-        self.control = vessel.control
+        self.controls = controls.ControlBuffer(vessel)
+        self.control = self.controls.control
         self.flight = vessel.flight(vessel.orbit.body.reference_frame)
 
         # we still want to point surface velocity retrograde because at this point that shound be straight up
@@ -292,7 +318,7 @@ class SoftTouchdown(utils.Program):
         safeDescent = max(safeDescent, -15)  # but also clamp it, in case we're too far up or moving too quickly
 
         # the midpoint of our safe descent should be a hovering throttle
-        a = self.vessel.orbit.body.surface_gravity - self.flight.vertical_speed
+        a = bodies.constants(self.vessel.orbit.body).surface_gravity - self.flight.vertical_speed
         F = self.vessel.mass * a
 
         midPoint = (F / self.vessel.available_thrust)
@@ -302,6 +328,7 @@ class SoftTouchdown(utils.Program):
         p0 = midPoint
         ekp = .25 * e
         self.control.throttle = ekp + p0
+        self.controls.flush()
 
         # if we're on the ground, or if we're moving really slowly, otherwise we go in a wonky direction really quickly
         if self.vessel.situation == self.vessel.situation.landed or abs(self.flight.vertical_speed) < 0.1:
@@ -317,6 +344,10 @@ class Hover(utils.Program):
     """
     A program object to allow the user to nicely hover and navigate around at a defined altitude
     """
+    telemetryFields = ('surfaceAltitude', 'verticalSpeed', 'horizontalSpeed', 'velocity',
+                       'mass', 'availableThrust', 'surfaceGravity', 'abort', 'brakes')
+    rate = 100
+
     def __init__(self, connection, vessel, targetAlt=12):
         """
 
@@ -329,7 +360,10 @@ class Hover(utils.Program):
         self.connection = connection
         self.vessel = vessel
         self.flight = self.vessel.flight(self.vessel.orbit.body.reference_frame)
-        self.control = self.vessel.control
+
+        # the throttle, brakes and direction only go to the server when they've moved
+        self.controls = controls.ControlBuffer(vessel)
+        self.control = self.controls.control
 
         self.targetAlt = targetAlt
         self.descentRate = 0.1
@@ -357,23 +391,34 @@ class Hover(utils.Program):
         self.midPitch = 0.0
         self.midYaw = 0.0
 
-    def __call__(self):
+        # our own snapshots, only set up once a tick arrives without a frame
+        self.telemetry = None
+
+    def __call__(self, frame=None):
+        if frame is None:
+            if self.telemetry is None:
+                self.telemetry = self.holdStream(
+                    telemetry.TelemetrySource(self.connection, self.vessel, self.telemetryFields))
+            frame = self.telemetry()
 
         # update our debug drawings
         self.connection.drawing.clear()
 
         # allow the user to hit abort and softly and slowly land the craft
-        if utils.hasAborted(self.vessel):
+        if frame.abort:
             self.control.gear = True
+            self.controls.flush()
             self.targetAlt -= 1.0
             time.sleep(1)
             if self.vessel.situation == self.vessel.situation.landed:
-                self.control.abort = False
+                # abort is the user's to toggle, so it goes straight to the vessel rather than the buffer
+                self.vessel.control.abort = False
+                self.release()
                 return False
 
         # hitting the brakes means killing horizontal velocity
-        if self.control.brakes:
-            up, back, right = self.flight.velocity
+        if frame.brakes:
+            up, back, right = frame.velocity
 
             pitchOffset = (right / self.horizSpeedMax) * self.horizDeflectionMax
             yawOffset = (back / self.horizSpeedMax) * self.horizDeflectionMax
@@ -387,37 +432,40 @@ class Hover(utils.Program):
 
             direction = maths.rpyToDirection(pitch, yaw)
 
-            self.vessel.auto_pilot.target_direction = direction
-            self.vessel.auto_pilot.target_roll = float("nan")
+            self.controls.autoPilot.target_direction = direction
+            self.controls.autoPilot.target_roll = float("nan")
 
             # turn off the brakes if we're broken enough
-            if abs(self.flight.horizontal_speed) <= self.horizSpeedTolerance:
-                self.control.brakes = False
+            if abs(frame.horizontalSpeed) <= self.horizSpeedTolerance:
+                self.vessel.control.brakes = False
 
         else:
-            self.vessel.auto_pilot.target_direction = (0, 0, 1)
+            direction = (0, 0, 1)
+            self.controls.autoPilot.target_direction = direction
 
         # add some debug drawings to help diagnose any potential over-correction issues
         self.connection.drawing.add_direction(self.vessel.direction(self.vessel.surface_reference_frame),
                                               self.vessel.surface_reference_frame)
-        self.connection.drawing.add_direction(self.vessel.auto_pilot.target_direction,
-                                              self.vessel.surface_reference_frame)
+        self.connection.drawing.add_direction(direction, self.vessel.surface_reference_frame)
 
         # the different between where we want to be and where we are
-        altError = self.targetAlt - self.flight.surface_altitude
+        altError = self.targetAlt - frame.surfaceAltitude
 
         # acceleration
-        a = self.vessel.orbit.body.surface_gravity - self.flight.vertical_speed + altError
+        a = frame.surfaceGravity - frame.verticalSpeed + altError
 
         # Compute throttle setting using newton's law F=ma
-        F = self.vessel.mass * a
+        F = frame.mass * a
 
         # if we've run out of fuel, bail out
-        if not self.vessel.available_thrust:
+        if not frame.availableThrust:
+            self.controls.flush()
+            self.release()
             return False
 
         # set the vessel's throttle to what it should be
-        self.control.throttle = F / self.vessel.available_thrust
+        self.control.throttle = F / frame.availableThrust
+        self.controls.flush()
         return True
 
     def displayValues(self):
@@ -5,7 +5,10 @@ from __future__ import print_function, absolute_import, division
 
 import math
 
+from . import bodies
+from . import controls
 from . import utils
+from . import telemetry
 from . import throttle
 from . import maths
 
@@ -96,18 +99,25 @@ class LaunchAzimuthCalculator(object):
             print("Inclination impossible from current latitude, setting for highest possible inclination.")
 
         # One-time calculations
-        self.equatorialVel = (2 * math.pi * vessel.orbit.body.equatorial_radius) / vessel.orbit.body.rotational_period
+        body = bodies.constants(vessel.orbit.body)
+        self.equatorialVel = (2 * math.pi * body.equatorial_radius) / body.rotational_period
 
-        self.targetOrbVel = math.sqrt(vessel.orbit.body.gravitational_parameter /
-                                      (vessel.orbit.body.equatorial_radius + targetAltitude))
+        self.targetOrbVel = math.sqrt(body.gravitational_parameter / (body.equatorial_radius + targetAltitude))
 
         # stash off our targets
         self.targetInclination = targetInclination
         self.targetAltitude = targetAltitude
 
-    def __call__(self):
+    def __call__(self, latitude=None):
+        """
+        :param latitude: the vessel's current latitude, if the caller already has it on hand
+        :return: the heading we should be flying
+        """
+        if latitude is None:
+            latitude = self.vessel.flight().latitude
+
         inertialAzimuth = math.asin(max(min(math.cos(math.radians(self.targetInclination)) /
-                                            math.cos(math.radians(self.vessel.flight().latitude)), 1), -1))
+                                            math.cos(math.radians(latitude)), 1), -1))
 
         VXRot = (self.targetOrbVel * math.sin(inertialAzimuth)) - \
                 (self.equatorialVel * math.cos(math.radians(self.launchLatitude)))
@@ -129,6 +139,9 @@ class Ascend(utils.Program):
     """
     Program object to launch a vessel into orbit with the given parameters
     """
+    telemetryFields = ('meanAltitude', 'apoapsisAltitude', 'latitude')
+    rate = 20
+
     def __init__(self, connection, vessel, targetAltitude, targetInclination=0.0):
         """
 
@@ -146,7 +159,8 @@ class Ascend(utils.Program):
 
         # End the turn within the target's atmosphere (if one exists),
         # otherwise end the turn at 25% of the target altitude
-        self.turnEndAltitude = vessel.orbit.body.atmosphere_depth * 0.75 if vessel.orbit.body.atmosphere_depth > 1 else targetAltitude * .25
+        atmosphereDepth = bodies.constants(vessel.orbit.body).atmosphere_depth
+        self.turnEndAltitude = atmosphereDepth * 0.75 if atmosphereDepth > 1 else targetAltitude * .25
         #self.turnEndAltitude = targetAltitude * .5
         self.targetAltitude = targetAltitude
 
@@ -159,15 +173,13 @@ class Ascend(utils.Program):
         # set up the launch azimuth calculator
         self.lazCalc = LaunchAzimuthCalculator(targetAltitude, targetInclination, connection, vessel)
 
-        # set up some helpful data streams from the connection
-        self.ut = connection.add_stream(getattr, connection.space_center, 'ut')
-        self.altitude = connection.add_stream(getattr, self.flight, 'mean_altitude')
-        self.apoapsis = connection.add_stream(getattr, self.vessel.orbit, 'apoapsis_altitude')
-        self.periapsis = connection.add_stream(getattr, self.vessel.orbit, 'periapsis_altitude')
-        self.eccentricity = connection.add_stream(getattr, self.vessel.orbit, 'eccentricity')
+        # our own snapshots, only set up once a tick arrives without a frame
+        self.telemetry = None
 
         # set up our throttle controller so we don't experience too much force and waste fuel
-        self.throttle = throttle.MaxQController(connection, vessel, maxQ=self.maxQ)
+        # throttle and steering only go to the server when they've moved, all at once at the end of a tick
+        self.controls = controls.ControlBuffer(vessel)
+        self.throttle = throttle.MaxQController(connection, vessel, maxQ=self.maxQ, controlBuffer=self.controls)
 
         # set the initial state of the vessel
         self.vessel.control.sas = False
@@ -181,27 +193,46 @@ class Ascend(utils.Program):
         self.autoPilot.target_roll = float("nan")
         self.autoPilot.engage()
 
-    def __call__(self):
+    def __call__(self, frame=None):
+        if frame is None:
+            if self.telemetry is None:
+                self.telemetry = self.holdStream(
+                    telemetry.TelemetrySource(self.connection, self.vessel, self.telemetryFields))
+            frame = self.telemetry()
+
+        altitude = frame.meanAltitude
+
         # point straight up until we get to our turn start altitude
-        if self.altitude() < self.turnStartAltitude:
-            self.autoPilot.target_pitch_and_heading(90, 90)
+        if altitude < self.turnStartAltitude:
+            pitch, heading = 90, 90
 
         # if we're between turn start and turn end, lerp our pitch between 90 and 0
-        elif self.turnStartAltitude < self.altitude() and self.altitude() < self.turnEndAltitude:
-            frac = maths.normalizeToRange(self.altitude(), self.turnStartAltitude, self.turnEndAltitude)
-            self.autoPilot.target_pitch_and_heading(90 * (1-frac), self.lazCalc())
+        elif self.turnStartAltitude < altitude < self.turnEndAltitude:
+            frac = maths.normalizeToRange(altitude, self.turnStartAltitude, self.turnEndAltitude)
+            pitch, heading = 90 * (1-frac), self.lazCalc(frame.latitude)
 
         # if we're done with our gravity turn, stay parallel to the body's surface
         else:
-            self.autoPilot.target_pitch_and_heading(0, self.lazCalc())
+            pitch, heading = 0, self.lazCalc(frame.latitude)
 
-        if self.apoapsis() > self.targetAltitude:
-            self.vessel.control.throttle = 0.0
+        # the same as target_pitch_and_heading, but only sending what's changed
+        self.controls.autoPilot.target_pitch = float(pitch)
+        self.controls.autoPilot.target_heading = float(heading)
+
+        if frame.apoapsisAltitude > self.targetAltitude:
+            self.controls.control.throttle = 0.0
+            self.controls.flush()
             self.autoPilot.disengage()
+            self.release()
             return True
         else:
             self.throttle()
+            self.controls.flush()
             return False
 
     def displayValues(self):
         return [self.prettyName]
+
+    def release(self):
+        super(Ascend, self).release()
+        self.throttle.release()
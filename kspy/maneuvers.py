@@ -5,7 +5,13 @@ from __future__ import print_function, absolute_import, division
 
 import math
 
+import numpy as np
+
+from . import bodies
+from . import lambert
 from . import launch
+from . import orbit
+from . import porkchop
 from . import rendezvous
 from . import utils
 
@@ -29,12 +35,78 @@ def hohmannTransfer(connection=None, vessel=None, target=None):
         # grab whatever target is currently set
         target = connection.space_center.target_vessel or connection.space_center.target_body
 
-    phaseAngle = rendezvous.getPhaseAngle(vessel, target)
-    transferTime = rendezvous.timeTransfer(vessel, target, connection.space_center.ut, phaseAngle)
+    # snapshot both orbits up front, everything from here until we plot the node is local maths
+    vesselOrbit = orbit.LocalOrbit.fromOrbit(vessel.orbit)
+    targetOrbit = orbit.LocalOrbit.fromOrbit(target.orbit)
+
+    phaseAngle = rendezvous.getPhaseAngle(vesselOrbit, targetOrbit)
+    transferTime = rendezvous.timeTransfer(vesselOrbit, targetOrbit, vesselOrbit.ut, phaseAngle)
 
     return changeApoapsis(target.orbit.apoapsis_altitude, connection, vessel, atTime=transferTime)
 
 
+def lambertTransfer(connection=None, vessel=None, target=None, departures=None, timesOfFlight=None,
+                    matchVelocity=True, workers=1, leadTime=60):
+    """
+    Plot the cheapest transfer to target found by a porkchop search, rather than assuming both orbits
+    are circular and coplanar like hohmannTransfer does
+
+    :param connection: krpc.Connection to use to generate the maneuver node, defaults to DefaultConnection
+    :param vessel: the vessel for which to generate the node, defaults to active_vessel
+    :param target: the target vessel or body, will default to the active target. Has to orbit the same body we do
+    :param departures: departure times to search, defaults to the next synodic period
+    :param timesOfFlight: flight times to search, defaults to half to one and a half times the hohmann transfer's
+    :param matchVelocity: count the burn to match velocities at the target when picking the transfer
+    :param workers: processes to search with, see porkchop.search. Defaults to searching in this process
+    :param leadTime: earliest departure, in seconds from now, so there's time to turn to the burn
+
+    :return: the node created for the transfer
+    """
+    if not connection:
+        connection = utils.defaultConnection("lambertTransfer")
+    if not vessel:
+        vessel = connection.space_center.active_vessel
+    if not target:
+        target = connection.space_center.target_vessel or connection.space_center.target_body
+
+    if vessel.orbit.body != target.orbit.body:
+        raise ValueError("{0} doesn't orbit the same body we do, transfer from its parent's orbit instead".format(
+            target.name))
+
+    vesselOrbit = orbit.LocalOrbit.fromOrbit(vessel.orbit)
+    targetOrbit = orbit.LocalOrbit.fromOrbit(target.orbit, vesselOrbit.gravitational_parameter)
+    mu = vesselOrbit.gravitational_parameter
+
+    if departures is None:
+        relativeMotion = abs(vesselOrbit.mean_motion - targetOrbit.mean_motion)
+        synodicPeriod = 2 * math.pi / relativeMotion if relativeMotion > 1e-12 else targetOrbit.period
+        departures = np.linspace(vesselOrbit.ut + leadTime, vesselOrbit.ut + leadTime + synodicPeriod, 240)
+
+    if timesOfFlight is None:
+        transferAxis = (abs(vesselOrbit.semi_major_axis) + abs(targetOrbit.semi_major_axis)) / 2
+        hohmannTime = math.pi * math.sqrt(transferAxis ** 3 / mu)
+        timesOfFlight = np.linspace(0.5 * hohmannTime, 1.5 * hohmannTime, 240)
+
+    best = porkchop.search(vesselOrbit, targetOrbit, departures, timesOfFlight, rendezvous=matchVelocity, workers=workers)
+
+    # work the departure burn back out and split it into the node's prograde/normal/radial components
+    r1 = vesselOrbit.position_at(best.departure)
+    v1 = vesselOrbit.velocity_at(best.departure)
+    r2 = targetOrbit.position_at(best.departure + best.timeOfFlight)
+    transferV1, _ = lambert.solve(r1, r2, best.timeOfFlight, mu, normal=vesselOrbit.normal)
+    burn = transferV1 - v1
+
+    prograde = v1 / np.linalg.norm(v1)
+    normal = np.cross(r1, v1)
+    normal /= np.linalg.norm(normal)
+    radial = np.cross(prograde, normal)
+
+    return vessel.control.add_node(best.departure,
+                                   prograde=float(np.dot(burn, prograde)),
+                                   normal=float(np.dot(burn, normal)),
+                                   radial=float(np.dot(burn, radial)))
+
+
 def matchPlanes(connection=None, vessel=None, target=None):
     """
     Plot a maneuver to match planes with the input target at the earliest ascending/descending node
@@ -148,7 +220,8 @@ def changeAltitude(targetAltitude, vessel=None, atTime=None):
     :param atTime: when we want to start the maneuver (in seconds since world start)
     :return: the newly created maneuver
     """
-    mu = vessel.orbit.body.gravitational_parameter
+    body = bodies.constants(vessel.orbit.body)
+    mu = body.gravitational_parameter
 
     # where we're starting
     r1 = vessel.orbit.radius_at(atTime)
@@ -157,7 +230,7 @@ def changeAltitude(targetAltitude, vessel=None, atTime=None):
 
     # where we're going
     r2 = r1
-    a2 = (r1 + targetAltitude + vessel.orbit.body.equatorial_radius) / 2
+    a2 = (r1 + targetAltitude + body.equatorial_radius) / 2
     v2 = math.sqrt(mu * ((2. / r2) - (1. / a2)))
 
     deltaV = v2 - v1
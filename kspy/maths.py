@@ -44,6 +44,63 @@ def clamp_2pi(x):
     return x % (math.pi * 2)
 
 
+def wrap_pi(x):
+    """
+    Wrap x (radians) into a single revolution centered on 0
+
+    :return: radian value x wrapped to [-pi, pi), works on numpy arrays too
+    """
+    return (x + math.pi) % (math.pi * 2) - math.pi
+
+
+def bracketedRoot(f, a, b, tolerance=1e-6, maxIterations=100):
+    """
+    Find a root of f between a and b, where f(a) and f(b) have opposite signs,
+    using regula falsi with the Illinois modification so it doesn't stall on one side
+
+    :param f: function of one float
+    :param a: one end of the bracket
+    :param b: the other end of the bracket
+    :param tolerance: how narrow the bracket has to get before we call it found
+    :param maxIterations: give up and return our best guess after this many steps
+
+    :return: x such that f(x) is (close to) 0
+    """
+    fa = f(a)
+    fb = f(b)
+
+    if fa == 0:
+        return a
+    if fb == 0:
+        return b
+    if (fa > 0) == (fb > 0):
+        raise ValueError("f({0}) and f({1}) need opposite signs to bracket a root".format(a, b))
+
+    side = 0
+    c = a
+    for _ in range(maxIterations):
+        c = (a * fb - b * fa) / (fb - fa)
+        if abs(b - a) < tolerance:
+            break
+
+        fc = f(c)
+        if fc == 0:
+            break
+
+        if (fc > 0) == (fb > 0):
+            b, fb = c, fc
+            if side == -1:
+                fa /= 2
+            side = -1
+        else:
+            a, fa = c, fc
+            if side == 1:
+                fb /= 2
+            side = 1
+
+    return c
+
+
 def v3minus(a, b):
     """
     Subtract Vector B from Vector A
@@ -186,3 +243,27 @@ def getPointAwayFrom(startPoint, direction, distance):
     x = vectorMultiply(direction, distance)
     return vectorAdd(startPoint, x)
 
+
+def conjugateQuaternion(q):
+    """
+    :param q: (x, y, z, w) quaternion, as krpc returns them
+    :return: the conjugate of q, which for unit quaternions is the opposite rotation
+    """
+    return (-q[0], -q[1], -q[2], q[3])
+
+
+def rotateByQuaternion(v, q):
+    """
+    Rotate a vector by a unit quaternion
+
+    :param v: float3 vector
+    :param q: (x, y, z, w) unit quaternion, as krpc returns them
+    :return: numpy float3 of v rotated by q
+    """
+    u = np.array(q[:3], dtype=float)
+    w = q[3]
+    v = np.asarray(v, dtype=float)
+
+    # v' = v + 2w(u x v) + 2u x (u x v)
+    t = 2.0 * np.cross(u, v)
+    return v + w * t + np.cross(u, t)
@@ -52,6 +52,8 @@ class ExecuteManeuver(utils.Program):
     """
     Program object to execute a maneuver node smoothly and safely
     """
+    rate = 20
+
     def __init__(self, connection, vessel, node, tuneTime=2, leadTime=60):
         """
 
@@ -74,8 +76,9 @@ class ExecuteManeuver(utils.Program):
         self.totalBurnTime = calculateBurnTime(vessel, node)
 
         # set up helpful streams
-        self.remainingBurn = connection.add_stream(node.remaining_burn_vector, node.reference_frame)
-        self.ut = connection.add_stream(getattr, connection.space_center, 'ut')
+        streams = utils.streams(connection)
+        self.remainingBurn = self.holdStream(streams.add_call(node, 'remaining_burn_vector', node.reference_frame))
+        self.ut = self.holdStream(streams.add_ut())
 
         self.remainingBurnTime = self.totalBurnTime
 
@@ -91,6 +94,7 @@ class ExecuteManeuver(utils.Program):
         # if we're missing the maneuver node (because the user deleted it, bail out
         if not self.node:
             self.vessel.control.throttle = 0.0
+            self.release()
             return True
 
         # when do we start the burn
@@ -114,6 +118,7 @@ class ExecuteManeuver(utils.Program):
         if self.remainingBurn()[1] <= 0.1:
             self.vessel.control.throttle = 0.0
             self.node = None
+            self.release()
             return True
 
         # let smooth throttle figure how how much to burn
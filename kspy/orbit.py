@@ -0,0 +1,292 @@
+"""
+Local Keplerian orbit propagation
+
+A LocalOrbit is built from one snapshot of an orbit's elements and then answers the same questions
+krpc's Orbit does (mean_anomaly_at_ut, ut_at_true_anomaly, radius_at...) without going back to the
+server. Attribute and method names deliberately mirror krpc's Orbit so a LocalOrbit can stand in for
+one, and every method takes either a single value or a NumPy array of values.
+
+The snapshot only holds for as long as nothing is thrusting, so planners should take a fresh one
+after every burn.
+"""
+from __future__ import print_function, absolute_import, division
+
+import math
+
+import numpy as np
+
+from . import batch
+from . import kepler
+
+TWO_PI = 2.0 * math.pi
+
+
+def _result(value):
+    """
+    Hand back plain floats for scalar inputs and arrays for array inputs
+    """
+    if np.ndim(value) == 0:
+        return float(value)
+    return value
+
+
+class LocalOrbit(object):
+    """
+    A snapshot of a Keplerian orbit we can propagate on the client
+    """
+    def __init__(self, semiMajorAxis, eccentricity, inclination, longitudeOfAscendingNode,
+                 argumentOfPeriapsis, meanAnomalyAtEpoch, epoch, gravitationalParameter, ut=None):
+        """
+        :param semiMajorAxis: in meters, negative for hyperbolic orbits
+        :param eccentricity: orbital eccentricity
+        :param inclination: in radians
+        :param longitudeOfAscendingNode: in radians
+        :param argumentOfPeriapsis: in radians
+        :param meanAnomalyAtEpoch: in radians
+        :param epoch: universal time the mean anomaly at epoch was measured at
+        :param gravitationalParameter: of the body being orbited
+        :param ut: universal time the snapshot was taken, defaults to the epoch
+        """
+        if eccentricity >= 1.0 and semiMajorAxis > 0:
+            # krpc reports hyperbolic semi-major axes as positive sometimes, the maths wants them negative
+            semiMajorAxis = -semiMajorAxis
+
+        self.semi_major_axis = float(semiMajorAxis)
+        self.eccentricity = float(eccentricity)
+        self.inclination = float(inclination)
+        self.longitude_of_ascending_node = float(longitudeOfAscendingNode)
+        self.argument_of_periapsis = float(argumentOfPeriapsis)
+        self.mean_anomaly_at_epoch = float(meanAnomalyAtEpoch)
+        self.epoch = float(epoch)
+        self.gravitational_parameter = float(gravitationalParameter)
+        self.ut = float(epoch if ut is None else ut)
+
+        self.mean_motion = math.sqrt(self.gravitational_parameter / abs(self.semi_major_axis) ** 3)
+
+        # perifocal -> body inertial rotation, worked out once
+        cosO, sinO = math.cos(self.longitude_of_ascending_node), math.sin(self.longitude_of_ascending_node)
+        cosw, sinw = math.cos(self.argument_of_periapsis), math.sin(self.argument_of_periapsis)
+        cosi, sini = math.cos(self.inclination), math.sin(self.inclination)
+        self._p = np.array([cosO * cosw - sinO * sinw * cosi,
+                            sinO * cosw + cosO * sinw * cosi,
+                            sinw * sini])
+        self._q = np.array([-cosO * sinw - sinO * cosw * cosi,
+                            -sinO * sinw + cosO * cosw * cosi,
+                            cosw * sini])
+
+    @classmethod
+    def fromOrbit(cls, orbit, gravitationalParameter=None):
+        """
+        Snapshot a krpc Orbit, pulling all of its elements in a single round trip
+
+        :param orbit: krpc Orbit object
+        :param gravitationalParameter: the orbited body's, if the caller already knows it (saves a round trip)
+        :return: the LocalOrbit
+        """
+        client = batch.clientOf(orbit)
+
+        with batch.Batch(orbit) as b:
+            names = ('semi_major_axis', 'eccentricity', 'inclination', 'longitude_of_ascending_node',
+                     'argument_of_periapsis', 'mean_anomaly_at_epoch', 'epoch')
+            elements = [b.add(getattr, orbit, name) for name in names]
+            ut = b.add(getattr, client.space_center, 'ut')
+            body = b.add(getattr, orbit, 'body') if gravitationalParameter is None else None
+
+        if body is not None:
+            gravitationalParameter = body().gravitational_parameter
+
+        return cls(*[element() for element in elements],
+                   gravitationalParameter=gravitationalParameter, ut=ut())
+
+    @classmethod
+    def fromStateVectors(cls, position, velocity, gravitationalParameter, ut):
+        """
+        Work out the orbit passing through a position with a velocity
+
+        :param position: relative to the body's center, in the frame position_at uses
+        :param velocity: in the same frame
+        :param gravitationalParameter: of the body being orbited
+        :param ut: universal time of the state, which becomes the orbit's epoch
+        :return: the LocalOrbit
+        """
+        r = np.asarray(position, dtype=np.float64)
+        v = np.asarray(velocity, dtype=np.float64)
+        mu = gravitationalParameter
+
+        radius = np.linalg.norm(r)
+        h = np.cross(r, v)
+        hHat = h / np.linalg.norm(h)
+        eVector = ((v.dot(v) - mu / radius) * r - r.dot(v) * v) / mu
+        eccentricity = np.linalg.norm(eVector)
+        semiMajorAxis = 1.0 / (2.0 / radius - v.dot(v) / mu)
+
+        inclination = math.acos(max(-1.0, min(1.0, hHat[2])))
+
+        # the line of nodes, or the reference direction for an equatorial orbit where it doesn't exist
+        node = np.array([-h[1], h[0], 0.0])
+        if np.linalg.norm(node) > 1e-9 * np.linalg.norm(h):
+            node /= np.linalg.norm(node)
+            longitudeOfAscendingNode = math.atan2(node[1], node[0]) % TWO_PI
+        else:
+            node = np.array([1.0, 0.0, 0.0])
+            longitudeOfAscendingNode = 0.0
+
+        def angleFrom(a, b):
+            return math.atan2(np.cross(a, b).dot(hHat), a.dot(b))
+
+        if eccentricity > 1e-9:
+            argumentOfPeriapsis = angleFrom(node, eVector) % TWO_PI
+            trueAnomaly = angleFrom(eVector, r)
+        else:
+            # circular, so measure everything from the node
+            argumentOfPeriapsis = 0.0
+            trueAnomaly = angleFrom(node, r)
+
+        meanAnomaly = float(kepler.meanFromTrue(trueAnomaly, eccentricity))
+        return cls(semiMajorAxis, eccentricity, inclination, longitudeOfAscendingNode, argumentOfPeriapsis,
+                   meanAnomaly, ut, mu, ut=ut)
+
+    @property
+    def hyperbolic(self):
+        return self.eccentricity >= 1.0
+
+    @property
+    def period(self):
+        if self.hyperbolic:
+            return float('inf')
+        return TWO_PI / self.mean_motion
+
+    @property
+    def semi_latus_rectum(self):
+        return self.semi_major_axis * (1.0 - self.eccentricity ** 2)
+
+    @property
+    def periapsis(self):
+        return self.semi_major_axis * (1.0 - self.eccentricity)
+
+    @property
+    def apoapsis(self):
+        if self.hyperbolic:
+            return float('inf')
+        return self.semi_major_axis * (1.0 + self.eccentricity)
+
+    @property
+    def normal(self):
+        """
+        Unit vector along the orbit's angular momentum, in the same frame as position_at
+        """
+        return np.cross(self._p, self._q)
+
+    def mean_anomaly_at_ut(self, ut):
+        """
+        :param ut: universal time(s)
+        :return: mean anomaly in radians, wrapped to [0, 2pi) for closed orbits
+        """
+        M = self.mean_anomaly_at_epoch + self.mean_motion * (np.asarray(ut, dtype=np.float64) - self.epoch)
+        if not self.hyperbolic:
+            M = np.mod(M, TWO_PI)
+        return _result(M)
+
+    def eccentric_anomaly_at_ut(self, ut):
+        """
+        :return: eccentric (hyperbolic for open orbits) anomaly in radians
+        """
+        M = self.mean_anomaly_at_ut(ut)
+        if self.hyperbolic:
+            return _result(kepler.hyperbolicFromMean(M, self.eccentricity))
+        return _result(kepler.eccentricFromMean(M, self.eccentricity))
+
+    def true_anomaly_at_ut(self, ut):
+        """
+        :return: true anomaly in radians, in [0, 2pi) for closed orbits
+        """
+        E = self.eccentric_anomaly_at_ut(ut)
+        if self.hyperbolic:
+            return _result(kepler.trueFromHyperbolic(E, self.eccentricity))
+        return _result(np.mod(kepler.trueFromEccentric(E, self.eccentricity), TWO_PI))
+
+    def mean_anomaly_at_true_anomaly(self, trueAnomaly):
+        """
+        :return: mean anomaly in radians for the input true anomaly, unwrapped
+        """
+        return _result(kepler.meanFromTrue(trueAnomaly, self.eccentricity))
+
+    def true_anomaly_at_radius(self, radius):
+        """
+        :param radius: distance from the body's center, in meters
+        :return: the (positive) true anomaly at which the orbit reaches that radius, NaN if it never does
+        """
+        r = np.asarray(radius, dtype=np.float64)
+        cosNu = (self.semi_latus_rectum / r - 1.0) / self.eccentricity
+        with np.errstate(invalid='ignore'):
+            nu = np.where(np.abs(cosNu) <= 1.0, np.arccos(np.clip(cosNu, -1.0, 1.0)), np.nan)
+        return _result(nu)
+
+    def ut_at_true_anomaly(self, trueAnomaly, after=None):
+        """
+        :param trueAnomaly: true anomaly in radians
+        :param after: find the first time at or after this, defaults to when the snapshot was taken
+        :return: universal time the orbit next passes the input true anomaly
+        """
+        if after is None:
+            after = self.ut
+
+        M = np.asarray(self.mean_anomaly_at_true_anomaly(trueAnomaly))
+        ut = self.epoch + (M - self.mean_anomaly_at_epoch) / self.mean_motion
+
+        if not self.hyperbolic:
+            # step forward (or back) whole orbits to the first pass after the requested time
+            period = self.period
+            ut = ut + np.ceil((after - ut) / period) * period
+
+        return _result(ut)
+
+    def radius_at_true_anomaly(self, trueAnomaly):
+        """
+        :return: distance from the body's center at the input true anomaly
+        """
+        nu = np.asarray(trueAnomaly, dtype=np.float64)
+        return _result(self.semi_latus_rectum / (1.0 + self.eccentricity * np.cos(nu)))
+
+    def radius_at(self, ut):
+        """
+        :return: distance from the body's center at the input universal time(s)
+        """
+        E = self.eccentric_anomaly_at_ut(ut)
+        if self.hyperbolic:
+            return _result(self.semi_major_axis * (1.0 - self.eccentricity * np.cosh(E)))
+        return _result(self.semi_major_axis * (1.0 - self.eccentricity * np.cos(E)))
+
+    def orbital_speed_at(self, ut):
+        """
+        :return: orbital speed in m/s at the input universal time(s), from vis-viva
+        """
+        r = np.asarray(self.radius_at(ut))
+        return _result(np.sqrt(self.gravitational_parameter * (2.0 / r - 1.0 / self.semi_major_axis)))
+
+    def position_at(self, ut):
+        """
+        Position relative to the body's center in its inertial frame: x toward the reference direction
+        (longitude of ascending node 0), z along the body's rotation axis, right handed.
+        This is not one of krpc's reference frames.
+
+        :return: (3,) array for a single time, (N, 3) array for an array of times
+        """
+        nu = np.asarray(self.true_anomaly_at_ut(ut))
+        r = self.semi_latus_rectum / (1.0 + self.eccentricity * np.cos(nu))
+        x = (r * np.cos(nu))[..., np.newaxis]
+        y = (r * np.sin(nu))[..., np.newaxis]
+        return x * self._p + y * self._q
+
+    def velocity_at(self, ut):
+        """
+        Velocity in the same frame as position_at
+
+        :return: (3,) array for a single time, (N, 3) array for an array of times
+        """
+        nu = np.asarray(self.true_anomaly_at_ut(ut))
+        h = math.sqrt(self.gravitational_parameter * abs(self.semi_latus_rectum))
+        factor = self.gravitational_parameter / h
+        vx = (-factor * np.sin(nu))[..., np.newaxis]
+        vy = (factor * (self.eccentricity + np.cos(nu)))[..., np.newaxis]
+        return vx * self._p + vy * self._q
@@ -0,0 +1,134 @@
+"""
+Porkchop plots: delta-v over a grid of departure times and flight times
+
+Each grid point is a Lambert problem between where the origin is at departure and where the target
+is on arrival. The grid is solved in this process unless the caller asks for workers, in which case
+rows of the grid (one departure time each) are handed out in chunks to a process pool; every worker
+writes its rows straight into one shared-memory grid, so nothing but the chunk bounds gets pickled on
+the way back.
+
+    origin = orbit.LocalOrbit.fromOrbit(kerbin.orbit)
+    target = orbit.LocalOrbit.fromOrbit(duna.orbit)
+    result = porkchop.search(origin, target, departures, timesOfFlight, workers=None)
+    print(result.departure, result.timeOfFlight, result.deltaV)
+
+Starting a pool costs a process per worker, each importing NumPy and kspy, and those processes take
+the cores a flight's control loops want. That only pays off for big, standalone searches like
+scripts/transferWindow.py, so the pool is opt-in.
+
+Both orbits have to be around the same body, since they're compared in that body's inertial frame.
+"""
+from __future__ import print_function, absolute_import, division
+
+import collections
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from . import lambert
+
+Porkchop = collections.namedtuple('Porkchop', 'departures timesOfFlight grid departure timeOfFlight deltaV')
+
+
+def transferDeltaV(origin, target, departures, timesOfFlight, rendezvous=True):
+    """
+    Delta-v for every combination of the input departure times and flight times, in this process
+
+    :param origin: orbit.LocalOrbit we're leaving from
+    :param target: orbit.LocalOrbit we're going to, around the same body
+    :param departures: (N,) array of departure times, in seconds since world start
+    :param timesOfFlight: (M,) array of flight times, in seconds
+    :param rendezvous: include the burn to match the target's velocity on arrival,
+                       otherwise it's just the departure burn (for a flyby or aerocapture)
+
+    :return: (N, M) array of delta-v in m/s, NaN where there's no transfer
+    """
+    departures = np.asarray(departures, dtype=np.float64)
+    timesOfFlight = np.asarray(timesOfFlight, dtype=np.float64)
+    arrivals = departures[:, np.newaxis] + timesOfFlight[np.newaxis, :]
+
+    r1 = origin.position_at(departures)
+    v1 = origin.velocity_at(departures)
+    r2 = target.position_at(arrivals)
+    v2 = target.velocity_at(arrivals)
+
+    transferV1, transferV2 = lambert.solve(r1[:, np.newaxis, :], r2, timesOfFlight[np.newaxis, :],
+                                           origin.gravitational_parameter, normal=origin.normal)
+
+    deltaV = np.linalg.norm(transferV1 - v1[:, np.newaxis, :], axis=-1)
+    if rendezvous:
+        deltaV += np.linalg.norm(v2 - transferV2, axis=-1)
+    return deltaV
+
+
+def _evaluateRows(name, shape, origin, target, departures, timesOfFlight, rendezvous, start, stop):
+    """
+    Fill in rows start:stop of the shared grid called name
+    """
+    memory = shared_memory.SharedMemory(name=name)
+    try:
+        grid = np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+        grid[start:stop] = transferDeltaV(origin, target, departures[start:stop], timesOfFlight, rendezvous)
+        del grid
+    finally:
+        memory.close()
+    return start, stop
+
+
+def search(origin, target, departures, timesOfFlight, rendezvous=True, workers=1, chunkSize=None):
+    """
+    Find the cheapest transfer over a grid of departure times and flight times
+
+    :param origin: orbit.LocalOrbit we're leaving from
+    :param target: orbit.LocalOrbit we're going to, around the same body
+    :param departures: array of departure times, in seconds since world start
+    :param timesOfFlight: array of flight times, in seconds
+    :param rendezvous: include the arrival burn, see transferDeltaV
+    :param workers: processes to spread the grid over, None for one per core. The default of 1 runs in
+                    this process
+    :param chunkSize: departure rows per task, defaults to splitting the grid into a few tasks per worker
+
+    :return: Porkchop of the inputs, the full (departures x timesOfFlight) delta-v grid,
+             and the departure time, flight time and delta-v of the cheapest transfer on it
+    """
+    departures = np.asarray(departures, dtype=np.float64)
+    timesOfFlight = np.asarray(timesOfFlight, dtype=np.float64)
+    shape = (departures.size, timesOfFlight.size)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, shape[0]))
+
+    if workers == 1:
+        grid = transferDeltaV(origin, target, departures, timesOfFlight, rendezvous)
+        return _best(departures, timesOfFlight, grid)
+
+    if chunkSize is None:
+        chunkSize = max(1, -(-shape[0] // (workers * 4)))
+
+    memory = shared_memory.SharedMemory(create=True, size=max(1, shape[0] * shape[1] * 8))
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            tasks = [pool.submit(_evaluateRows, memory.name, shape, origin, target, departures, timesOfFlight,
+                                 rendezvous, start, min(start + chunkSize, shape[0]))
+                     for start in range(0, shape[0], chunkSize)]
+            for task in tasks:
+                task.result()
+
+        grid = np.ndarray(shape, dtype=np.float64, buffer=memory.buf).copy()
+    finally:
+        memory.close()
+        memory.unlink()
+
+    return _best(departures, timesOfFlight, grid)
+
+
+def _best(departures, timesOfFlight, grid):
+    if np.all(np.isnan(grid)):
+        raise ValueError("No transfers found anywhere on the grid")
+
+    i, j = np.unravel_index(np.nanargmin(grid), grid.shape)
+    return Porkchop(departures, timesOfFlight, grid,
+                    float(departures[i]), float(timesOfFlight[j]), float(grid[i, j]))
@@ -8,7 +8,10 @@ import time
 
 import krpc
 
+from . import bodies
+from . import controls
 from . import docking
+from . import executor
 from . import launch
 from . import landing
 from . import maneuvers
@@ -16,6 +19,7 @@ from . import node
 from . import maths
 from . import rendezvous
 from . import rover
+from . import scheduler
 from . import utils
 from .pid import PID
 
@@ -41,6 +45,9 @@ def Dock(connection, speedLimit=1.0):
     ap.target_direction = tuple(x * -1 for x in t.direction(rf))
     ap.engage()
 
+    # RCS inputs only go to the server when they've moved
+    buffer = controls.ControlBuffer(v)
+
     # create PIDs
     upPID = PID(.75, .25, 1)
     rightPID = PID(.75, .25, 1)
@@ -64,9 +71,10 @@ def Dock(connection, speedLimit=1.0):
         rightPID.setpoint(setpoints.right)
         forwardPID.setpoint(setpoints.forward)
 
-        v.control.up = -upPID.update(velocity.up)  # steer vessel
-        v.control.right = -rightPID.update(velocity.right)
-        v.control.forward = -forwardPID.update(velocity.forward)
+        buffer.control.up = -upPID.update(velocity.up)  # steer vessel
+        buffer.control.right = -rightPID.update(velocity.right)
+        buffer.control.forward = -forwardPID.update(velocity.forward)
+        buffer.flush()
 
         time.sleep(.05)
 
@@ -96,12 +104,15 @@ def ExecuteNextManeuver(connection=None, vessel=None, maneuverNode=None, autoSta
     if autoStage:
         autoStager()
 
-    # maneuver control loop
-    while not doManeuver():
-        if autoStage:
+    def tick():
+        done = doManeuver()
+        if not done and autoStage:
             autoStager()
+        return done
 
-        time.sleep(0.05)
+    # maneuver control loop
+    scheduler.Scheduler.forProgram(doManeuver).runUntil(tick)
+    autoStager.release()
 
     vessel.control.sas = True
     vessel.control.throttle = 0.0
@@ -138,7 +149,7 @@ def Launch(connection=None,
     if not vessel:
         vessel = connection.space_center.active_vessel
 
-    ut = connection.add_stream(getattr, connection.space_center, 'ut')
+    ut = utils.streams(connection).add_ut()
 
     # if we've set a LAN, warp to it and creep up on it
     if longitudeOfAscendingNode:
@@ -150,12 +161,15 @@ def Launch(connection=None,
             print("warping to launch window")
             connection.space_center.warp_to(warpToTime - 20)
 
-        currentSolarLongitude = math.radians(vessel.flight().longitude) + vessel.orbit.body.rotation_angle
-        while warpToTime > (ut() - 3):
-            print("waiting to get close to the window {} {}".format(currentSolarLongitude, longitudeOfAscendingNode))
+        def waitForWindow():
+            if warpToTime <= (ut() - 3):
+                return False
+
             currentSolarLongitude = math.radians(vessel.flight().longitude) + vessel.orbit.body.rotation_angle
+            print("waiting to get close to the window {} {}".format(currentSolarLongitude, longitudeOfAscendingNode))
+            return True
 
-            time.sleep(0.01)
+        scheduler.Scheduler(10, "LaunchWindow").runWhile(waitForWindow)
 
     ascend = launch.Ascend(connection, vessel, targetAltitude=altitude, targetInclination=targetInclination)
     aborter = utils.Abort(vessel)
@@ -169,18 +183,22 @@ def Launch(connection=None,
     # trigger the next stage to get us going
     vessel.control.activate_next_stage()
 
-    # launch control loop
-    while not ascend() and not aborter():
-        if autoStage:
-            staging()
-
-        if deployFairings:
-            fairing()
+    # launch control loop, abort checks run far more often than anything else and fairings far less.
+    # The executor releases each program as it finishes and whatever's left once the ascent is done
+    launchControl = executor.Executor(connection, vessel)
+    abortCheck = launchControl.add(aborter, rate=50, priority=10, background=True, final=True)
+    launchControl.add(ascend, rate=20, priority=5)
+    if autoStage:
+        # staging checks don't go to the server until it's time to stage, so they can run as often as aborts
+        launchControl.add(staging, rate=50, priority=1, finishOn=None, background=True)
+    if deployFairings:
+        launchControl.add(fairing, rate=1, background=True)
 
-        time.sleep(0.1)
+    aborted = launchControl.run() is abortCheck
+    ut.release()
 
     # if we aborted, kill the throttle and bail out
-    if aborter():
+    if aborted:
         vessel.control.throttle = 0.0
         return False
 
@@ -219,8 +237,7 @@ def Hover(connection=None, vessel=None):
         vessel.control.activate_next_stage()
 
     # hover control loop, keep it going until we've been bailed out
-    while hover():
-        time.sleep(0.01)
+    scheduler.Scheduler.forProgram(hover).runWhile(hover)
 
     vessel.control.throttle = 0.0
     vessel.control.sas = True
@@ -243,9 +260,9 @@ def LandAnywhere(connection=None, vessel=None):
         vessel = connection.space_center.active_vessel
 
     flight = vessel.flight(vessel.orbit.body.reference_frame)
-    ut = connection.add_stream(getattr, connection.space_center, 'ut')
+    ut = utils.streams(connection).add_ut()
 
-    radius = vessel.orbit.body.equatorial_radius
+    radius = bodies.constants(vessel.orbit.body).equatorial_radius
 
     apoapsis = vessel.orbit.apoapsis_altitude
     periapsis = vessel.orbit.periapsis_altitude
@@ -266,6 +283,8 @@ def LandAnywhere(connection=None, vessel=None):
         deorbitPeriapsisNode = maneuvers.changePeriapsis(deorbitPeriapsisHeight, connection, vessel, ut()+300)
         ExecuteNextManeuver(connection, vessel, maneuverNode=deorbitPeriapsisNode)
 
+    ut.release()
+
     # now that we've set ourselves up on a suborbital trajectory, hand it over to the soft landing mode
     SoftLanding(connection, vessel)
 
@@ -287,13 +306,11 @@ def SoftLanding(connection=None, vessel=None):
         vessel = connection.space_center.active_vessel
 
     descend = landing.Descend(connection, vessel)
-    while descend():
-        time.sleep(0.01)
+    scheduler.Scheduler.forProgram(descend).runWhile(descend)
 
     vessel.control.gear = True
     softTouchdown = landing.SoftTouchdown(vessel)
-    while softTouchdown():
-        time.sleep(0.01)
+    scheduler.Scheduler.forProgram(softTouchdown).runWhile(softTouchdown)
 
     vessel.control.throttle = 0.0
     vessel.control.sas = True
@@ -302,7 +319,7 @@ def SoftLanding(connection=None, vessel=None):
     return True
 
 
-def RendezvousWithTarget(connection=None, vessel=None, separation=None):
+def RendezvousWithTarget(connection=None, vessel=None, separation=None, lambert=False):
     """
     Given the input connection and vessel, plot and execute a rendezvous with the active target
 
@@ -311,6 +328,7 @@ def RendezvousWithTarget(connection=None, vessel=None, separation=None):
     :param connection: Connection to plot for, will use default if none provided
     :param vessel: vessel to plot for, will use active if none provided
     :param separation: how far away from the target do we want to be. If none, will use defaults (400m, or edge of SOI)
+    :param lambert: plot the transfer from a porkchop search instead of assuming circular, coplanar orbits
     """
     if not connection:
         connection = utils.defaultConnection("Rendevous")
@@ -332,16 +350,19 @@ def RendezvousWithTarget(connection=None, vessel=None, separation=None):
 
     print("plotting maneuver")
     # plot the maneuver to meet our target
-    hohmannTransfer = maneuvers.hohmannTransfer(connection, vessel, target)
+    if lambert:
+        transfer = maneuvers.lambertTransfer(connection, vessel, target)
+    else:
+        transfer = maneuvers.hohmannTransfer(connection, vessel, target)
 
     # if we're targeting a vessel, we can go ahead and try to get closer to it
     if targetVessel:
-        ExecuteNextManeuver(connection, vessel, hohmannTransfer)
+        ExecuteNextManeuver(connection, vessel, transfer)
 
         # then, plot a maneuver that should roughly match our two vessels' orbits at closest approach
         timeOfClosestApproach = vessel.orbit.time_of_closest_approach(target.orbit)
 
-        altitudeAtClosest = target.orbit.radius_at(timeOfClosestApproach) - target.orbit.body.equatorial_radius
+        altitudeAtClosest = target.orbit.radius_at(timeOfClosestApproach) - bodies.constants(target.orbit.body).equatorial_radius
 
         maneuverNode = maneuvers.changeApoapsis(altitudeAtClosest, connection, vessel, timeOfClosestApproach)
 
@@ -359,13 +380,12 @@ def RendezvousWithTarget(connection=None, vessel=None, separation=None):
         rendezvous.getCloser(connection, vessel, target, closeDistance=separation)
 
     else:
-        # plot our hohmann transfer
-        doManeuver = node.ExecuteManeuver(connection, vessel, hohmannTransfer, tuneTime=10)
+        # execute our transfer
+        doManeuver = node.ExecuteManeuver(connection, vessel, transfer, tuneTime=10)
 
         # if there's a "next_orbit" that means we're breaking out of our SOI
         # and that's all we need for body rendezvous
-        while not doManeuver() and not vessel.orbit.next_orbit:
-            time.sleep(0.05)
+        scheduler.Scheduler.forProgram(doManeuver).runUntil(lambda: doManeuver() or vessel.orbit.next_orbit)
 
         # kill the autopilot
         vessel.control.sas = True
@@ -373,7 +393,7 @@ def RendezvousWithTarget(connection=None, vessel=None, separation=None):
         vessel.auto_pilot.disengage()
 
         # remove the node now that we're done with it
-        hohmannTransfer.remove()
+        transfer.remove()
 
         # warp to SOI change
         connection.space_center.warp_to(connection.space_center.ut + vessel.orbit.time_to_soi_change)
@@ -418,9 +438,14 @@ def DeorbitIntoAtmosphere(connection=None, vessel=None):
     print("jettisoning everything")
     vessel.control.activate_next_stage()
 
-    while vessel.flight().surface_altitude > 10000:
+    def holdRetrograde():
+        if vessel.flight().surface_altitude <= 10000:
+            return False
+
         vessel.auto_pilot.target_direction = vessel.flight(vessel.surface_reference_frame).retrograde
-        time.sleep(0.1)
+        return True
+
+    scheduler.Scheduler(10, "Deorbit").runWhile(holdRetrograde)
 
     # TODO this is a dumb way to deploy fairings
     vessel.control.activate_next_stage()
@@ -458,8 +483,7 @@ def RoveToTarget(connection=None, vessel=None, target=None, saveInterval=120, ma
     roverGo = rover.RoverGo(connection, vessel, wp1, maxSpeed, savetime=saveInterval)
 
     # call the rover autopilot
-    while not roverGo():
-        time.sleep(0.01)
+    scheduler.Scheduler.forProgram(roverGo).runUntil(roverGo)
 
     # remove the waypoint when the function returns
     wp1.remove()
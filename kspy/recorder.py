@@ -0,0 +1,288 @@
+"""
+Constant-memory telemetry recording: streams sampled at a fixed UT rate into preallocated NumPy
+columns, written out to disk in chunks on a background thread
+
+    streams = utils.streams(connection)
+    writer = recorder.CsvWriter('reentry.csv')
+    rec = recorder.Recorder(connection, [recorder.Channel('alt', streams.add_flight(vessel, 'mean_altitude')),
+                                         recorder.Channel('speed', streams.add_flight(vessel, 'speed'))],
+                            interval=0.1, writer=writer)
+    scheduler.Scheduler.forProgram(rec).runWhile(rec)
+
+Every channel gets one column with a fixed dtype (vector channels take a shaped dtype, like
+np.dtype((np.float64, 3))), and the columns are split into chunks. Samples fill one chunk at a time;
+a full chunk is handed to the writer thread and only reused once it's been written out, so recording
+never allocates per sample and a long session costs the same memory as a short one. Partial chunks
+get written every flushInterval seconds too, so a crash loses at most that much.
+
+A 'ut' column holding the sample times always comes first.
+"""
+from __future__ import print_function, absolute_import, division
+
+import collections
+import threading
+import time
+
+import numpy as np
+
+from . import utils
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# a named column: the stream (or any callable) read for every sample, and what the column holds
+Channel = collections.namedtuple('Channel', 'name stream dtype')
+Channel.__new__.__defaults__ = (np.float64,)
+
+
+class RecorderError(Exception):
+    pass
+
+
+class CsvWriter(object):
+    """
+    Writes chunks to a CSV file with a header row, vector channels spread over one column per element
+    """
+    def __init__(self, path, fmt='%.17g'):
+        """
+        :param path: the file to write, replaced if it exists
+        :param fmt: numpy format for every value
+        """
+        self.path = path
+        self.fmt = fmt
+        self.fh = None
+
+    def open(self, columns):
+        """
+        :param columns: ordered {name: numpy dtype} of everything we'll be given
+        """
+        names = []
+        for name, dtype in columns.items():
+            count = int(np.prod(dtype.shape))
+            names.extend([name] if not dtype.shape else ['{0}_{1}'.format(name, i) for i in range(count)])
+
+        self.fh = open(self.path, 'w')
+        self.fh.write(','.join(names) + '\n')
+        self.fh.flush()
+
+    def write(self, columns):
+        """
+        :param columns: ordered {name: array} of the samples to append, all the same length
+        """
+        table = np.column_stack([column.reshape(len(column), -1) for column in columns.values()])
+        np.savetxt(self.fh, table, fmt=self.fmt, delimiter=',')
+        self.fh.flush()
+
+    def close(self):
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+
+
+class Recorder(utils.Program):
+    """
+    Samples a set of streams every interval seconds of UT, and has a writer put them on disk
+    """
+    def __init__(self, connection, channels, interval=0.1, writer=None, chunkSize=1024, chunks=4,
+                 flushInterval=5.0, prettyName='Recorder'):
+        """
+        :param connection: krpc.Connection the streams live on
+        :param channels: Channels to record, in column order
+        :param interval: seconds of UT between samples
+        :param writer: what to write chunks with, like CsvWriter or flightlog.FlightLogWriter.
+                        None keeps the samples in memory only, see tail
+        :param chunkSize: samples per chunk
+        :param chunks: how many chunks the ring holds, recording waits on the writer once they're all full
+        :param flushInterval: wall clock seconds before a partly filled chunk gets written anyway
+        :param prettyName: name of the program
+        """
+        super(Recorder, self).__init__(prettyName)
+
+        if interval <= 0:
+            raise ValueError("Recorder needs a positive sampling interval")
+        if chunks < 2:
+            raise ValueError("Recorder needs at least two chunks, one to fill while the other is written")
+
+        # sample a little faster than the interval, so the UT grid doesn't alias with the tick rate
+        self.rate = 2.0 / interval
+
+        self.connection = connection
+        self.interval = interval
+        self.writer = writer
+        self.chunkSize = chunkSize
+        self.chunks = chunks
+        self.flushInterval = flushInterval
+
+        self.ut = self.holdStream(utils.streams(connection).add_ut())
+        self.channels = [Channel('ut', self.ut, np.float64)]
+        for channel in channels:
+            if channel.name == 'ut':
+                raise ValueError("'ut' is recorded already")
+            self.channels.append(channel)
+            if hasattr(channel.stream, 'release'):
+                self.holdStream(channel.stream)
+
+        capacity = chunkSize * chunks
+        self.columns = collections.OrderedDict((channel.name, np.zeros(capacity, dtype=np.dtype(channel.dtype)))
+                                               for channel in self.channels)
+        self._reads = [(self.columns[channel.name], channel.stream) for channel in self.channels]
+
+        self.samples = 0  # recorded so far
+        self.stalls = 0  # times we've had to wait on the writer for a free chunk
+        self.nextUT = None
+
+        self._position = 0  # next slot in the ring
+        self._chunkStart = 0  # first slot of the chunk being filled
+        self._chunkOpened = None  # when the chunk being filled got its first sample
+        self._held = False  # whether we hold the chunk being filled
+        self._filled = [0] * chunks  # samples in each chunk, as of when it was last handed on
+
+        self._free = threading.Semaphore(chunks)
+        self._pending = queue.Queue()
+        self._error = None
+        self._thread = None
+
+        if writer is not None:
+            writer.open(collections.OrderedDict((channel.name, np.dtype(channel.dtype)) for channel in self.channels))
+            self._thread = threading.Thread(target=self._write)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def __call__(self, frame=None):
+        """
+        Take a sample if it's time to
+
+        :return: True, recording goes on until released
+        """
+        if self._error is not None:
+            raise RecorderError("Writing {0} failed: {1!r}".format(self.prettyName, self._error))
+
+        ut = self.ut()
+        if self.nextUT is not None and ut < self.nextUT:
+            self._flushIfStale()
+            return True
+
+        self._sample(ut)
+
+        # stay on the grid, unless we've fallen a whole interval behind it
+        self.nextUT = ut + self.interval if self.nextUT is None else self.nextUT + self.interval
+        if self.nextUT <= ut:
+            self.nextUT = ut + self.interval
+
+        self._flushIfStale()
+        return True
+
+    def displayValues(self):
+        return ['{0} samples'.format(self.samples)]
+
+    def _sample(self, ut):
+        if not self._held:
+            self._acquire()
+
+        position = self._position
+        self.columns['ut'][position] = ut
+        for column, stream in self._reads[1:]:
+            column[position] = stream()
+
+        self._position = position + 1
+        self.samples += 1
+
+        if self._position - self._chunkStart == self.chunkSize:
+            self.flush()
+
+    def _acquire(self):
+        if not self._free.acquire(False):
+            self.stalls += 1
+            self._free.acquire()
+
+        self._held = True
+        self._chunkStart = self._position
+        self._filled[self._chunkStart // self.chunkSize] = 0
+        self._chunkOpened = time.monotonic()
+
+    def _flushIfStale(self):
+        if self._held and self._position > self._chunkStart and \
+                time.monotonic() - self._chunkOpened >= self.flushInterval:
+            self.flush()
+
+    def flush(self):
+        """
+        Hand whatever's in the chunk being filled to the writer, the next sample starts a new chunk
+        """
+        if not self._held:
+            return
+
+        start, end = self._chunkStart, self._position
+        self._filled[start // self.chunkSize] = end - start
+        self._held = False
+        # the next chunk starts on a chunk boundary, leaving the rest of this one unused
+        self._position = (self._chunkStart + self.chunkSize) % (self.chunkSize * self.chunks)
+
+        if self._thread is None or end == start:
+            self._free.release()
+        else:
+            self._pending.put((start, end))
+
+    def _write(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+
+            start, end = item
+            try:
+                if self._error is None:
+                    self.writer.write(collections.OrderedDict((name, column[start:end])
+                                                              for name, column in self.columns.items()))
+            except Exception as e:
+                self._error = e
+            finally:
+                self._free.release()
+
+    def tail(self, count=None):
+        """
+        Get the most recent samples still held in the ring, up to chunkSize * chunks of them
+
+        :param count: at most this many samples, defaults to all of them
+        :return: ordered {name: array} of copies, oldest first
+        """
+        current = self._chunkStart // self.chunkSize
+        index = current if self._held else (current - 1) % self.chunks
+        if self._held:
+            self._filled[current] = self._position - self._chunkStart
+
+        # walk back through the chunks, which may have been written out before they filled up
+        slices = []
+        total = 0
+        for _ in range(self.chunks):
+            filled = self._filled[index]
+            if not filled or (count is not None and total >= count):
+                break
+            slices.insert(0, slice(index * self.chunkSize, index * self.chunkSize + filled))
+            total += filled
+            index = (index - 1) % self.chunks
+
+        result = collections.OrderedDict()
+        for name, column in self.columns.items():
+            values = np.concatenate([column[part] for part in slices]) if slices else column[:0].copy()
+            result[name] = values if count is None else values[len(values) - min(count, len(values)):]
+        return result
+
+    def release(self):
+        """
+        Write out everything recorded, close the writer and release every stream
+        """
+        self.flush()
+
+        if self._thread is not None:
+            self._pending.put(None)
+            self._thread.join()
+            self._thread = None
+            self.writer.close()
+
+        super(Recorder, self).release()
+
+        if self._error is not None:
+            raise RecorderError("Writing {0} failed: {1!r}".format(self.prettyName, self._error))
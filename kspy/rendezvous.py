@@ -6,18 +6,22 @@ from __future__ import absolute_import, print_function, division
 import math
 import time
 
+import numpy as np
+
+from . import bodies
 from . import maths
+from . import orbit
 
 
 def getPhaseAngle(vessel, target):
     """
     Return the relative phase angle between the orbit of two objects
 
-    :param vessel: the vessel whose orbit we want to check for
-    :param target: the target body or vessel whose orbit we want to pahse of
+    :param vessel: the vessel whose orbit we want to check for, or an orbit.LocalOrbit of it
+    :param target: the target body or vessel whose orbit we want to pahse of, or an orbit.LocalOrbit of it
     """
-    vo = vessel.orbit
-    to = target.orbit
+    vo = vessel if isinstance(vessel, orbit.LocalOrbit) else vessel.orbit
+    to = target if isinstance(target, orbit.LocalOrbit) else target.orbit
     h = (vo.semi_major_axis + to.semi_major_axis) / 2  # SMA of transfer orbit
 
     # calculate the percentage of the target orbit that goes by during the half period of transfer orbit
@@ -33,10 +37,15 @@ def orbitalProgress(vessel, ut):
     """
     returns the orbital progress in radians, referenced to the planet's origin
     of longitude.
+
+    :param vessel: the vessel (or body) to check, or an orbit.LocalOrbit snapshot of its orbit,
+                   which also lets ut be an array of times
+    :param ut: when to check, in seconds since world start
     """
-    lan = vessel.orbit.longitude_of_ascending_node
-    arg_p = vessel.orbit.argument_of_periapsis
-    ma_ut = vessel.orbit.mean_anomaly_at_ut(ut)
+    o = vessel if isinstance(vessel, orbit.LocalOrbit) else vessel.orbit
+    lan = o.longitude_of_ascending_node
+    arg_p = o.argument_of_periapsis
+    ma_ut = o.mean_anomaly_at_ut(ut)
     return maths.clamp_2pi(lan + arg_p + ma_ut)
 
 
@@ -76,42 +85,79 @@ def target_vminus(v, t):
     return maths.v3minus(t.velocity(rf), v.velocity(rf))
 
 
-def timeTransfer(vessel, target, ut, phaseAngle):
+def phaseError(vessel, target, ut, phaseAngle):
+    """
+    How far the vessel and target are from having the input relative phase angle
+
+    :param vessel: orbit.LocalOrbit of the vessel that will rendezvous
+    :param target: orbit.LocalOrbit of the thing we want to rendezvous with
+    :param ut: time(s) to check, in seconds since world start
+    :param phaseAngle: the phase angle we're looking for
+
+    :return: the error in radians, wrapped to [-pi, pi)
     """
-    Performs an iterative search for the next time vessel and target
-    have the given relative phase_angle after ut
-    :param vessel: that will rendezvous
-    :param target: the thing we want to rendezvous with
+    v_pos = orbitalProgress(vessel, ut)
+    t_pos = orbitalProgress(target, ut)
+    return maths.wrap_pi(t_pos - (v_pos - math.pi) - phaseAngle)
+
+
+def timeTransfer(vessel, target, ut, phaseAngle, horizon=None, tolerance=0.01):
+    """
+    Find the next time vessel and target have the given relative phase_angle after ut
+
+    The phase error is evaluated over a dense grid of times in one vectorized pass over local
+    orbit snapshots, and the first zero crossing is then refined with a bracketing root finder.
+
+    :param vessel: that will rendezvous, or an orbit.LocalOrbit of its orbit
+    :param target: the thing we want to rendezvous with, or an orbit.LocalOrbit of its orbit
     :param ut: when we're starting the search in seconds since world start
     :param phaseAngle: the calculated ideal phase angle for the search
+    :param horizon: how far past ut (in seconds) to search, defaults to two synodic periods
+    :param tolerance: how precisely (in seconds) to pin down the transfer time
 
     :return: time at which we should perform the hohmann transfer burn
     """
-    # rough unbound search
-    while True:
-        v_pos = orbitalProgress(vessel, ut)
-        t_pos = orbitalProgress(target, ut)
-        angle_error = math.fabs(t_pos - (v_pos - math.pi) - phaseAngle)
-        if angle_error < .01:
-            break
-        ut += 10
-    ut -= 10
+    # snapshot both orbits once, so the search doesn't need the server at all
+    if not isinstance(vessel, orbit.LocalOrbit):
+        vessel = orbit.LocalOrbit.fromOrbit(vessel.orbit)
+    if not isinstance(target, orbit.LocalOrbit):
+        target = orbit.LocalOrbit.fromOrbit(target.orbit)
+
+    relativeMotion = abs(vessel.mean_motion - target.mean_motion)
+
+    if horizon is None:
+        if relativeMotion < 1e-12:
+            raise ValueError("Vessel and target orbit at the same rate, their phase angle never changes")
+        horizon = 2 * (2 * math.pi / relativeMotion)
+
+    # sample densely enough that the error never moves more than ~10 degrees between samples
+    fastest = max(vessel.mean_motion, target.mean_motion)
+    step = math.radians(10) / max(fastest, relativeMotion)
+    count = int(min(max(horizon / step, 2), 1000000)) + 1
+    times = np.linspace(ut, ut + horizon, count)
+    errors = phaseError(vessel, target, times, phaseAngle)
+
+    # a real crossing goes through zero, as opposed to the jump where the error wraps around at +-pi
+    crossings = np.nonzero((np.sign(errors[:-1]) != np.sign(errors[1:])) &
+                           (np.abs(errors[:-1]) < math.pi / 2) &
+                           (np.abs(errors[1:]) < math.pi / 2))[0]
 
-    print("switching to fine unbound search")
+    if errors[0] == 0:
+        return float(ut)
 
-    # fine unbound search
-    while True:
-        v_pos = orbitalProgress(vessel, ut)
-        t_pos = orbitalProgress(target, ut)
-        angle_error = math.fabs(t_pos - (v_pos - math.pi) - phaseAngle)
-        if angle_error < .001:
-            break
-        ut += 1
+    if not len(crossings):
+        raise ValueError("No transfer window within {0} seconds of {1}".format(horizon, ut))
 
-    return ut
+    i = crossings[0]
+    return maths.bracketedRoot(lambda t: float(phaseError(vessel, target, t, phaseAngle)),
+                               float(times[i]), float(times[i + 1]), tolerance=tolerance)
 
 
-def getCloser(connection, vessel, target, closeDistance=400):
+def _stopped(stop):
+    return stop is not None and stop.is_set()
+
+
+def getCloser(connection, vessel, target, closeDistance=400, stop=None):
     """
     Short program to get two vessels closer together in orbit
 
@@ -121,15 +167,16 @@ def getCloser(connection, vessel, target, closeDistance=400):
     :param vessel: the vessel to control
     :param target: the thing we want to get closer to
     :param closeDistance: how close before we cut off
+    :param stop: optional threading.Event, give up (with the throttle off) once it's set
     """
-    matchv(connection, vessel, target)
-    while maths.distance(vessel, target) > closeDistance:
-        close_dist(vessel, target)
+    matchv(connection, vessel, target, stop)
+    while maths.distance(vessel, target) > closeDistance and not _stopped(stop):
+        close_dist(vessel, target, stop)
 
-        matchv(connection, vessel, target)
+        matchv(connection, vessel, target, stop)
 
 
-def matchv(connection, vessel, target):
+def matchv(connection, vessel, target, stop=None):
     """
     program to match active vessel's velocity to target's at the
     point of closest approach
@@ -137,13 +184,17 @@ def matchv(connection, vessel, target):
     :param connection: connection to use
     :param vessel: vessel to control
     :param target: thing to match velocities with
+    :param stop: optional threading.Event, give up (with the throttle off) once it's set
     """
+    if _stopped(stop):
+        return
+
     # Calculate the length and start of burn
     m = vessel.mass
     isp = vessel.specific_impulse
     dv = maths.speed(vessel, target)
     F = vessel.available_thrust
-    G = vessel.orbit.body.surface_gravity
+    G = bodies.constants(vessel.orbit.body).surface_gravity
     burn_time = (m - (m / math.exp(dv / (isp * G)))) / (F / (isp * G))
 
     ## Orient vessel to negative target relative velocity
@@ -156,12 +207,12 @@ def matchv(connection, vessel, target):
     # wait for the time to burn
     burn_start = vessel.orbit.time_of_closest_approach(target.orbit) - (burn_time / 1.9)
     connection.space_center.warp_to(burn_start - 10)
-    while connection.space_center.ut < burn_start:
+    while connection.space_center.ut < burn_start and not _stopped(stop):
         ap.target_direction = target_vminus(vessel, target)
         time.sleep(.5)
 
     # burn
-    while maths.speed(vessel, target) > .1:
+    while maths.speed(vessel, target) > .1 and not _stopped(stop):
         ap.target_direction = target_vminus(vessel, target)
         vessel.control.throttle = maths.speed(vessel, target) / 20.0
 
@@ -170,14 +221,18 @@ def matchv(connection, vessel, target):
     ap.disengage()
 
 
-def close_dist(vessel, target):
+def close_dist(vessel, target, stop=None):
     """
     Function to close distance between active and target vessels.
     Sets approach speed to 1/200 of separation at time of burn.
 
     :param vessel: the vessel to control
     :param target: the thing we're getting close to
+    :param stop: optional threading.Event, give up (with the throttle off) once it's set
     """
+    if _stopped(stop):
+        return
+
     # orient vessel to target
     ap = vessel.auto_pilot
     ap.reference_frame = vessel.orbital_reference_frame
@@ -189,7 +244,7 @@ def close_dist(vessel, target):
 
     # calculate and burn
     targetSpeed = maths.distance(vessel, target) / 200.0
-    while targetSpeed - maths.speed(vessel, target) > .1:
+    while targetSpeed - maths.speed(vessel, target) > .1 and not _stopped(stop):
         ap.target_direction = posi_target(vessel, target)
         vessel.control.throttle = (targetSpeed - maths.speed(vessel, target)) / 20.0  # todo smooth throttle
 
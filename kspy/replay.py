@@ -0,0 +1,594 @@
+"""
+Fly programs against a recorded flight log instead of the game
+
+Record a mission once, with every telemetry field a program might read:
+
+    rec = replay.record(connection, vessel, flightlog.logPath('Ascent'))
+    ...fly it, ticking rec alongside...
+    rec.release()
+
+and it can then be replayed as often as we like, as fast as the CPU allows:
+
+    connection = replay.ReplayConnection(flightlog.logPath('Ascent'))
+    vessel = connection.space_center.active_vessel
+    connection.run(launch.Ascend(connection, vessel, 80000))
+    print(connection.compare('throttle'))
+
+A ReplayConnection serves ut, and the vessel's flight, orbit, vessel and control attributes (as
+attribute reads and as streams) out of the log, as of the replay's current UT. Time only moves when
+whatever is running the program sleeps, so a replay is deterministic and its wall time is just the
+program's own cost: a performance and regression benchmark for the program.
+
+Nothing the program does changes what it reads next, the log is played back as it was flown. Every
+control and autopilot write or call is kept in commands instead, so it can be compared with what was
+sent the first time round. Anything that wasn't recorded (part modules, transforms) raises ReplayError.
+
+A landing reads more than DEFAULT_FIELDS: record one with names=DEFAULT_FIELDS + DESCENT_FIELDS to be
+able to replay landing.Descend.
+
+Terrain isn't in the log itself. Programs that sample terrain through a heightmap-backed
+terrain.TerrainCache (Descend does) leave every sample they fetched in the body's heightmap, so the
+log just says which solar system the flight was in, and the replay's body serves surface_height out of
+that heightmap. Terrain the flight never sampled raises ReplayError.
+
+Channels are named after kspy.telemetry.FIELDS ('meanAltitude', 'velocity', ...), or
+'source.attribute' for anything else ('flight.surface_altitude', 'orbit.semi_major_axis'), where the
+source is flight, orbit, vessel or control. The body's constants go in the log's metadata.
+"""
+from __future__ import print_function, absolute_import, division
+
+import bisect
+import collections
+import itertools
+import os
+
+import numpy as np
+
+from . import bodies
+from . import executor
+from . import flightlog
+from . import frames
+from . import heightmap
+from . import recorder
+from . import telemetry
+from . import utils
+from .sim import simulation
+from .sim import vessel as simVessel
+
+# the vessel's velocity with the body's position and the surface's rotation, the hybrid frame
+# landing.SuicideBurnCalculator reads it in. Replays can't transform, so it's recorded in that frame
+SURFACE_VELOCITY = 'surfaceVelocity'
+
+# what FIELDS values we can't store as plain float64
+DTYPES = {'velocity': np.dtype((np.float64, 3)),
+          'situation': np.dtype(np.int8),
+          'abort': np.dtype(np.bool_),
+          'brakes': np.dtype(np.bool_),
+          'currentStage': np.dtype(np.int32),
+          SURFACE_VELOCITY: np.dtype((np.float64, 3))}
+
+SOURCES = (telemetry.FLIGHT, telemetry.ORBIT, telemetry.VESSEL, telemetry.CONTROL)
+
+# everything we record by default: every FIELDS field that isn't read off the body
+DEFAULT_FIELDS = tuple(sorted(name for name, field in telemetry.FIELDS.items() if field.source in SOURCES))
+
+# what landing.Descend reads beyond DEFAULT_FIELDS: the orbital elements orbit.LocalOrbit.fromOrbit
+# snapshots, and the surface velocity
+DESCENT_FIELDS = ('orbit.semi_major_axis', 'orbit.inclination', 'orbit.longitude_of_ascending_node',
+                  'orbit.argument_of_periapsis', 'orbit.mean_anomaly_at_epoch', 'orbit.epoch', SURFACE_VELOCITY)
+
+# the calls (rather than properties) programs make on a Control or AutoPilot
+CALLS = {'control': ('activate_next_stage', 'add_node', 'remove_nodes'),
+         'auto_pilot': ('engage', 'disengage', 'target_pitch_and_heading', 'wait')}
+
+# a control write or call: when it happened, on what ('control' or 'auto_pilot'), and what was written or called
+Command = collections.namedtuple('Command', 'ut target attribute value')
+
+
+class ReplayError(Exception):
+    pass
+
+
+def fieldOf(name):
+    """
+    :param name: channel name, a telemetry.FIELDS name or 'source.attribute'
+    :return: the telemetry.Field it holds
+    """
+    if name in telemetry.FIELDS:
+        return telemetry.FIELDS[name]
+    if name == SURFACE_VELOCITY:
+        return telemetry.Field(telemetry.VESSEL, 'velocity')
+
+    source, _, attribute = name.partition('.')
+    if source not in SOURCES or not attribute:
+        raise ValueError("Don't know what to record for {0}".format(name))
+    return telemetry.Field(source, attribute)
+
+
+class _EnumValue(object):
+    """
+    A stream of an enum, read as its value so it fits in an integer column
+    """
+    def __init__(self, stream):
+        self.stream = stream
+
+    def __call__(self):
+        return self.stream().value
+
+    def release(self):
+        self.stream.release()
+
+
+def channels(connection, vessel, names=DEFAULT_FIELDS, referenceFrame=None, dtypes=None):
+    """
+    Make recorder.Channels for a vessel, named so a ReplayConnection can serve them
+
+    :param connection: krpc.Connection the streams live on
+    :param vessel: the vessel to record
+    :param names: telemetry.FIELDS names or 'source.attribute' names
+    :param referenceFrame: reference frame for the flight channels, defaults to the body's reference frame
+    :param dtypes: {name: dtype} for any 'source.attribute' channel that isn't a float
+    :return: list of recorder.Channel
+    """
+    if referenceFrame is None:
+        referenceFrame = vessel.orbit.body.reference_frame
+
+    dtypes = dict(DTYPES, **(dtypes or {}))
+    streams = utils.streams(connection)
+
+    result = []
+    for name in names:
+        field = fieldOf(name)
+        if name == SURFACE_VELOCITY:
+            frame = frames.FrameCache.forConnection(connection).hybrid(position=vessel.orbit.body.reference_frame,
+                                                                       rotation=vessel.surface_reference_frame)
+            stream = streams.add_call(vessel, 'velocity', frame)
+        elif field.source == telemetry.FLIGHT:
+            stream = streams.add_flight(vessel, field.attribute, referenceFrame)
+        elif field.source == telemetry.ORBIT:
+            stream = streams.add_orbit(vessel, field.attribute)
+        elif field.source == telemetry.VESSEL:
+            stream = streams.add_attribute(vessel, field.attribute)
+        else:
+            stream = streams.add_attribute(vessel.control, field.attribute)
+
+        if field.attribute == 'situation':
+            stream = _EnumValue(stream)
+
+        result.append(recorder.Channel(name, stream, dtypes.get(name, np.float64)))
+    return result
+
+
+def record(connection, vessel, path, names=DEFAULT_FIELDS, interval=0.05, metadata=None, **kwargs):
+    """
+    Start recording a vessel into a flight log a ReplayConnection can play back. Tick the recorder
+    alongside whatever's flying, and release it once done
+
+    :param connection: krpc.Connection to record over
+    :param vessel: the vessel to record
+    :param path: flight log to write
+    :param names: what to record, as for channels
+    :param interval: seconds of UT between samples, replays are only as fine grained as this
+    :param metadata: anything else to keep in the log
+    :param kwargs: passed on to recorder.Recorder
+    :return: the recorder.Recorder
+    """
+    metadata = dict(metadata or {})
+    metadata['vessel'] = vessel.name
+    metadata['body'] = bodies.constants(vessel.orbit.body)._asdict()
+    # so the replay can find the heightmap the flight samples terrain into
+    metadata['system'] = bodies.system(vessel.orbit.body)
+
+    return recorder.Recorder(connection, channels(connection, vessel, names), interval=interval,
+                             writer=flightlog.FlightLogWriter(path, metadata), **kwargs)
+
+
+class _Cursor(object):
+    """
+    Where in the log the replay is, keeping hold of the current chunk's columns
+    """
+    def __init__(self, log):
+        self.log = log
+        self.firsts = log.first.tolist()
+        self.chunk = None
+        self.columns = None
+        self.ut = None
+        self.position = 0
+        self._load(0)
+
+    def _load(self, index):
+        self.chunk = index
+        self.columns = self.log.chunk(index)
+        self.ut = self.columns['ut']
+        self.position = 0
+
+    def seek(self, ut):
+        """
+        Move to the last sample taken at or before ut
+
+        :return: False if ut is past the end of the log
+        """
+        index = self.chunk
+        if ut < self.firsts[index] or (index + 1 < len(self.firsts) and ut >= self.firsts[index + 1]):
+            index = max(bisect.bisect_right(self.firsts, ut) - 1, 0)
+            self._load(index)
+
+        # replays mostly step forward a sample or two at a time
+        uts = self.ut
+        position = self.position
+        if ut < uts[position] or (position + 8 < len(uts) and uts[position + 8] <= ut):
+            position = max(int(np.searchsorted(uts, ut, 'right')) - 1, 0)
+        while position + 1 < len(uts) and uts[position + 1] <= ut:
+            position += 1
+        self.position = position
+
+        return index + 1 < len(self.firsts) or ut <= uts[-1]
+
+    def value(self, name):
+        value = self.columns[name][self.position].tolist()
+        return tuple(value) if isinstance(value, list) else value
+
+
+class _ReplayObject(object):
+    """
+    Base for the objects a ReplayConnection hands out, which carry a client and object id like krpc's
+    """
+    def __init__(self, connection):
+        object.__setattr__(self, '_client', connection)
+        object.__setattr__(self, '_object_id', connection.newId())
+
+
+class ReplayFrame(_ReplayObject):
+    """
+    Stands in for a ReferenceFrame. Replays can't transform anything, everything comes out of the log
+    in the frame it was recorded in
+    """
+    def __init__(self, connection, name):
+        super(ReplayFrame, self).__init__(connection)
+        self.name = name
+
+    def __repr__(self):
+        return 'ReplayFrame({0})'.format(self.name)
+
+
+class _ReplayFrames(object):
+    """
+    Stands in for the ReferenceFrame class's static methods. Frames made out of others are only good for
+    naming, bar the one surface frame SURFACE_VELOCITY is recorded in
+    """
+    def __init__(self, connection):
+        self.connection = connection
+
+    def create_relative(self, reference_frame, position=(0.0, 0.0, 0.0), rotation=(0.0, 0.0, 0.0, 1.0),
+                        velocity=(0.0, 0.0, 0.0), angular_velocity=(0.0, 0.0, 0.0)):
+        return ReplayFrame(self.connection, 'relative to {0}'.format(reference_frame.name))
+
+    def create_hybrid(self, position, rotation=None, velocity=None, angular_velocity=None):
+        vessel = self.connection.space_center.active_vessel
+        body = vessel.orbit.body.reference_frame
+        if position is body and rotation is vessel.surface_reference_frame and \
+                velocity in (None, body) and angular_velocity in (None, body):
+            return self.connection.surfaceFrame
+        return ReplayFrame(self.connection, 'hybrid of {0}'.format(position.name))
+
+
+class ReplayBody(_ReplayObject):
+    """
+    The body the log was recorded around, with its bodies.BodyConstants and whatever terrain the flight
+    sampled into its heightmap
+    """
+    def __init__(self, connection, constants):
+        super(ReplayBody, self).__init__(connection)
+        for name in bodies.NAMES:
+            if name not in constants:
+                raise ReplayError("The log's body constants are missing {0}".format(name))
+            object.__setattr__(self, name, constants[name])
+
+        object.__setattr__(self, 'reference_frame', ReplayFrame(connection, 'body'))
+        object.__setattr__(self, 'non_rotating_reference_frame', ReplayFrame(connection, 'body non rotating'))
+        object.__setattr__(self, 'orbital_reference_frame', ReplayFrame(connection, 'body orbital'))
+
+    def surface_height(self, latitude, longitude):
+        height = self._client.heightmap().height(latitude, longitude)
+        if height != height:
+            raise ReplayError("The terrain at {0}, {1} wasn't sampled during the recorded flight".format(
+                latitude, longitude))
+        return height
+
+    def __getattr__(self, attribute):
+        raise ReplayError("{0}.{1} isn't in a replay".format(self.name, attribute))
+
+
+class _Recorded(_ReplayObject):
+    """
+    Reads attributes off one source's channels
+    """
+    _source = None
+
+    def __getattr__(self, attribute):
+        if attribute.startswith('__'):
+            raise AttributeError(attribute)
+        return self._client.value(self._source, attribute)
+
+
+class ReplayFlight(_Recorded):
+    _source = telemetry.FLIGHT
+
+
+class ReplayOrbit(_Recorded):
+    _source = telemetry.ORBIT
+
+    def __init__(self, connection, body):
+        super(ReplayOrbit, self).__init__(connection)
+        object.__setattr__(self, 'body', body)
+
+
+class _Commanded(_Recorded):
+    """
+    Control and AutoPilot: writes and calls become Commands, reads give back what was last written, or
+    what was recorded if nothing has been
+    """
+    _target = None
+
+    def __init__(self, connection):
+        super(_Commanded, self).__init__(connection)
+        object.__setattr__(self, '_written', {})
+
+    def __setattr__(self, attribute, value):
+        self._written[attribute] = value
+        self._client.command(self._target, attribute, value)
+
+    def __getattr__(self, attribute):
+        if attribute in CALLS[self._target]:
+            return lambda *args, **kwargs: self._client.command(self._target, attribute, (args, kwargs))
+        if attribute in self._written:
+            return self._written[attribute]
+        return super(_Commanded, self).__getattr__(attribute)
+
+
+class ReplayControl(_Commanded):
+    _source = telemetry.CONTROL
+    _target = 'control'
+
+
+class ReplayAutoPilot(_Commanded):
+    _target = 'auto_pilot'
+
+    def __getattr__(self, attribute):
+        if attribute in CALLS[self._target] or attribute in self._written:
+            return super(ReplayAutoPilot, self).__getattr__(attribute)
+        raise ReplayError("The autopilot's {0} wasn't set during the replay".format(attribute))
+
+
+class ReplayVessel(_Recorded):
+    """
+    The recorded vessel
+    """
+    _source = telemetry.VESSEL
+
+    def __init__(self, connection, name, body):
+        super(ReplayVessel, self).__init__(connection)
+        set_ = object.__setattr__
+        set_(self, 'name', name)
+        set_(self, 'orbit', ReplayOrbit(connection, body))
+        set_(self, 'control', ReplayControl(connection))
+        set_(self, 'auto_pilot', ReplayAutoPilot(connection))
+        set_(self, '_flight', ReplayFlight(connection))
+        for frame in ('reference_frame', 'surface_reference_frame', 'orbital_reference_frame',
+                      'surface_velocity_reference_frame'):
+            set_(self, frame, ReplayFrame(connection, '{0} {1}'.format(name, frame)))
+
+    def flight(self, reference_frame=None):
+        return self._flight
+
+    def velocity(self, reference_frame):
+        if reference_frame is not self._client.surfaceFrame:
+            raise ReplayError("Replays only have the velocity in the {0} frame, not {1}".format(
+                SURFACE_VELOCITY, reference_frame.name))
+        return self._client.value(telemetry.VESSEL, 'velocity')
+
+    @property
+    def situation(self):
+        return simVessel.VesselSituation(self._client.value(telemetry.VESSEL, 'situation'))
+
+
+class ReplaySpaceCenter(_ReplayObject):
+    """
+    Stands in for the SpaceCenter service, with the one recorded vessel in it
+    """
+    VesselSituation = simVessel.VesselSituation
+
+    def __init__(self, connection, vessel):
+        super(ReplaySpaceCenter, self).__init__(connection)
+        self.ReferenceFrame = _ReplayFrames(connection)
+        self.active_vessel = vessel
+        self.vessels = [vessel]
+        self.bodies = {vessel.orbit.body.name: vessel.orbit.body}
+        self.target_vessel = None
+        self.target_body = None
+
+    @property
+    def ut(self):
+        return self._client.ut
+
+    def warp_to(self, ut, max_rails_rate=100000.0, max_physics_rate=2.0):
+        self._client.seek(ut)
+
+    def quicksave(self):
+        pass
+
+
+class ReplayConnection(object):
+    """
+    Stands in for a krpc.Connection, serving a flight log. Like the simulator's connection there's no
+    _rpc_connection, so kspy evaluates batches and body constants directly
+    """
+    def __init__(self, log, heightmaps=None):
+        """
+        :param log: flightlog.FlightLog, or the path to one
+        :param heightmaps: where to find the body's heightmap, as for heightmap.HeightmapStore.forBody
+        """
+        self.log = log if isinstance(log, flightlog.FlightLog) else flightlog.FlightLog(log)
+        if not self.log.chunks:
+            raise ReplayError("{0} has nothing in it".format(self.log.path))
+        if 'body' not in self.log.metadata:
+            raise ReplayError("{0} wasn't recorded with replay.record, it has no body constants".format(
+                self.log.path))
+
+        self.system = self.log.metadata.get('system')
+        self.heightmaps = heightmaps
+        self._heightmap = None
+
+        self._ids = itertools.count(1)
+        self._cursor = _Cursor(self.log)
+        self.ut = float(self.log.first[0])
+        self.exhausted = False
+
+        # (source, attribute) -> channel name
+        self.sources = {}
+        for name in self.log.channels:
+            if name != 'ut':
+                self.sources[tuple(fieldOf(name))] = name
+
+        self.commands = []
+        self.streams = []
+        self.drawing = simulation.SimDrawing()
+
+        body = ReplayBody(self, self.log.metadata['body'])
+        vessel = ReplayVessel(self, self.log.metadata.get('vessel', 'Vessel'), body)
+        self.space_center = ReplaySpaceCenter(self, vessel)
+        self.surfaceFrame = ReplayFrame(self, '{0} surface, about the body'.format(vessel.name))
+
+    def newId(self):
+        return next(self._ids)
+
+    def value(self, source, attribute):
+        """
+        :return: the recorded value of source.attribute at the current UT
+        """
+        name = self.sources.get((source, attribute))
+        if name is None:
+            raise ReplayError("{0}.{1} wasn't recorded in {2}".format(source, attribute, self.log.path))
+        return self._cursor.value(name)
+
+    def heightmap(self):
+        """
+        :return: heightmap.HeightmapStore of the terrain the recorded flight sampled
+        """
+        if self._heightmap is None:
+            name = self.space_center.active_vessel.orbit.body.name
+            if self.system is None:
+                raise ReplayError("{0} doesn't say which solar system it was flown in".format(self.log.path))
+
+            path = heightmap.HeightmapStore.pathFor(name, self.system, self.heightmaps)
+            if not os.path.exists(path):
+                raise ReplayError("No terrain was sampled on {0} during the recorded flight, {1} doesn't exist".format(
+                    name, path))
+            self._heightmap = heightmap.HeightmapStore.forBody(name, self.heightmaps, system=self.system)
+        return self._heightmap
+
+    def command(self, target, attribute, value):
+        """
+        Keep a control write or call
+        """
+        self.commands.append(Command(self.ut, target, attribute, value))
+
+    # moving through the log
+
+    def seek(self, ut):
+        """
+        Jump to ut, marking the replay exhausted if that's past the end of the log
+        """
+        self.ut = ut
+        if not self._cursor.seek(ut):
+            self.exhausted = True
+
+    def advance(self, seconds):
+        self.seek(self.ut + seconds)
+
+    def monotonic(self):
+        return self.ut
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.advance(seconds)
+
+    def run(self, program, rate=None, finishOn=True, then=None):
+        """
+        Run a program on the log's time until it finishes or the log runs out
+
+        :param program: utils.Program or any callable taking no arguments
+        :param rate: ticks per second, defaults to the program's own
+        :param finishOn: what the program returns once it's done
+        :param then: successor, as for executor.Executor.add
+        :return: the executor.Task that hosted the program
+        """
+        host = executor.Executor(self, self.space_center.active_vessel, clock=self.monotonic, sleep=self.sleep)
+        task = host.add(program, rate=rate, finishOn=finishOn, then=then)
+
+        try:
+            while host.running() and not self.exhausted:
+                remaining = host.nextDeadline() - self.monotonic()
+                if remaining > 0:
+                    self.sleep(remaining)
+                if not self.exhausted:
+                    host.step()
+        finally:
+            host.release()
+
+        return task
+
+    # comparing with what was flown
+
+    def commanded(self, attribute, target='control'):
+        """
+        :return: (uts, values) arrays of every write to target.attribute
+        """
+        writes = [(command.ut, command.value) for command in self.commands
+                  if command.target == target and command.attribute == attribute]
+        if not writes:
+            return np.zeros(0), np.zeros(0)
+        uts, values = zip(*writes)
+        return np.array(uts), np.array(values, dtype=float)
+
+    def compare(self, attribute):
+        """
+        Line up what the replayed program wrote to a control with what was recorded for it
+
+        :param attribute: control attribute, like 'throttle'
+        :return: ordered {'ut', 'recorded', 'commanded'} arrays over the log, commanded holding the last value
+                 written as of each sample (NaN before the first write)
+        """
+        name = self.sources.get((telemetry.CONTROL, attribute))
+        if name is None:
+            raise ReplayError("control.{0} wasn't recorded in {1}".format(attribute, self.log.path))
+
+        columns = self.log.read(['ut', name])
+        uts, values = self.commanded(attribute)
+
+        commanded = np.full(len(columns['ut']), np.nan)
+        if len(uts):
+            latest = np.searchsorted(uts, columns['ut'], 'right') - 1
+            commanded[latest >= 0] = values[latest[latest >= 0]]
+
+        return collections.OrderedDict([('ut', columns['ut']), ('recorded', columns[name]),
+                                        ('commanded', commanded)])
+
+    # what krpc.Connection has that programs use
+
+    def add_stream(self, func, *args):
+        stream = simulation.SimStream(func, *args)
+        self.streams.append(stream)
+        return stream
+
+    def close(self):
+        for stream in self.streams:
+            stream.remove()
+        del self.streams[:]
+        self.log.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
@@ -9,7 +9,10 @@ import math
 
 from .pid import PID
 
+from . import bodies
+from . import controls
 from . import maths
+from . import topology
 from . import utils
 
 
@@ -44,10 +47,10 @@ def distanceOverSurface(target, location, body):
 
     :param target: latlon object for where we want to go
     :param location: latlon object for where we are
-    :param body: the body on which to test those two positions
+    :param body: the body on which to test those two positions, or its bodies.BodyConstants
     :return:
     """
-    R = body.equatorial_radius
+    R = bodies.constants(body).equatorial_radius
 
     dLat = math.radians(target.lat - location.lat)
     dLon = math.radians(target.lon - location.lon)
@@ -83,6 +86,8 @@ class RoverGo(utils.Program):
     figure out where to go.   Attempts to bring rover to a complete stop and quicksave at regular
     intervals.
     """
+    rate = 100
+
     def __init__(self, connection, vessel, waypoint, speed=10.0, savetime=300):
         """
         :param connection: connection to use
@@ -99,8 +104,11 @@ class RoverGo(utils.Program):
         self.speed = speed
         self.savetime = savetime
 
-        self.autosave = RoverAutoSave(connection, vessel, savetime, vessel.parts.all)
-        self.recharge = RoverRecharge(connection, vessel)
+        # steering and throttle only go to the server when they've moved
+        self.controls = controls.ControlBuffer(vessel)
+
+        self.autosave = RoverAutoSave(connection, vessel, savetime, controlBuffer=self.controls)
+        self.recharge = RoverRecharge(connection, vessel, controlBuffer=self.controls)
 
         self.groundTelem = vessel.flight(vessel.orbit.body.reference_frame)
         self.surfTelem = vessel.flight(vessel.surface_reference_frame)
@@ -129,12 +137,13 @@ class RoverGo(utils.Program):
         targetHeading = headingForLatLon(self.target, location)
         courseCorrect = courseCorrection(self.surfTelem.heading, targetHeading)
         steerCorrect = self.steering.update(courseCorrect)
-        self.vessel.control.wheel_steering = steerCorrect
+        self.controls.control.wheel_steering = steerCorrect
 
         # Throttle control  -  tries to maintain the given speed!
-        self.vessel.control.brakes = False
+        self.controls.control.brakes = False
         throttleSetting = self.throttle.update(self.groundTelem.speed)
-        self.vessel.control.wheel_throttle = throttleSetting
+        self.controls.control.wheel_throttle = throttleSetting
+        self.controls.flush()
 
         # Check if we're close and end the program
         if distanceOverSurface(self.target, location, self.vessel.orbit.body) < 50:
@@ -149,25 +158,29 @@ class RoverAutoSave(utils.Program):
     A program object to handle autosaving while we're roving, and will do some error checking
     if the vessel it's operating on happens to lose some parts
     """
-    def __init__(self, connection, vessel, saveTime, partsList):
+    def __init__(self, connection, vessel, saveTime, partsList=None, controlBuffer=None):
         """
 
         :param connection: connection to use
         :param vessel: vessel to control
         :param saveTime: how often to save
-        :param partsList: the list of parts on our current vessel
+        :param partsList: the list of parts on our current vessel, defaults to what it has now
+        :param controlBuffer: controls.ControlBuffer to invalidate after we've taken over the controls to save
         """
         super(RoverAutoSave, self).__init__("RoverAutoSave")
         self.saveTime = saveTime
         self.connection = connection
         self.vessel = vessel
+        self.controlBuffer = controlBuffer
 
         self.surfTelem = vessel.flight(vessel.surface_reference_frame)
         self.groundTelem = vessel.flight(vessel.orbit.body.reference_frame)
 
         self.lastSave = time.time()
 
-        self.partsList = partsList
+        # the part count comes off a stream, so checking for lost parts doesn't cost a round trip
+        self.topology = topology.VesselTopology.forVessel(vessel)
+        self.partCount = len(partsList) if partsList is not None else self.topology.partCount
 
     def __call__(self):
         # if save time is zero, just bail out
@@ -192,6 +205,8 @@ class RoverAutoSave(utils.Program):
                 self.connection.space_center.quicksave()
 
                 self.vessel.control.brakes = False
+                if self.controlBuffer is not None:
+                    self.controlBuffer.invalidate()
 
             self.lastSave = time.time()
 
@@ -205,7 +220,7 @@ class RoverAutoSave(utils.Program):
             return False
         if self.surfTelem.pitch > 25 or self.surfTelem.roll > 25:  # We might have rolled!
             return False
-        if len(self.partsList) is not len(self.vessel.parts.all):  # We might have lost something?
+        if self.topology.partCount != self.partCount:  # We might have lost something?
             return False
 
         return True  # all good!
@@ -215,14 +230,16 @@ class RoverRecharge(utils.Program):
     """
     Subprogram for the RoverGo to use to recharge its batteries
     """
-    def __init__(self, connection, vessel):
+    def __init__(self, connection, vessel, controlBuffer=None):
         """
         :param connection: connection we're using
         :param vessel: vessel we're controlling
+        :param controlBuffer: controls.ControlBuffer to invalidate after we've taken over the controls to charge
         """
         super(RoverRecharge, self).__init__("RoverRecharge")
         self.connection = connection
         self.vessel = vessel
+        self.controlBuffer = controlBuffer
         self.telemetry = vessel.flight(vessel.orbit.body.reference_frame)
         self.maxEC = vessel.resources.max('ElectricCharge')
 
@@ -249,3 +266,5 @@ class RoverRecharge(utils.Program):
             # for safety, retract the solar panels so they don't break
             self.vessel.control.solar_panels = False
             self.vessel.control.brakes = False
+            if self.controlBuffer is not None:
+                self.controlBuffer.invalidate()
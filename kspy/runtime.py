@@ -0,0 +1,160 @@
+"""
+Flying several vessels from one process, on one asyncio event loop
+
+Every program tick becomes a coroutine. Plain programs (utils.Program, or any callable) make
+blocking krpc calls, so each of their ticks runs on a bounded pool of worker threads while the loop
+carries on ticking everything else. Programs whose __call__ is a coroutine function run on the loop
+itself, and push their own blocking calls onto the pool with Runtime.call.
+
+    rt = runtime.Runtime(workers=4)
+    rt.run(rt.fly(landing.Hover(connection, lander, targetAlt=20), finishOn=False),
+           rt.fly(relayKeeper),
+           rt.fly(rover.RoverGo(connection, rover, waypoint), finishOn=True),
+           rt.call(rendezvous.close_dist, tug, station, stop=rt.stopping))
+
+Each fly keeps its program to its own rate with a scheduler.Scheduler, sleeping on the loop between
+ticks, and a program never ticks twice at once. Long blocking functions like rendezvous.matchv go
+through call, so they only tie up one worker. Ticks on the pool are charged to the program through
+instrument.ticking as usual.
+
+Cancelling a call can't stop its thread, so a blocking function has to watch rt.stopping (a
+threading.Event, set once run is over or the runtime is closing) to give up early, the way
+rendezvous.matchv and close_dist do with their stop argument. close waits for whatever's still
+running, so anything that doesn't watch it holds close up until it finishes by itself.
+
+A krpc client serializes its RPCs, so programs sharing a connection still queue behind each other's
+calls; give the time-critical ones a connection of their own when that matters.
+"""
+from __future__ import print_function, absolute_import, division
+
+import asyncio
+import concurrent.futures
+import functools
+import threading
+import time
+
+from . import instrument
+from . import scheduler
+from . import utils
+
+
+class Runtime(object):
+    """
+    An event loop and a bounded thread pool to tick programs on
+    """
+    def __init__(self, workers=4, clock=time.monotonic):
+        """
+        :param workers: most blocking ticks or calls that can be in flight at once
+        :param clock: monotonic clock returning seconds
+        """
+        self.workers = workers
+        self.clock = clock
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='kspy')
+
+        # set when blocking calls should give up, see the module docstring
+        self.stopping = threading.Event()
+
+        # one per program we've flown, for stats
+        self.schedulers = []
+
+    async def call(self, func, *args, **kwargs):
+        """
+        Run a blocking function on the pool
+
+        :return: whatever it returned
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, functools.partial(func, *args, **kwargs))
+
+    async def tick(self, program, name):
+        """
+        Tick a program once, on the pool unless its __call__ is a coroutine function
+
+        :return: whatever the tick returned
+        """
+        if asyncio.iscoroutinefunction(program) or asyncio.iscoroutinefunction(getattr(program, '__call__', None)):
+            return await program()
+        return await self.call(_charged, name, program)
+
+    async def fly(self, program, rate=None, finishOn=True, name=None):
+        """
+        Tick a program at its rate until it's done, then release it
+
+        :param program: utils.Program, or any callable taking no arguments
+        :param rate: ticks per second, defaults to the program's declared rate
+        :param finishOn: what the program returns once it's done (True or False), None to tick it until
+                         this coroutine is cancelled
+        :param name: for display, defaults to the program's prettyName or class name
+        :return: what the program finished on
+        """
+        if rate is None:
+            rate = getattr(program, 'rate', utils.Program.rate)
+        if name is None:
+            name = getattr(program, 'prettyName', type(program).__name__)
+
+        ticker = scheduler.Scheduler(rate, name=name, clock=self.clock)
+        self.schedulers.append(ticker)
+
+        try:
+            while True:
+                if ticker.deadline is not None:
+                    remaining = ticker.deadline - self.clock()
+                    if remaining > 0:
+                        await asyncio.sleep(remaining)
+
+                start = self.clock()
+                result = await self.tick(program, name)
+                ticker.record(start, self.clock())
+
+                if finishOn is not None and bool(result) == finishOn:
+                    return result
+        finally:
+            if hasattr(program, 'release'):
+                # a cancelled fly still gets to let go of its streams
+                await asyncio.shield(self.call(program.release))
+
+    def run(self, *coroutines):
+        """
+        Run coroutines (flys, calls, or anything else) together on a new event loop until they've all
+        finished. If one of them raises, the rest are cancelled, and stopping is set for any calls
+        still running on the pool
+
+        :return: list of what each one returned
+        """
+        self.stopping.clear()
+
+        async def together():
+            tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+            try:
+                return await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                self.stopping.set()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        return asyncio.run(together())
+
+    def close(self):
+        """
+        Tell blocking calls to stop, drop any that haven't started, wait for the rest and shut the pool down
+        """
+        self.stopping.set()
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def stats(self):
+        """
+        :return: list of scheduler.Scheduler stats dictionaries, one per program we've flown
+        """
+        return [ticker.stats() for ticker in self.schedulers]
+
+
+def _charged(name, program):
+    with instrument.ticking(name):
+        return program()
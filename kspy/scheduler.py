@@ -0,0 +1,184 @@
+"""
+Fixed-rate scheduling for Programs
+
+A Scheduler ticks a program on a fixed grid of deadlines on the monotonic clock, sleeping only for
+whatever is left of the period once the tick is done. A tick that takes longer than its period is
+counted as an overrun, and any deadlines it ran past are skipped rather than fired back to back, so
+a slow tick never turns into a burst of catch-up ticks.
+
+    launch = scheduler.Scheduler.forProgram(ascend)
+    launch.runUntil(ascend)
+    print(launch.stats())
+"""
+from __future__ import print_function, absolute_import, division
+
+import collections
+import math
+import time
+
+import numpy as np
+
+from . import instrument
+
+
+class Scheduler(object):
+    """
+    Runs a callable at a fixed rate and keeps track of how well it kept to it
+    """
+    def __init__(self, rate, name=None, historySize=1000, clock=time.monotonic, sleep=time.sleep):
+        """
+        :param rate: ticks per second
+        :param name: for display, defaults to 'Scheduler'
+        :param historySize: how many recent ticks to keep timings for
+        :param clock: monotonic clock returning seconds
+        :param sleep: function sleeping for a number of seconds
+        """
+        if rate <= 0:
+            raise ValueError("Scheduler rate has to be positive, not {0}".format(rate))
+
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.name = name or 'Scheduler'
+        self.clock = clock
+        self.sleep = sleep
+
+        # how long each tick took and how late it started, most recent last
+        self.durations = collections.deque(maxlen=historySize)
+        self.lateness = collections.deque(maxlen=historySize)
+
+        self.reset()
+
+    @classmethod
+    def forProgram(cls, program, **kwargs):
+        """
+        :param program: utils.Program, whose declared rate we'll tick at
+        :return: a Scheduler named after the program
+        """
+        return cls(program.rate, name=program.prettyName, **kwargs)
+
+    def reset(self):
+        """
+        Forget all timings, the next tick runs straight away
+        """
+        self.deadline = None
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.durations.clear()
+        self.lateness.clear()
+
+    def due(self, now=None):
+        """
+        :return: True if the next deadline has come around
+        """
+        if self.deadline is None:
+            return True
+        return (self.clock() if now is None else now) >= self.deadline
+
+    def wait(self):
+        """
+        Sleep until the next deadline, if it hasn't come around already
+        """
+        if self.deadline is None:
+            return
+
+        remaining = self.deadline - self.clock()
+        if remaining > 0:
+            self.sleep(remaining)
+
+    def tick(self, func, *args, **kwargs):
+        """
+        Wait for the next deadline, then call func once
+
+        :return: whatever func returned
+        """
+        self.wait()
+
+        start = self.clock()
+        with instrument.ticking(self.name):
+            result = func(*args, **kwargs)
+        self.record(start, self.clock())
+
+        return result
+
+    def record(self, start, end):
+        """
+        Account for a tick that ran from start to end, and move on to the next deadline.
+        For when something other than tick (like executor.Executor) is making the calls
+
+        :param start: clock time the tick started
+        :param end: clock time the tick finished
+        """
+        if self.deadline is None:
+            self.deadline = start
+
+        self.ticks += 1
+        duration = end - start
+        self.durations.append(duration)
+        self.lateness.append(max(0.0, start - self.deadline))
+
+        if duration > self.period:
+            self.overruns += 1
+
+        self.deadline += self.period
+        if end > self.deadline:
+            # drop whatever deadlines we've already missed and pick the grid back up
+            missed = int(math.ceil((end - self.deadline) / self.period))
+            self.skipped += missed
+            self.deadline += missed * self.period
+
+    def runUntil(self, func, *args, **kwargs):
+        """
+        Keep ticking func until it returns something truthy, like Programs that return True when done
+
+        :return: the truthy value
+        """
+        while True:
+            result = self.tick(func, *args, **kwargs)
+            if result:
+                return result
+
+    def runWhile(self, func, *args, **kwargs):
+        """
+        Keep ticking func for as long as it returns something truthy, like Programs that return False when done
+
+        :return: the falsy value it finished on
+        """
+        while True:
+            result = self.tick(func, *args, **kwargs)
+            if not result:
+                return result
+
+    def stats(self):
+        """
+        :return: dictionary of tick counts, and duration and jitter (how late ticks started) statistics
+                 in seconds over the recent history
+        """
+        durations = np.array(self.durations)
+        lateness = np.array(self.lateness)
+
+        stats = {'name': self.name,
+                 'rate': self.rate,
+                 'ticks': self.ticks,
+                 'overruns': self.overruns,
+                 'skipped': self.skipped}
+
+        if durations.size:
+            stats.update({'meanDuration': float(durations.mean()),
+                          'maxDuration': float(durations.max()),
+                          'p99Duration': float(np.percentile(durations, 99)),
+                          'meanJitter': float(lateness.mean()),
+                          'stdJitter': float(lateness.std()),
+                          'maxJitter': float(lateness.max()),
+                          'utilization': float(durations.mean() / self.period)})
+
+        return stats
+
+    def __str__(self):
+        stats = self.stats()
+        if not self.ticks:
+            return "{0}: no ticks at {1}Hz".format(self.name, self.rate)
+
+        return ("{name}: {ticks} ticks at {rate}Hz, {overruns} overruns, {skipped} skipped, "
+                "duration mean {meanDuration:.4f}s max {maxDuration:.4f}s, "
+                "jitter mean {meanJitter:.4f}s max {maxJitter:.4f}s").format(**stats)
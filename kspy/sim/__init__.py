@@ -0,0 +1,17 @@
+"""
+An offline stand-in for KSP and krpc's SpaceCenter service, for running kspy programs without the game
+
+    from kspy import launch
+    from kspy.sim import Simulation, Stage
+
+    sim = Simulation()
+    vessel = sim.addLandedVessel('Rocket', [Stage(2000, 8000, 215000, 320)], -0.0972, -74.5577)
+    vessel.control.activate_next_stage()
+    sim.run(launch.Ascend(sim.connection, vessel, 80000))
+"""
+from __future__ import print_function, absolute_import, division
+
+from .body import BodySpec, CelestialBody, KERBIN, MUN, MINMUS
+from .frames import ReferenceFrame
+from .simulation import Simulation, SimulationTimeout, SimClock, SimConnection, SpaceCenter
+from .vessel import Stage, Vessel, VesselSituation
@@ -0,0 +1,171 @@
+"""
+Celestial bodies for the simulator
+
+Each body sits at the origin of its own inertial frame and turns about its z axis; there's no
+orbital motion and no sphere of influence changes, so a vessel stays around the body it started at.
+"""
+from __future__ import print_function, absolute_import, division
+
+import collections
+import math
+
+import numpy as np
+
+from . import frames
+
+G = 6.67408e-11
+
+# everything needed to make a body, KSP's numbers for the stock ones
+BodySpec = collections.namedtuple('BodySpec', 'name radius gravitationalParameter rotationalPeriod '
+                                              'sphereOfInfluence atmosphereDepth surfaceDensity scaleHeight')
+
+KERBIN = BodySpec('Kerbin', 600000.0, 3.5316e12, 21549.425, 84159286.0, 70000.0, 1.225, 5600.0)
+MUN = BodySpec('Mun', 200000.0, 6.5138398e10, 138984.38, 2429559.1, 0.0, 0.0, 1.0)
+MINMUS = BodySpec('Minmus', 60000.0, 1.7658e9, 40400.0, 2247428.4, 0.0, 0.0, 1.0)
+
+
+class CelestialBody(object):
+    """
+    Stands in for krpc's CelestialBody
+    """
+    def __init__(self, sim, spec, terrain=None):
+        """
+        :param sim: the Simulation the body belongs to
+        :param spec: BodySpec
+        :param terrain: function of (latitude, longitude) in degrees returning the terrain height above
+                        sea level, defaults to a flat body
+        """
+        self._sim = sim
+        self._client = sim.connection
+        self._object_id = sim.newId()
+        self.spec = spec
+        self.terrain = terrain
+
+        self.name = spec.name
+        self.equatorial_radius = spec.radius
+        self.gravitational_parameter = spec.gravitationalParameter
+        self.surface_gravity = spec.gravitationalParameter / spec.radius ** 2
+        self.rotational_period = spec.rotationalPeriod
+        self.rotational_speed = 2 * math.pi / spec.rotationalPeriod
+        self.initial_rotation = 0.0
+        self.mass = spec.gravitationalParameter / G
+        self.sphere_of_influence = spec.sphereOfInfluence
+        self.has_atmosphere = spec.atmosphereDepth > 0
+        self.atmosphere_depth = spec.atmosphereDepth
+        self.has_atmospheric_oxygen = self.has_atmosphere
+        self.orbit = None
+        self.satellites = []
+
+        self.spin = np.array([0.0, 0.0, self.rotational_speed])
+
+        self.reference_frame = frames.ReferenceFrame(sim, self._rotatingState, self.name + 'Frame')
+        self.non_rotating_reference_frame = frames.ReferenceFrame(sim, self._inertialState,
+                                                                  self.name + 'NonRotatingFrame')
+        self.orbital_reference_frame = self.non_rotating_reference_frame
+
+    def __repr__(self):
+        return '<sim CelestialBody {0}>'.format(self.name)
+
+    def angleAt(self, ut):
+        return (self.initial_rotation + self.rotational_speed * ut) % (2 * math.pi)
+
+    @property
+    def rotation_angle(self):
+        return self.angleAt(self._sim.ut)
+
+    def _rotatingState(self, ut):
+        theta = self.angleAt(ut)
+        c, s = math.cos(theta), math.sin(theta)
+        axes = np.array([[c, s, 0.0], [0.0, 0.0, 1.0], [-s, c, 0.0]])
+        return frames.ZERO, axes, frames.ZERO, self.spin
+
+    def _inertialState(self, ut):
+        axes = np.array([[1.0, 0.0, 0.0], [0.0, 0.0, 1.0], [0.0, 1.0, 0.0]])
+        return frames.ZERO, axes, frames.ZERO, frames.ZERO
+
+    # where things are
+
+    def surfaceUnit(self, latitude, longitude, ut=None):
+        """
+        :return: inertial unit vector from the center through the input latitude/longitude, in degrees
+        """
+        theta = self.angleAt(self._sim.ut if ut is None else ut)
+        lat, lon = math.radians(latitude), math.radians(longitude) + theta
+        return np.array([math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)])
+
+    def coordinates(self, position, ut=None):
+        """
+        :param position: inertial position
+        :return: (latitude, longitude) in degrees, longitude in [-180, 180)
+        """
+        theta = self.angleAt(self._sim.ut if ut is None else ut)
+        x, y, z = position
+        latitude = math.degrees(math.atan2(z, math.hypot(x, y)))
+        longitude = (math.degrees(math.atan2(y, x) - theta) + 180.0) % 360.0 - 180.0
+        return latitude, longitude
+
+    def surface_height(self, latitude, longitude):
+        if self.terrain is None:
+            return 0.0
+        return float(self.terrain(latitude, longitude))
+
+    def bedrock_height(self, latitude, longitude):
+        return self.surface_height(latitude, longitude)
+
+    def surface_position(self, latitude, longitude, reference_frame):
+        radius = self.equatorial_radius + self.surface_height(latitude, longitude)
+        return reference_frame.positionOf(radius * self.surfaceUnit(latitude, longitude))
+
+    def msl_position(self, latitude, longitude, reference_frame):
+        return reference_frame.positionOf(self.equatorial_radius * self.surfaceUnit(latitude, longitude))
+
+    def bedrock_position(self, latitude, longitude, reference_frame):
+        return self.surface_position(latitude, longitude, reference_frame)
+
+    def position_at_altitude(self, latitude, longitude, altitude, reference_frame):
+        radius = self.equatorial_radius + altitude
+        return reference_frame.positionOf(radius * self.surfaceUnit(latitude, longitude))
+
+    def latitude_at_position(self, position, reference_frame):
+        return self.coordinates(reference_frame.positionFrom(position))[0]
+
+    def longitude_at_position(self, position, reference_frame):
+        return self.coordinates(reference_frame.positionFrom(position))[1]
+
+    def altitude_at_position(self, position, reference_frame):
+        return np.linalg.norm(reference_frame.positionFrom(position)) - self.equatorial_radius
+
+    def position(self, reference_frame):
+        return reference_frame.positionOf(frames.ZERO)
+
+    def velocity(self, reference_frame):
+        return reference_frame.velocityOf(frames.ZERO, frames.ZERO)
+
+    def direction(self, reference_frame):
+        return reference_frame.directionOf(np.array([1.0, 0.0, 0.0]))
+
+    def rotation(self, reference_frame):
+        return reference_frame.rotationOf(self._rotatingState(self._sim.ut)[1])
+
+    def angular_velocity(self, reference_frame):
+        return reference_frame.directionOf(self.spin)
+
+    # the atmosphere
+
+    def density(self, altitude):
+        """
+        :return: atmospheric density in kg/m^3 at the input altitude, falling off exponentially
+        """
+        if not self.has_atmosphere or altitude >= self.atmosphere_depth:
+            return 0.0
+        return self.spec.surfaceDensity * math.exp(-max(0.0, altitude) / self.spec.scaleHeight)
+
+    def density_at(self, altitude):
+        return self.density(altitude)
+
+    def atmospheric_density_at_position(self, position, reference_frame):
+        return self.density(self.altitude_at_position(position, reference_frame))
+
+    def pressure_at(self, altitude):
+        # ideal gas at a constant 288K, which is close enough for a drag model
+        return self.density(altitude) * 287.05 * 288.0
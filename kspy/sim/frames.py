@@ -0,0 +1,204 @@
+"""
+Reference frames for the simulator
+
+Everything in the simulator lives in one inertial frame per body: origin at the body's center, x
+toward the reference direction, z along the rotation axis, right handed (the same frame
+orbit.LocalOrbit.position_at uses). A ReferenceFrame is a function of universal time giving its origin,
+axes, velocity and angular velocity in that frame, and converts positions, directions and velocities
+into and out of its own coordinates.
+
+krpc's frames are left handed, so the axes here are laid out the way krpc documents them (for a
+body's frame, x toward longitude 0, y toward the north pole, z toward 90 degrees east) and end up
+left handed too. Coordinates still come out exactly as krpc would report them.
+"""
+from __future__ import print_function, absolute_import, division
+
+import math
+
+import numpy as np
+
+ZERO = np.zeros(3)
+
+
+def unit(vector):
+    norm = np.linalg.norm(vector)
+    if norm == 0.0:
+        return np.zeros(3)
+    return vector / norm
+
+
+def cross(a, b):
+    """
+    np.cross, without its generality, which costs more than the product itself on 3-vectors
+    """
+    return np.array([a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0]])
+
+
+def perpendicular(vector):
+    """
+    :return: some unit vector perpendicular to the input one
+    """
+    other = np.array([1.0, 0.0, 0.0]) if abs(vector[0]) < 0.9 else np.array([0.0, 1.0, 0.0])
+    return unit(cross(vector, other))
+
+
+def quaternionMatrix(q):
+    """
+    :param q: (x, y, z, w) unit quaternion
+    :return: 3x3 matrix that rotates a column vector the way the quaternion does
+    """
+    x, y, z, w = q
+    return np.array([[1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+                     [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+                     [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)]])
+
+
+def matrixQuaternion(m):
+    """
+    :param m: 3x3 proper rotation matrix
+    :return: (x, y, z, w) quaternion rotating vectors the same way
+    """
+    trace = m[0, 0] + m[1, 1] + m[2, 2]
+    if trace > 0:
+        s = 2.0 * math.sqrt(trace + 1.0)
+        return ((m[2, 1] - m[1, 2]) / s, (m[0, 2] - m[2, 0]) / s, (m[1, 0] - m[0, 1]) / s, 0.25 * s)
+    if m[0, 0] > m[1, 1] and m[0, 0] > m[2, 2]:
+        s = 2.0 * math.sqrt(1.0 + m[0, 0] - m[1, 1] - m[2, 2])
+        return (0.25 * s, (m[0, 1] + m[1, 0]) / s, (m[0, 2] + m[2, 0]) / s, (m[2, 1] - m[1, 2]) / s)
+    if m[1, 1] > m[2, 2]:
+        s = 2.0 * math.sqrt(1.0 + m[1, 1] - m[0, 0] - m[2, 2])
+        return ((m[0, 1] + m[1, 0]) / s, 0.25 * s, (m[1, 2] + m[2, 1]) / s, (m[0, 2] - m[2, 0]) / s)
+    s = 2.0 * math.sqrt(1.0 + m[2, 2] - m[0, 0] - m[1, 1])
+    return ((m[0, 2] + m[2, 0]) / s, (m[1, 2] + m[2, 1]) / s, 0.25 * s, (m[1, 0] - m[0, 1]) / s)
+
+
+class ReferenceFrame(object):
+    """
+    A frame that moves, turns or both over time
+    """
+    def __init__(self, sim, state, name=None):
+        """
+        :param sim: the Simulation the frame belongs to
+        :param state: function of universal time returning (origin, axes, velocity, angularVelocity) in
+                      the body's inertial frame, axes as a 3x3 array with one unit axis per row
+        :param name: for display
+        """
+        self._sim = sim
+        self._client = sim.connection
+        self._object_id = sim.newId()
+        self.state = state
+        self.name = name or 'ReferenceFrame'
+        self._cache = (None, None)
+
+    def __repr__(self):
+        return '<sim {0} #{1}>'.format(self.name, self._object_id)
+
+    def _now(self):
+        # nothing moves between simulation steps, so work the state out once per step
+        version, state = self._cache
+        if version != self._sim.version:
+            state = self.state(self._sim.ut)
+            self._cache = (self._sim.version, state)
+        return state
+
+    def positionOf(self, position):
+        """
+        :param position: inertial position
+        :return: the position in this frame
+        """
+        origin, axes, _, _ = self._now()
+        return tuple(axes.dot(position - origin))
+
+    def directionOf(self, direction):
+        """
+        :param direction: inertial direction
+        :return: the direction in this frame
+        """
+        _, axes, _, _ = self._now()
+        return tuple(axes.dot(direction))
+
+    def velocityOf(self, position, velocity):
+        """
+        :param position: inertial position of the thing that's moving
+        :param velocity: its inertial velocity
+        :return: its velocity relative to this frame, in this frame
+        """
+        origin, axes, frameVelocity, angularVelocity = self._now()
+        relative = velocity - frameVelocity - cross(angularVelocity, position - origin)
+        return tuple(axes.dot(relative))
+
+    def positionFrom(self, position):
+        """
+        :param position: position in this frame
+        :return: the inertial position
+        """
+        origin, axes, _, _ = self._now()
+        return origin + axes.T.dot(np.asarray(position, dtype=float))
+
+    def directionFrom(self, direction):
+        """
+        :param direction: direction in this frame
+        :return: the inertial direction
+        """
+        _, axes, _, _ = self._now()
+        return axes.T.dot(np.asarray(direction, dtype=float))
+
+    def velocityFrom(self, position, velocity):
+        """
+        :param position: position in this frame of the thing that's moving
+        :param velocity: its velocity in this frame
+        :return: its inertial velocity
+        """
+        origin, axes, frameVelocity, angularVelocity = self._now()
+        inertialPosition = origin + axes.T.dot(np.asarray(position, dtype=float))
+        return (axes.T.dot(np.asarray(velocity, dtype=float)) + frameVelocity +
+                cross(angularVelocity, inertialPosition - origin))
+
+    def rotationOf(self, axes):
+        """
+        :param axes: 3x3 axes of another frame, one row per axis
+        :return: (x, y, z, w) quaternion rotating that frame's coordinates into this one's
+        """
+        _, ours, _, _ = self._now()
+        return matrixQuaternion(ours.dot(axes.T))
+
+
+class FrameFactory(object):
+    """
+    Stands in for SpaceCenter.ReferenceFrame, making relative and hybrid frames
+    """
+    def __init__(self, sim):
+        self._sim = sim
+
+    def create_relative(self, reference_frame, position=(0.0, 0.0, 0.0), rotation=(0.0, 0.0, 0.0, 1.0),
+                        velocity=(0.0, 0.0, 0.0), angular_velocity=(0.0, 0.0, 0.0)):
+        parent = reference_frame
+        offset = np.array(position, dtype=float)
+        turn = quaternionMatrix(rotation)
+        ownVelocity = np.array(velocity, dtype=float)
+        ownSpin = np.array(angular_velocity, dtype=float)
+
+        def state(ut):
+            origin, axes, frameVelocity, angularVelocity = parent.state(ut)
+            newOrigin = origin + axes.T.dot(offset)
+            # the child's axes, written in the parent's coordinates, are the columns of the rotation
+            newAxes = turn.T.dot(axes)
+            newVelocity = (frameVelocity + cross(angularVelocity, newOrigin - origin) +
+                           axes.T.dot(ownVelocity))
+            return newOrigin, newAxes, newVelocity, angularVelocity + axes.T.dot(ownSpin)
+
+        return ReferenceFrame(self._sim, state, 'RelativeFrame')
+
+    def create_hybrid(self, position, rotation=None, velocity=None, angular_velocity=None):
+        rotation = rotation or position
+        velocity = velocity or position
+        angular_velocity = angular_velocity or position
+
+        def state(ut):
+            origin = position.state(ut)[0]
+            axes = rotation.state(ut)[1]
+            frameVelocity = velocity.state(ut)[2]
+            angularVelocity = angular_velocity.state(ut)[3]
+            return origin, axes, frameVelocity, angularVelocity
+
+        return ReferenceFrame(self._sim, state, 'HybridFrame')
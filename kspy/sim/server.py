@@ -0,0 +1,74 @@
+"""
+A stand-in kRPC server serving a simulation over TCP, for measuring kspy where it really spends its
+time: round trips
+
+    sim = Simulation()
+    vessel = sim.addOrbitingVessel('Probe', [Stage(500, 1000, 20000, 320)], 100000)
+    server = SimServer(sim, latency=0.002, jitter=0.001)
+    server.start()
+    connection = server.connectTcp()
+
+    programs.ExecuteNextManeuver(connection, connection.space_center.active_vessel)
+
+The connection is a real krpc client: calls, batches, streams and events all go through krpc's own
+encoding and over a socket, and every RPC response is held back by the configured latency. Streams
+are pushed as often as they change, without any extra latency.
+
+Once started the simulation runs in real time (plus whatever warp_to skips), so programs built on
+the real clock behave the way they would in game.
+"""
+from __future__ import print_function, absolute_import, division
+
+import time
+
+from .. import standin
+
+
+class SimServer(standin.StandInServer):
+    """
+    StandInServer with SpaceCenter and Drawing bound to a Simulation, which it steps in real time
+    """
+    def __init__(self, sim, latency=0.0, jitter=0.0, seed=None):
+        """
+        :param sim: the simulation.Simulation to serve
+        :param latency: seconds to hold every RPC response back for
+        :param jitter: +/- seconds of uniform random variation on the latency
+        :param seed: for the jitter
+        """
+        super(SimServer, self).__init__(latency, jitter, seed)
+        self.sim = sim
+        self.bind('SpaceCenter', sim.spaceCenter)
+        self.bind('Drawing', sim.connection.drawing)
+        self._physics = None
+
+    def start(self, address='127.0.0.1', rpcPort=0, streamPort=0):
+        """
+        Start the simulation clock and listen for clients
+
+        :return: (rpcPort, streamPort)
+        """
+        ports = self.serve(address, rpcPort, streamPort)
+        if self._physics is None:
+            self._physics = self._startThread(self._step)
+        return ports
+
+    def stop(self):
+        self.shutdown()
+        if self._physics is not None:
+            self._physics.join()
+            self._physics = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.stop()
+
+    def _step(self):
+        last = time.monotonic()
+        while not self._stopped.wait(self.sim.dt):
+            now = time.monotonic()
+            with self.callLock:
+                self.sim.advance(now - last)
+            last = now
@@ -0,0 +1,338 @@
+"""
+The simulator itself: a clock, one body, the vessels around it, and a connection that looks enough like
+krpc's for kspy's programs to run against it without KSP
+
+    sim = Simulation(body=KERBIN)
+    vessel = sim.addLandedVessel('Rocket', [Stage(dryMass=2000, fuelMass=8000, thrust=215000, isp=320)],
+                                 latitude=-0.0972, longitude=-74.5577)
+    vessel.control.activate_next_stage()
+
+    ascend = launch.Ascend(sim.connection, vessel, 80000)
+    sim.run(ascend, timeout=600)
+
+Nothing happens between calls: the universe only moves when the simulation steps, which it does
+whenever a program run through Simulation.run sleeps, so a ten minute ascent takes as long as the
+maths does. Programs that cache things on disk (Descend's heightmap, bodies.BodyCatalog) write under
+kspy's data directory, so point KSPY_DATA at a temporary directory for throwaway runs.
+
+The simplifications are deliberate: one body that doesn't move, no spheres of influence, point mass
+vessels with a fixed drag area, and an autopilot that turns at a fixed rate instead of through torque.
+"""
+from __future__ import print_function, absolute_import, division
+
+import math
+
+from .. import executor
+from .. import kepler
+from .. import orbit as localOrbit
+from . import body as simBody
+from . import frames
+from . import vessel as simVessel
+
+
+class SimulationTimeout(RuntimeError):
+    """
+    Raised when a program run in the simulator doesn't finish in the simulated time it was given
+    """
+
+
+class SimClock(object):
+    """
+    Monotonic clock and sleep for executor.Executor and scheduler.Scheduler that run on simulated time
+    """
+    def __init__(self, sim):
+        self.sim = sim
+
+    def monotonic(self):
+        return self.sim.ut
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.sim.advance(seconds)
+
+
+class SimStream(object):
+    """
+    Stands in for a krpc Stream, working its value out every time it's read
+    """
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+        self.started = True
+        self.removed = False
+        self.rate = 0
+
+    def __call__(self):
+        return self.func(*self.args)
+
+    def start(self, wait=True):
+        self.started = True
+
+    def remove(self):
+        self.removed = True
+
+    def add_callback(self, callback):
+        pass
+
+
+class _Drawn(object):
+    """
+    Something we pretended to draw
+    """
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.visible = True
+
+    def remove(self):
+        self.visible = False
+
+
+class SimDrawing(object):
+    """
+    Stands in for krpc's Drawing service, drawing nothing
+    """
+    def __init__(self):
+        self.drawn = []
+
+    def _add(self, *args, **kwargs):
+        drawn = _Drawn(*args, **kwargs)
+        self.drawn.append(drawn)
+        return drawn
+
+    add_direction = add_line = add_polygon = add_text = _add
+
+    def clear(self, client_only=False):
+        del self.drawn[:]
+
+
+class SpaceCenter(object):
+    """
+    Stands in for krpc's SpaceCenter service
+    """
+    VesselSituation = simVessel.VesselSituation
+
+    def __init__(self, sim):
+        self._sim = sim
+        self._client = sim.connection
+        self._object_id = sim.newId()
+        self.ReferenceFrame = frames.FrameFactory(sim)
+        self.active_vessel = None
+        self.target_vessel = None
+        self.target_body = None
+        self.target_docking_port = None
+        self.g = 6.67408e-11
+        self.saves = 0
+
+    @property
+    def ut(self):
+        return self._sim.ut
+
+    @property
+    def vessels(self):
+        return list(self._sim.vessels)
+
+    @property
+    def bodies(self):
+        return {self._sim.body.name: self._sim.body}
+
+    def warp_to(self, ut, max_rails_rate=100000.0, max_physics_rate=2.0):
+        self._sim.warpTo(ut)
+
+    def quicksave(self):
+        self.saves += 1
+
+    def save(self, name):
+        self.saves += 1
+
+    def transform_position(self, position, from_, to):
+        return to.positionOf(from_.positionFrom(position))
+
+    def transform_direction(self, direction, from_, to):
+        return to.directionOf(from_.directionFrom(direction))
+
+    def transform_velocity(self, position, velocity, from_, to):
+        return to.velocityOf(from_.positionFrom(position), from_.velocityFrom(position, velocity))
+
+
+class SimConnection(object):
+    """
+    Stands in for a krpc.Connection. There's no _rpc_connection, so batch.isRemote is False and kspy
+    evaluates batches, staging checks and body constants directly
+    """
+    def __init__(self, sim):
+        self.sim = sim
+        self.streams = []
+        self.space_center = None
+        self.drawing = SimDrawing()
+
+    def add_stream(self, func, *args):
+        stream = SimStream(func, *args)
+        self.streams.append(stream)
+        return stream
+
+    def close(self):
+        for stream in self.streams:
+            stream.remove()
+        del self.streams[:]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+
+class Simulation(object):
+    """
+    One body and the vessels around it, moved along in fixed time steps
+    """
+    def __init__(self, body=simBody.KERBIN, terrain=None, dt=0.02, ut=0.0):
+        """
+        :param body: body.BodySpec of the body everything happens around
+        :param terrain: function of (latitude, longitude) in degrees returning the terrain height, flat if None
+        :param dt: physics time step, in seconds
+        :param ut: universal time to start at
+        """
+        self._lastId = 0
+        self.ut = float(ut)
+        self.dt = dt
+        # bumped every time anything moves, for whatever caches per state
+        self.version = 0
+
+        self.connection = SimConnection(self)
+        self.connection.space_center = self.spaceCenter = SpaceCenter(self)
+        self.body = simBody.CelestialBody(self, body, terrain)
+        self.vessels = []
+
+    def newId(self):
+        """
+        :return: a fresh object id, unique within this simulation
+        """
+        self._lastId += 1
+        return self._lastId
+
+    # making vessels
+
+    def addVessel(self, name, stages, position, velocity, landed=False, active=None, **kwargs):
+        """
+        :param name: vessel name
+        :param stages: vessel.Stage tuples, bottom first
+        :param position: position from the body's center in its inertial frame (see frames)
+        :param velocity: velocity in the same frame
+        :param landed: start sitting on the surface
+        :param active: make it the active vessel, defaults to doing so if there isn't one yet
+        :param kwargs: passed on to vessel.Vessel, e.g. dragArea and turnRate
+        :return: the new vessel.Vessel
+        """
+        vessel = simVessel.Vessel(self, name, self.body, stages, position, velocity, landed=landed, **kwargs)
+        self.vessels.append(vessel)
+
+        if active or (active is None and self.spaceCenter.active_vessel is None):
+            self.spaceCenter.active_vessel = vessel
+        return vessel
+
+    def addLandedVessel(self, name, stages, latitude, longitude, **kwargs):
+        """
+        Put a vessel on the surface at latitude, longitude (in degrees), ready to launch
+        """
+        height = self.body.equatorial_radius + self.body.surface_height(latitude, longitude)
+        position = height * self.body.surfaceUnit(latitude, longitude)
+        velocity = frames.cross(self.body.spin, position)
+        return self.addVessel(name, stages, position, velocity, landed=True, **kwargs)
+
+    def addOrbitingVessel(self, name, stages, periapsisAltitude, apoapsisAltitude=None, inclination=0.0,
+                          longitudeOfAscendingNode=0.0, argumentOfPeriapsis=0.0, trueAnomaly=0.0, **kwargs):
+        """
+        Put a vessel on an orbit, angles in degrees. A periapsis under the surface makes a suborbital
+        trajectory, start those somewhere other than at periapsis
+
+        :param periapsisAltitude: above the body's equatorial radius
+        :param apoapsisAltitude: defaults to a circular orbit
+        """
+        radius = self.body.equatorial_radius
+        periapsis = radius + periapsisAltitude
+        apoapsis = periapsis if apoapsisAltitude is None else radius + apoapsisAltitude
+
+        semiMajorAxis = (periapsis + apoapsis) / 2.0
+        eccentricity = (apoapsis - periapsis) / (apoapsis + periapsis)
+
+        mu = self.body.gravitational_parameter
+        nu = math.radians(trueAnomaly)
+        meanAnomaly = float(kepler.meanFromTrue(nu, eccentricity))
+        path = localOrbit.LocalOrbit(semiMajorAxis, eccentricity, math.radians(inclination),
+                                     math.radians(longitudeOfAscendingNode), math.radians(argumentOfPeriapsis),
+                                     meanAnomaly, self.ut, mu)
+        return self.addVessel(name, stages, path.position_at(self.ut), path.velocity_at(self.ut), **kwargs)
+
+    # moving time along
+
+    def step(self, dt=None):
+        """
+        Move everything on by one time step
+        """
+        dt = self.dt if dt is None else dt
+        for vessel in self.vessels:
+            vessel.step(dt)
+        self.ut += dt
+        self.version += 1
+
+    def advance(self, seconds):
+        """
+        Move everything on by the input number of seconds, in steps no longer than dt
+        """
+        count = max(1, int(math.ceil(seconds / self.dt - 1e-9)))
+        for _ in range(count):
+            self.step(seconds / count)
+
+    def warpTo(self, ut):
+        """
+        Time warp: jump straight there along the orbits when nothing but gravity is acting on anything,
+        otherwise take long steps while above the atmosphere and physics steps inside it
+        """
+        while self.ut < ut - 1e-9:
+            remaining = ut - self.ut
+            if all(vessel.canCoast() for vessel in self.vessels):
+                for vessel in self.vessels:
+                    vessel.coastTo(ut)
+                self.ut = ut
+                self.version += 1
+                break
+
+            coarse = all(not vessel.grounded and vessel.thrust == 0 and
+                         vessel.altitude() > vessel.body.atmosphere_depth + 5000.0
+                         for vessel in self.vessels)
+            self.step(min(1.0 if coarse else self.dt, remaining))
+
+    # running programs
+
+    def run(self, program, rate=None, finishOn=True, timeout=None, vessel=None, then=None):
+        """
+        Run a program on simulated time until it finishes
+
+        :param program: utils.Program or any callable taking no arguments
+        :param rate: ticks per second, defaults to the program's own
+        :param finishOn: what the program returns once it's done
+        :param timeout: simulated seconds to give it before raising SimulationTimeout
+        :param vessel: the vessel any shared telemetry is for, defaults to the active vessel
+        :param then: successor, as for executor.Executor.add
+        :return: the executor.Task that hosted the program
+        """
+        clock = SimClock(self)
+        host = executor.Executor(self.connection, vessel or self.spaceCenter.active_vessel,
+                                 clock=clock.monotonic, sleep=clock.sleep)
+        task = host.add(program, rate=rate, finishOn=finishOn, then=then)
+
+        limit = None if timeout is None else self.ut + timeout
+        try:
+            while host.running():
+                if limit is not None and self.ut > limit:
+                    raise SimulationTimeout('{0} still running after {1}s'.format(task.name, timeout))
+
+                remaining = host.nextDeadline() - clock.monotonic()
+                if remaining > 0:
+                    clock.sleep(remaining)
+                host.step()
+        finally:
+            host.release()
+
+        return task
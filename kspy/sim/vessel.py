@@ -0,0 +1,1038 @@
+"""
+Vessels for the simulator: a point mass with staged engines and tanks, an autopilot that slews the
+vessel toward its target at a fixed rate, and the Flight, Orbit and Node views krpc hands out
+
+A vessel is described bottom stage first:
+
+    vessel = sim.addLandedVessel('Rocket', [Stage(dryMass=2000, fuelMass=8000, thrust=215000, isp=320),
+                                            Stage(dryMass=1000, fuelMass=2000, thrust=60000, isp=345),
+                                            Stage(dryMass=800, fairingMass=100)],
+                                 latitude=-0.0972, longitude=-74.5577)
+
+The bottom stage's engines light on the first activate_next_stage, and every later activation drops
+the stage below and lights the next one's engines, the way a simple stack staged in KSP works.
+"""
+from __future__ import print_function, absolute_import, division
+
+import collections
+import enum
+import math
+
+import numpy as np
+
+from .. import orbit as localOrbit
+from . import frames
+
+G0 = 9.80665
+
+# KSP's liquid fuel and oxidizer both weigh 5kg a unit, mixed 9:11 by volume
+FUEL_DENSITY = 5.0
+PROPELLANTS = (('LiquidFuel', 0.45), ('Oxidizer', 0.55))
+
+Stage = collections.namedtuple('Stage', 'dryMass fuelMass thrust isp fairingMass')
+Stage.__new__.__defaults__ = (0.0, 0.0, 300.0, 0.0)
+
+
+class VesselSituation(enum.Enum):
+    """
+    Same names and values as krpc's SpaceCenter.VesselSituation
+    """
+    pre_launch = 0
+    orbiting = 1
+    sub_orbital = 2
+    escaping = 3
+    flying = 4
+    landed = 5
+    splashed = 6
+    docked = 7
+
+
+class _Remote(object):
+    """
+    Gives sim objects the _client and _object_id krpc objects have, which kspy's caches key on
+    """
+    def __init__(self, sim):
+        self._sim = sim
+        self._client = sim.connection
+        self._object_id = sim.newId()
+
+
+class Resources(_Remote):
+    """
+    Stands in for krpc's Resources, over a fixed set of parts
+    """
+    def __init__(self, sim, parts):
+        super(Resources, self).__init__(sim)
+        self._parts = parts
+
+    def _each(self):
+        return self._parts() if callable(self._parts) else self._parts
+
+    @property
+    def names(self):
+        if any(part.capacity > 0 for part in self._each()):
+            return [name for name, _ in PROPELLANTS]
+        return []
+
+    def has_resource(self, name):
+        return name in self.names
+
+    def amount(self, name):
+        share = dict(PROPELLANTS).get(name, 0.0)
+        return sum(part.fuel for part in self._each()) * share / FUEL_DENSITY
+
+    def max(self, name):
+        share = dict(PROPELLANTS).get(name, 0.0)
+        return sum(part.capacity for part in self._each()) * share / FUEL_DENSITY
+
+    @staticmethod
+    def density(name):
+        return FUEL_DENSITY
+
+
+class Engine(_Remote):
+    """
+    Stands in for krpc's Engine
+    """
+    def __init__(self, sim, part, thrust, isp):
+        super(Engine, self).__init__(sim)
+        self.part = part
+        self.max_vacuum_thrust = thrust
+        self.specific_impulse = isp
+        self.vacuum_specific_impulse = isp
+        self.kerbin_sea_level_specific_impulse = isp
+        self.active = False
+        self.propellant_names = [name for name, _ in PROPELLANTS]
+
+    @property
+    def has_fuel(self):
+        return self.part.fuel > 0.0
+
+    @property
+    def available_thrust(self):
+        return self.max_vacuum_thrust if self.active and self.has_fuel else 0.0
+
+    @property
+    def max_thrust(self):
+        return self.max_vacuum_thrust if self.active else 0.0
+
+    @property
+    def thrust(self):
+        return self.available_thrust * self.part.vessel.control.throttle
+
+    @property
+    def throttle(self):
+        return self.part.vessel.control.throttle if self.active else 0.0
+
+
+class Fairing(_Remote):
+    """
+    Stands in for krpc's Fairing
+    """
+    def __init__(self, sim, part):
+        super(Fairing, self).__init__(sim)
+        self.part = part
+        self.jettisoned = False
+
+    def jettison(self):
+        if not self.jettisoned:
+            self.jettisoned = True
+            self.part.dryMass = 0.0
+
+
+class Part(_Remote):
+    """
+    Stands in for krpc's Part. Each simulated stage is one part (or two, with a fairing)
+    """
+    def __init__(self, sim, vessel, name, stage, decoupleStage, dryMass, fuelMass=0.0, tag=''):
+        super(Part, self).__init__(sim)
+        self.vessel = vessel
+        self.name = name
+        self.title = name
+        self.tag = tag
+        self.stage = stage
+        self.decouple_stage = decoupleStage
+        self.dryMass = dryMass
+        self.fuel = fuelMass
+        self.capacity = fuelMass
+        self.engine = None
+        self.fairing = None
+        self.resources = Resources(sim, [self])
+
+    @property
+    def mass(self):
+        return self.dryMass + self.fuel
+
+    @property
+    def dry_mass(self):
+        return self.dryMass
+
+    def position(self, reference_frame):
+        return self.vessel.position(reference_frame)
+
+
+class Parts(_Remote):
+    """
+    Stands in for krpc's Parts, over whatever is still attached
+    """
+    def __init__(self, sim, vessel):
+        super(Parts, self).__init__(sim)
+        self.vessel = vessel
+
+    @property
+    def all(self):
+        return list(self.vessel.attached)
+
+    @property
+    def root(self):
+        return self.vessel.attached[-1] if self.vessel.attached else None
+
+    @property
+    def controlling(self):
+        return self.root
+
+    @property
+    def engines(self):
+        return [part.engine for part in self.vessel.attached if part.engine is not None]
+
+    @property
+    def fairings(self):
+        return [part.fairing for part in self.vessel.attached if part.fairing is not None]
+
+    def in_decouple_stage(self, stage):
+        return [part for part in self.vessel.attached if part.decouple_stage == stage]
+
+    def in_stage(self, stage):
+        return [part for part in self.vessel.attached if part.stage == stage]
+
+    def with_tag(self, tag):
+        return [part for part in self.vessel.attached if part.tag == tag]
+
+    def with_name(self, name):
+        return [part for part in self.vessel.attached if part.name == name]
+
+
+class Control(_Remote):
+    """
+    Stands in for krpc's Control
+    """
+    def __init__(self, sim, vessel):
+        super(Control, self).__init__(sim)
+        self.vessel = vessel
+        self._throttle = 0.0
+
+        self.sas = False
+        self.rcs = False
+        self.gear = False
+        self.legs = False
+        self.wheels = False
+        self.brakes = False
+        self.lights = False
+        self.abort = False
+        self.solar_panels = False
+        self.antennas = False
+
+        self.pitch = self.yaw = self.roll = 0.0
+        self.up = self.right = self.forward = 0.0
+        self.wheel_throttle = self.wheel_steering = 0.0
+
+        self.nodes = []
+
+    @property
+    def throttle(self):
+        return self._throttle
+
+    @throttle.setter
+    def throttle(self, value):
+        self._throttle = min(1.0, max(0.0, float(value)))
+
+    @property
+    def current_stage(self):
+        return self.vessel.currentStage
+
+    def activate_next_stage(self):
+        return self.vessel.activateNextStage()
+
+    def add_node(self, ut, prograde=0.0, normal=0.0, radial=0.0):
+        node = Node(self._sim, self.vessel, ut, prograde, normal, radial)
+        self.nodes.append(node)
+        self.nodes.sort(key=lambda n: n.ut)
+        return node
+
+    def remove_nodes(self):
+        for node in list(self.nodes):
+            node.remove()
+
+
+class AutoPilot(_Remote):
+    """
+    Stands in for krpc's AutoPilot. Rather than modelling torque, the vessel turns toward the target
+    at a fixed rate
+    """
+    def __init__(self, sim, vessel):
+        super(AutoPilot, self).__init__(sim)
+        self.vessel = vessel
+        self.engaged = False
+        self.reference_frame = None
+        self._direction = (0.0, 1.0, 0.0)
+        self._pitch = 0.0
+        self._heading = 0.0
+        self._mode = 'direction'
+        self.target_roll = float('nan')
+
+    def engage(self):
+        self.engaged = True
+
+    def disengage(self):
+        self.engaged = False
+
+    @property
+    def target_direction(self):
+        if self._mode == 'direction':
+            return self._direction
+        return self._frame().directionOf(self.targetInertial())
+
+    @target_direction.setter
+    def target_direction(self, value):
+        self._direction = tuple(float(x) for x in value)
+        self._mode = 'direction'
+
+    @property
+    def target_pitch(self):
+        return self._pitch
+
+    @target_pitch.setter
+    def target_pitch(self, value):
+        self._pitch = float(value)
+        self._mode = 'pitchHeading'
+
+    @property
+    def target_heading(self):
+        return self._heading
+
+    @target_heading.setter
+    def target_heading(self, value):
+        self._heading = float(value)
+        self._mode = 'pitchHeading'
+
+    def target_pitch_and_heading(self, pitch, heading):
+        self.target_pitch = pitch
+        self.target_heading = heading
+
+    def _frame(self):
+        return self.reference_frame or self.vessel.surface_reference_frame
+
+    def targetInertial(self):
+        """
+        :return: the inertial unit direction we're trying to point in
+        """
+        if self._mode == 'direction':
+            return frames.unit(self._frame().directionFrom(self._direction))
+
+        up, north, east = self.vessel.surfaceAxes()
+        pitch, heading = math.radians(self._pitch), math.radians(self._heading)
+        return (math.sin(pitch) * up +
+                math.cos(pitch) * (math.cos(heading) * north + math.sin(heading) * east))
+
+    @property
+    def error(self):
+        target = self.targetInertial()
+        return math.degrees(math.acos(max(-1.0, min(1.0, target.dot(self.vessel.forward)))))
+
+    @property
+    def pitch_error(self):
+        up = self.vessel.surfaceAxes()[0]
+        return math.degrees(math.asin(max(-1.0, min(1.0, self.targetInertial().dot(up)))) -
+                            math.asin(max(-1.0, min(1.0, self.vessel.forward.dot(up)))))
+
+    @property
+    def heading_error(self):
+        return self.error
+
+    def wait(self):
+        """
+        Let the simulation run until we're pointing where we want to be
+        """
+        limit = self._sim.ut + 180.0
+        while self.engaged and self.error > 0.5 and self._sim.ut < limit:
+            self._sim.step()
+
+
+class Node(_Remote):
+    """
+    Stands in for krpc's Node. The burn is fixed in inertial space when the node is placed, and the
+    thrust the vessel puts out while the node exists counts against it
+    """
+    def __init__(self, sim, vessel, ut, prograde, normal, radial):
+        super(Node, self).__init__(sim)
+        self.vessel = vessel
+        self._ut = float(ut)
+        self._prograde = float(prograde)
+        self._normal = float(normal)
+        self._radial = float(radial)
+        self.applied = np.zeros(3)
+        self.removed = False
+        self._plan()
+
+        self.reference_frame = frames.ReferenceFrame(sim, self._frameState, 'NodeFrame')
+        self.orbital_reference_frame = frames.ReferenceFrame(sim, self._orbitalFrameState, 'NodeOrbitalFrame')
+
+    def __bool__(self):
+        return not self.removed
+
+    __nonzero__ = __bool__
+
+    def _plan(self):
+        coast = self.vessel.coastOrbit()
+        r = coast.position_at(self._ut)
+        v = coast.velocity_at(self._ut)
+
+        prograde = frames.unit(v)
+        normal = frames.unit(frames.cross(r, v))
+        radial = frames.cross(normal, prograde)
+
+        self.burn = self._prograde * prograde + self._normal * normal + self._radial * radial
+        self.axes = (prograde, normal, radial)
+        self.stateAtNode = (r, v)
+
+    def _frameState(self, ut):
+        y = frames.unit(self.burn) if np.any(self.burn) else self.axes[0]
+        x = frames.perpendicular(y)
+        axes = np.array([x, y, frames.cross(y, x)])
+        return self.vessel.r, axes, self.vessel.v, frames.ZERO
+
+    def _orbitalFrameState(self, ut):
+        prograde, normal, radial = self.axes
+        axes = np.array([-radial, prograde, normal])
+        return self.vessel.r, axes, self.vessel.v, frames.ZERO
+
+    # the node's parameters, which move the burn when they change
+
+    def _property(name):
+        def get(self):
+            return getattr(self, '_' + name)
+
+        def set(self, value):
+            setattr(self, '_' + name, float(value))
+            self._plan()
+
+        return property(get, set)
+
+    ut = _property('ut')
+    prograde = _property('prograde')
+    normal = _property('normal')
+    radial = _property('radial')
+
+    @property
+    def delta_v(self):
+        return float(np.linalg.norm(self.burn))
+
+    @property
+    def remaining_delta_v(self):
+        return float(np.linalg.norm(self.burn - self.applied))
+
+    def burn_vector(self, reference_frame=None):
+        return (reference_frame or self.reference_frame).directionOf(self.burn)
+
+    def remaining_burn_vector(self, reference_frame=None):
+        return (reference_frame or self.reference_frame).directionOf(self.burn - self.applied)
+
+    @property
+    def time_to(self):
+        return self._ut - self._sim.ut
+
+    @property
+    def orbit(self):
+        r, v = self.stateAtNode
+        return Orbit(self._sim, self.vessel.body, lambda: (r, v + self.burn, self._ut))
+
+    def position(self, reference_frame):
+        return reference_frame.positionOf(self.stateAtNode[0])
+
+    def direction(self, reference_frame):
+        return reference_frame.directionOf(frames.unit(self.burn))
+
+    def remove(self):
+        self.removed = True
+        if self in self.vessel.control.nodes:
+            self.vessel.control.nodes.remove(self)
+
+
+class Orbit(_Remote):
+    """
+    Stands in for krpc's Orbit, worked out from a state vector each time it's read
+    """
+    def __init__(self, sim, body, source):
+        """
+        :param source: function returning (position, velocity, ut) to derive the orbit from
+        """
+        super(Orbit, self).__init__(sim)
+        self.body = body
+        self._source = source
+        self._cache = (None, None)
+
+    def local(self):
+        """
+        :return: orbit.LocalOrbit for the current state
+        """
+        key, cached = self._cache
+        if key != self._sim.version:
+            r, v, ut = self._source()
+            cached = localOrbit.LocalOrbit.fromStateVectors(r, v, self.body.gravitational_parameter, ut)
+            self._cache = (self._sim.version, cached)
+        return cached
+
+    def __getattr__(self, attribute):
+        # element names and propagation methods are the same as LocalOrbit's
+        if attribute.startswith('_'):
+            raise AttributeError(attribute)
+        return getattr(self.local(), attribute)
+
+    @property
+    def apoapsis_altitude(self):
+        return self.local().apoapsis - self.body.equatorial_radius
+
+    @property
+    def periapsis_altitude(self):
+        return self.local().periapsis - self.body.equatorial_radius
+
+    @property
+    def semi_minor_axis(self):
+        o = self.local()
+        return abs(o.semi_major_axis) * math.sqrt(abs(1.0 - o.eccentricity ** 2))
+
+    @property
+    def radius(self):
+        return float(np.linalg.norm(self._source()[0]))
+
+    @property
+    def speed(self):
+        return float(np.linalg.norm(self._source()[1]))
+
+    @property
+    def orbital_speed(self):
+        return self.speed
+
+    @property
+    def true_anomaly(self):
+        return self.local().true_anomaly_at_ut(self._sim.ut)
+
+    @property
+    def mean_anomaly(self):
+        return self.local().mean_anomaly_at_ut(self._sim.ut)
+
+    @property
+    def eccentric_anomaly(self):
+        return self.local().eccentric_anomaly_at_ut(self._sim.ut)
+
+    @property
+    def time_to_apoapsis(self):
+        o = self.local()
+        if o.hyperbolic:
+            return float('inf')
+        return o.ut_at_true_anomaly(math.pi, after=self._sim.ut) - self._sim.ut
+
+    @property
+    def time_to_periapsis(self):
+        o = self.local()
+        return o.ut_at_true_anomaly(0.0, after=self._sim.ut) - self._sim.ut
+
+    @property
+    def time_to_soi_change(self):
+        return float('nan')
+
+    @property
+    def next_orbit(self):
+        return None
+
+    def true_anomaly_at_ut(self, ut):
+        return self.local().true_anomaly_at_ut(ut)
+
+    def position_at(self, ut, reference_frame):
+        return reference_frame.positionOf(self.local().position_at(ut))
+
+
+class Flight(_Remote):
+    """
+    Stands in for krpc's Flight, in one reference frame
+    """
+    def __init__(self, sim, vessel, referenceFrame):
+        super(Flight, self).__init__(sim)
+        self.vessel = vessel
+        self.reference_frame = referenceFrame
+
+    def _relativeVelocity(self):
+        origin, _, frameVelocity, angularVelocity = self.reference_frame._now()
+        vessel = self.vessel
+        return vessel.v - frameVelocity - frames.cross(angularVelocity, vessel.r - origin)
+
+    @property
+    def mean_altitude(self):
+        return self.vessel.altitude()
+
+    @property
+    def elevation(self):
+        return self.vessel.terrainHeight()
+
+    @property
+    def surface_altitude(self):
+        return self.vessel.altitude() - max(0.0, self.vessel.terrainHeight())
+
+    @property
+    def bedrock_altitude(self):
+        return self.vessel.altitude() - self.vessel.terrainHeight()
+
+    @property
+    def latitude(self):
+        return self.vessel.coordinates()[0]
+
+    @property
+    def longitude(self):
+        return self.vessel.coordinates()[1]
+
+    @property
+    def velocity(self):
+        return self.reference_frame.velocityOf(self.vessel.r, self.vessel.v)
+
+    @property
+    def speed(self):
+        return float(np.linalg.norm(self._relativeVelocity()))
+
+    @property
+    def vertical_speed(self):
+        return float(self._relativeVelocity().dot(self.vessel.surfaceAxes()[0]))
+
+    @property
+    def horizontal_speed(self):
+        velocity = self._relativeVelocity()
+        vertical = velocity.dot(self.vessel.surfaceAxes()[0])
+        return math.sqrt(max(0.0, velocity.dot(velocity) - vertical * vertical))
+
+    @property
+    def center_of_mass(self):
+        return self.reference_frame.positionOf(self.vessel.r)
+
+    @property
+    def direction(self):
+        return self.reference_frame.directionOf(self.vessel.forward)
+
+    @property
+    def rotation(self):
+        return self.reference_frame.rotationOf(self.vessel.axes())
+
+    @property
+    def prograde(self):
+        return self.reference_frame.directionOf(frames.unit(self._relativeVelocity()))
+
+    @property
+    def retrograde(self):
+        return tuple(-x for x in self.prograde)
+
+    @property
+    def pitch(self):
+        up = self.vessel.surfaceAxes()[0]
+        return math.degrees(math.asin(max(-1.0, min(1.0, self.vessel.forward.dot(up)))))
+
+    @property
+    def heading(self):
+        up, north, east = self.vessel.surfaceAxes()
+        forward = self.vessel.forward
+        return math.degrees(math.atan2(forward.dot(east), forward.dot(north))) % 360.0
+
+    @property
+    def roll(self):
+        up = self.vessel.surfaceAxes()[0]
+        right = self.vessel.right()
+        top = -self.vessel.bottom
+        return math.degrees(math.atan2(-right.dot(up), top.dot(up)))
+
+    @property
+    def atmosphere_density(self):
+        return self.vessel.body.density(self.vessel.altitude())
+
+    @property
+    def static_pressure(self):
+        return self.vessel.body.pressure_at(self.vessel.altitude())
+
+    @property
+    def dynamic_pressure(self):
+        airspeed = self.vessel.airVelocity()
+        return 0.5 * self.atmosphere_density * airspeed.dot(airspeed)
+
+    @property
+    def true_air_speed(self):
+        return float(np.linalg.norm(self.vessel.airVelocity()))
+
+    @property
+    def mach(self):
+        return self.true_air_speed / 340.0
+
+    @property
+    def drag(self):
+        return self.reference_frame.directionOf(self.vessel.dragForce())
+
+    @property
+    def g_force(self):
+        return float(np.linalg.norm(self.vessel.properAcceleration)) / G0
+
+
+class Vessel(_Remote):
+    """
+    Stands in for krpc's Vessel: a point mass with a pointing direction, moving around one body
+    """
+    def __init__(self, sim, name, body, stages, position, velocity, landed=False, dragArea=2.0, turnRate=30.0):
+        """
+        :param sim: the Simulation the vessel belongs to
+        :param name: vessel name
+        :param body: CelestialBody we're around
+        :param stages: Stage tuples, bottom (first to fire) first
+        :param position: inertial position
+        :param velocity: inertial velocity
+        :param landed: start sitting on the surface, waiting to launch
+        :param dragArea: drag coefficient times reference area, in m^2
+        :param turnRate: how fast the autopilot can turn us, in degrees per second
+        """
+        super(Vessel, self).__init__(sim)
+        self.name = name
+        self.body = body
+        self.type = 'ship'
+        self.dragArea = dragArea
+        self.turnRate = turnRate
+
+        self.r = np.array(position, dtype=float)
+        self.v = np.array(velocity, dtype=float)
+        self.properAcceleration = np.zeros(3)
+        self.launchUT = None
+
+        self.grounded = landed
+        self.launched = not landed
+        self.touchdownSpeed = None
+
+        # point straight up (or prograde if we're flying) with the top of the vessel facing north-ish
+        up = frames.unit(self.r)
+        self.forward = up if landed else frames.unit(self.v)
+        self.bottom = frames.unit(frames.cross(self.forward, frames.perpendicular(self.forward)))
+
+        self.attached = []
+        count = len(stages)
+        for index, stage in enumerate(stages):
+            activation = count - 1 - index
+            decouple = count - 2 - index
+            part = Part(sim, self, 'stage{0}'.format(index), activation, decouple, stage.dryMass, stage.fuelMass)
+            if stage.thrust > 0:
+                part.engine = Engine(sim, part, stage.thrust, stage.isp)
+            self.attached.append(part)
+
+            if stage.fairingMass > 0:
+                fairing = Part(sim, self, 'fairing{0}'.format(index), activation, decouple, stage.fairingMass,
+                               tag='deployFairing')
+                fairing.fairing = Fairing(sim, fairing)
+                self.attached.append(fairing)
+
+        self.currentStage = count
+
+        self.control = Control(sim, self)
+        self.auto_pilot = AutoPilot(sim, self)
+        self.parts = Parts(sim, self)
+        self.resources = Resources(sim, lambda: self.attached)
+        self.orbit = Orbit(sim, body, lambda: (self.r, self.v, self._sim.ut))
+
+        self.reference_frame = frames.ReferenceFrame(sim, self._vesselState, 'VesselFrame')
+        self.surface_reference_frame = frames.ReferenceFrame(sim, self._surfaceState, 'SurfaceFrame')
+        self.orbital_reference_frame = frames.ReferenceFrame(sim, self._orbitalState, 'OrbitalFrame')
+        self.surface_velocity_reference_frame = frames.ReferenceFrame(sim, self._surfaceVelocityState,
+                                                                      'SurfaceVelocityFrame')
+
+        self._flights = {}
+
+    def __repr__(self):
+        return '<sim Vessel {0}>'.format(self.name)
+
+    # frames
+
+    def right(self):
+        return frames.cross(self.bottom, self.forward)
+
+    def axes(self):
+        return np.array([self.right(), self.forward, self.bottom])
+
+    def surfaceAxes(self):
+        up = frames.unit(self.r)
+        north = frames.unit(np.array([0.0, 0.0, 1.0]) - up[2] * up)
+        if not np.any(north):
+            north = frames.perpendicular(up)
+        east = frames.cross(north, up)
+        return up, north, east
+
+    def _vesselState(self, ut):
+        return self.r, self.axes(), self.v, frames.ZERO
+
+    def _surfaceState(self, ut):
+        return self.r, np.array(self.surfaceAxes()), self.v, self.body.spin
+
+    def _orbitalState(self, ut):
+        prograde = frames.unit(self.v)
+        normal = frames.unit(frames.cross(self.r, self.v))
+        return self.r, np.array([-frames.unit(self.r), prograde, normal]), self.v, frames.ZERO
+
+    def _surfaceVelocityState(self, ut):
+        up = frames.unit(self.r)
+        y = frames.unit(self.airVelocity())
+        if not np.any(y):
+            y = self.surfaceAxes()[1]
+        z = frames.unit(frames.cross(up, y))
+        if not np.any(z):
+            z = frames.perpendicular(y)
+        return self.r, np.array([frames.cross(z, y), y, z]), self.v, frames.ZERO
+
+    # where we are
+
+    def position(self, reference_frame):
+        return reference_frame.positionOf(self.r)
+
+    def velocity(self, reference_frame):
+        return reference_frame.velocityOf(self.r, self.v)
+
+    def direction(self, reference_frame):
+        return reference_frame.directionOf(self.forward)
+
+    def rotation(self, reference_frame):
+        return reference_frame.rotationOf(self.axes())
+
+    def flight(self, reference_frame=None):
+        if reference_frame is None:
+            reference_frame = self.surface_reference_frame
+
+        flight = self._flights.get(reference_frame._object_id)
+        if flight is None:
+            flight = self._flights[reference_frame._object_id] = Flight(self._sim, self, reference_frame)
+        return flight
+
+    def coordinates(self):
+        return self.body.coordinates(self.r)
+
+    def altitude(self):
+        return float(np.linalg.norm(self.r)) - self.body.equatorial_radius
+
+    def terrainHeight(self):
+        return self.body.surface_height(*self.coordinates())
+
+    def airVelocity(self):
+        return self.v - frames.cross(self.body.spin, self.r)
+
+    def dragForce(self, r=None, v=None):
+        r = self.r if r is None else r
+        v = self.v if v is None else v
+        density = self.body.density(float(np.linalg.norm(r)) - self.body.equatorial_radius)
+        if not density:
+            return np.zeros(3)
+        air = v - frames.cross(self.body.spin, r)
+        return -0.5 * density * self.dragArea * np.linalg.norm(air) * air
+
+    def coastOrbit(self):
+        return localOrbit.LocalOrbit.fromStateVectors(self.r, self.v, self.body.gravitational_parameter,
+                                                      self._sim.ut)
+
+    # mass and engines
+
+    @property
+    def mass(self):
+        return sum(part.mass for part in self.attached)
+
+    @property
+    def dry_mass(self):
+        return sum(part.dryMass for part in self.attached)
+
+    def engines(self):
+        return [part.engine for part in self.attached if part.engine is not None and part.engine.active]
+
+    @property
+    def available_thrust(self):
+        return sum(engine.available_thrust for engine in self.engines())
+
+    @property
+    def max_thrust(self):
+        return sum(engine.max_thrust for engine in self.engines())
+
+    @property
+    def thrust(self):
+        return self.available_thrust * self.control.throttle
+
+    @property
+    def specific_impulse(self):
+        burning = [engine for engine in self.engines() if engine.available_thrust > 0]
+        if not burning:
+            return 0.0
+        thrust = sum(engine.max_vacuum_thrust for engine in burning)
+        return thrust / sum(engine.max_vacuum_thrust / engine.specific_impulse for engine in burning)
+
+    vacuum_specific_impulse = specific_impulse
+    kerbin_sea_level_specific_impulse = specific_impulse
+
+    def resources_in_decouple_stage(self, stage, cumulative=True):
+        if cumulative:
+            return Resources(self._sim, lambda: [part for part in self.attached if part.decouple_stage >= stage])
+        return Resources(self._sim, lambda: [part for part in self.attached if part.decouple_stage == stage])
+
+    def activateNextStage(self):
+        if self.currentStage <= 0:
+            return []
+
+        self.currentStage -= 1
+        stage = self.currentStage
+
+        # drop whatever was holding on until now, then light whatever's in the new stage
+        self.attached = [part for part in self.attached if part.decouple_stage != stage]
+        for part in self.attached:
+            if part.stage == stage and part.engine is not None:
+                part.engine.active = True
+        return []
+
+    @property
+    def situation(self):
+        if self.grounded:
+            return VesselSituation.landed if self.launched else VesselSituation.pre_launch
+
+        if self.altitude() < self.body.atmosphere_depth:
+            return VesselSituation.flying
+
+        coast = self.coastOrbit()
+        if coast.eccentricity >= 1.0:
+            return VesselSituation.escaping
+        if coast.periapsis < self.body.equatorial_radius + self.body.atmosphere_depth:
+            return VesselSituation.sub_orbital
+        return VesselSituation.orbiting
+
+    @property
+    def met(self):
+        return 0.0 if self.launchUT is None else self._sim.ut - self.launchUT
+
+    # physics
+
+    def _steer(self, dt):
+        autoPilot = self.auto_pilot
+        if not autoPilot.engaged:
+            return
+
+        target = autoPilot.targetInertial()
+        if not np.any(target):
+            return
+
+        cosine = max(-1.0, min(1.0, self.forward.dot(target)))
+        angle = math.acos(cosine)
+        if angle < 1e-9:
+            return
+
+        turn = min(angle, math.radians(self.turnRate) * dt)
+        axis = frames.cross(self.forward, target)
+        if np.linalg.norm(axis) < 1e-12:
+            axis = self.bottom
+        axis = frames.unit(axis)
+
+        # Rodrigues' rotation of both of our axes about the same axis
+        c, s = math.cos(turn), math.sin(turn)
+        for name in ('forward', 'bottom'):
+            vector = getattr(self, name)
+            rotated = vector * c + frames.cross(axis, vector) * s + axis * axis.dot(vector) * (1 - c)
+            setattr(self, name, frames.unit(rotated))
+
+    def _acceleration(self, r, v, thrustAcceleration):
+        radius = np.linalg.norm(r)
+        gravity = -self.body.gravitational_parameter / radius ** 3 * r
+        return gravity + thrustAcceleration + self.dragForce(r, v) / self.mass
+
+    def _burn(self, dt):
+        throttle = self.control.throttle
+        for engine in self.engines():
+            if engine.available_thrust > 0:
+                flow = engine.max_vacuum_thrust * throttle / (engine.specific_impulse * G0)
+                engine.part.fuel = max(0.0, engine.part.fuel - flow * dt)
+
+    def step(self, dt):
+        """
+        Move the vessel on by dt seconds
+        """
+        self._steer(dt)
+
+        mass = self.mass
+        thrustAcceleration = self.thrust / mass * self.forward
+
+        if self.grounded:
+            up = frames.unit(self.r)
+            weight = self.body.gravitational_parameter / self.r.dot(self.r)
+            if thrustAcceleration.dot(up) <= weight:
+                # sat on the ground, going round with the body
+                theta = self.body.rotational_speed * dt
+                c, s = math.cos(theta), math.sin(theta)
+                x, y, z = self.r
+                self.r = np.array([c * x - s * y, s * x + c * y, z])
+                self.v = frames.cross(self.body.spin, self.r)
+                self.properAcceleration = weight * up
+                self._burn(dt)
+                return
+
+            self.grounded = False
+            if not self.launched:
+                self.launched = True
+                self.launchUT = self._sim.ut
+
+        # RK4, holding thrust and mass constant over the step
+        r, v = self.r, self.v
+        a1 = self._acceleration(r, v, thrustAcceleration)
+        r2, v2 = r + 0.5 * dt * v, v + 0.5 * dt * a1
+        a2 = self._acceleration(r2, v2, thrustAcceleration)
+        r3, v3 = r + 0.5 * dt * v2, v + 0.5 * dt * a2
+        a3 = self._acceleration(r3, v3, thrustAcceleration)
+        r4, v4 = r + dt * v3, v + dt * a3
+        a4 = self._acceleration(r4, v4, thrustAcceleration)
+
+        self.r = r + dt / 6.0 * (v + 2 * v2 + 2 * v3 + v4)
+        self.v = v + dt / 6.0 * (a1 + 2 * a2 + 2 * a3 + a4)
+        self.properAcceleration = thrustAcceleration + self.dragForce() / mass
+
+        for node in self.control.nodes:
+            node.applied = node.applied + thrustAcceleration * dt
+
+        self._burn(dt)
+        self._checkGround()
+
+    def _checkGround(self):
+        height = self.altitude() - max(0.0, self.terrainHeight())
+        if height > 0:
+            return
+
+        surfaceVelocity = self.airVelocity()
+        if surfaceVelocity.dot(self.r) > 0:
+            return
+
+        self.touchdownSpeed = float(np.linalg.norm(surfaceVelocity))
+        self.grounded = True
+        self.launched = True
+
+        up = frames.unit(self.r)
+        self.r = up * (self.body.equatorial_radius + max(0.0, self.terrainHeight()))
+        self.v = frames.cross(self.body.spin, self.r)
+
+    def canCoast(self):
+        """
+        :return: True if nothing but gravity will act on us until the orbit brings us back round,
+                 so we can be moved along analytically
+        """
+        if self.grounded or self.thrust > 0:
+            return False
+        coast = self.coastOrbit()
+        floor = self.body.equatorial_radius + self.body.atmosphere_depth
+        return coast.periapsis > floor and self.altitude() > self.body.atmosphere_depth
+
+    def coastTo(self, ut):
+        """
+        Jump along our orbit to ut, only valid when canCoast
+        """
+        coast = self.coastOrbit()
+        self.r = coast.position_at(ut)
+        self.v = coast.velocity_at(ut)
+        self.properAcceleration = np.zeros(3)
+
+        # there's plenty of time to turn during a warp
+        if self.auto_pilot.engaged:
+            self._steer(1e9)
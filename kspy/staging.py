@@ -0,0 +1,148 @@
+"""
+Event-driven staging on server-side kRPC expressions
+
+Rather than asking the server about every engine in the stage each tick, a StageTrigger describes
+"this stage is spent" as a kRPC Expression once, and the server evaluates it every physics frame and
+tells us when it comes true. Between setting the trigger up and it firing there's no RPC traffic at
+all, and we hear about a flameout as soon as the server's next stream update goes out.
+
+    trigger = staging.StageTrigger(vessel)
+    trigger.wait()
+    vessel.control.activate_next_stage()
+    trigger.remove()
+"""
+from __future__ import print_function, absolute_import, division
+
+import threading
+
+from . import batch
+
+
+def _call(connection, func, *args):
+    return connection.krpc.Expression.call(connection.get_call(func, *args))
+
+
+def allOf(connection, expressions):
+    """
+    :return: Expression that's true when every input expression is, true for no expressions
+    """
+    Expression = connection.krpc.Expression
+    if not expressions:
+        return Expression.constant_bool(True)
+
+    combined = expressions[0]
+    for expression in expressions[1:]:
+        combined = Expression.and_(combined, expression)
+    return combined
+
+
+def anyOf(connection, expressions):
+    """
+    :return: Expression that's true when any of the input expressions is, false for no expressions
+    """
+    Expression = connection.krpc.Expression
+    if not expressions:
+        return Expression.constant_bool(False)
+
+    combined = expressions[0]
+    for expression in expressions[1:]:
+        combined = Expression.or_(combined, expression)
+    return combined
+
+
+def flameoutCondition(connection, engines):
+    """
+    :param engines: krpc Engine objects
+    :return: Expression that's true once none of the engines is both active and fuelled
+    """
+    Expression = connection.krpc.Expression
+    burning = [Expression.and_(_call(connection, getattr, engine, 'active'),
+                               _call(connection, getattr, engine, 'has_fuel'))
+               for engine in engines]
+    return Expression.not_(anyOf(connection, burning))
+
+
+def fuelCondition(connection, resources, names, fraction=0.0):
+    """
+    :param resources: krpc Resources object, e.g. from vessel.resources_in_decouple_stage
+    :param names: resource names to watch, any the resources object doesn't hold are ignored
+    :param fraction: how much of each resource's capacity can be left for it to count as empty
+    :return: Expression that's true once every watched resource is down to fraction of its capacity
+    """
+    Expression = connection.krpc.Expression
+
+    with batch.Batch(connection) as b:
+        held = b.add(getattr, resources, 'names')
+    names = [name for name in held() if name in names]
+
+    with batch.Batch(connection) as b:
+        capacities = [b.add(resources.max, name) for name in names]
+
+    empty = [Expression.less_than_or_equal(_call(connection, resources.amount, name),
+                                           Expression.constant_float(fraction * capacity()))
+             for name, capacity in zip(names, capacities)]
+    return allOf(connection, empty)
+
+
+class StageTrigger(object):
+    """
+    Fires once the engines that the next stage will drop have all burned out
+    (or, given resource names, once the stage's fuel is gone too)
+    """
+    def __init__(self, vessel, stage=None, resources=None, fuelFraction=0.0, engines=None):
+        """
+        :param vessel: the vessel to watch
+        :param stage: the current stage, defaults to asking the vessel
+        :param resources: resource names, also fire when all of them are down to fuelFraction
+                          of their capacity in the stage being dropped
+        :param fuelFraction: see resources
+        :param engines: the engines the next stage drops, if the caller already knows them
+                        (e.g. from a topology.VesselTopology), otherwise we go and find them
+        """
+        self.vessel = vessel
+        self.connection = batch.clientOf(vessel)
+
+        if stage is None:
+            stage = vessel.control.current_stage
+        self.stage = stage
+
+        if engines is None:
+            # everything that gets thrown away when we next stage
+            parts = vessel.parts.in_decouple_stage(stage - 1)
+            with batch.Batch(self.connection) as b:
+                engines = [b.add(getattr, part, 'engine') for part in parts]
+            engines = [engine() for engine in engines if engine() is not None]
+
+        condition = flameoutCondition(self.connection, engines)
+        if resources:
+            spent = fuelCondition(self.connection, vessel.resources_in_decouple_stage(stage - 1, cumulative=False),
+                                  resources, fuelFraction)
+            condition = self.connection.krpc.Expression.or_(condition, spent)
+
+        self.fired = threading.Event()
+        self.event = self.connection.krpc.add_event(condition)
+        self.event.add_callback(self.fired.set)
+        self.event.start()
+
+    def __call__(self):
+        """
+        :return: True once the stage is spent, without going to the server
+        """
+        return self.fired.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Block until the stage is spent
+
+        :param timeout: give up after this many seconds
+        :return: True if the trigger fired, False if we timed out
+        """
+        return self.fired.wait(timeout)
+
+    def remove(self):
+        """
+        Remove the event from the server, call this once we're done with the trigger
+        """
+        if self.event is not None:
+            self.event.remove()
+            self.event = None
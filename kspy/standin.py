@@ -0,0 +1,801 @@
+"""
+A stand-in kRPC server, for exercising kspy's RPC plumbing without the game
+
+The server answers KRPC.Request messages from a table of procedure handlers, so a real krpc client
+can be pointed at it and every call (batched or not) goes through the real encoding and decoding.
+
+    server = standin.StandInServer()
+    server.register('SpaceCenter', 'CelestialBody_SurfaceHeight',
+                    lambda body, lat, lon: 1000.0,
+                    [server.types.uint64_type, server.types.double_type, server.types.double_type],
+                    server.types.double_type)
+    connection = server.connect()
+
+Remote objects are just object ids on the wire, so handlers get plain integers for them and can
+return integers for them, using uint64_type in place of the class type.
+
+Rather than registering procedures one at a time, a whole service can be bound to a Python object
+graph shaped like krpc's own classes (attribute and method names as in the krpc client), with the
+procedure table read out of krpc's pregenerated stubs:
+
+    server.bind('SpaceCenter', spaceCenter)
+    server.serve()                       # listen on TCP, with streams and events
+    connection = server.connectTcp()     # a real krpc.connect to it
+
+Bound services get and return real objects, which the server hands out ids for. server.latency and
+server.jitter hold every RPC response back, to see how code behaves over a slow link.
+
+kspy still calls a few methods that newer pregenerated stubs have dropped (AutoPilot.engage and
+disengage became the engaged property). Those are listed in EXTRA_METHODS. bind serves them off the
+bound objects like any other procedure, and clients from connect and connectTcp get them added to
+their own copies of the stub classes.
+"""
+from __future__ import print_function, absolute_import, division
+
+import collections
+import inspect
+import operator
+import os
+import random
+import socket
+import threading
+import time
+import warnings
+
+import krpc
+import krpc.services
+from krpc.client import Client
+from krpc.decoder import Decoder
+from krpc.encoder import Encoder
+from krpc.types import Types, ClassType, EnumerationType, ListType, SetType, TupleType, DictionaryType, StaticMethod
+import krpc.schema.KRPC_pb2 as KRPC
+
+Procedure = collections.namedtuple('Procedure', 'handler parameterTypes returnType parameterNames')
+Procedure.__new__.__defaults__ = (None,)
+
+# one procedure from a pregenerated stub, and where it lands on a bound object
+Binding = collections.namedtuple('Binding', 'kind className attribute parameterNames parameterTypes returnType')
+
+# service -> [(class name, method name, procedure)] kspy calls whether or not the stubs have them,
+# all of them taking just the object and returning nothing
+EXTRA_METHODS = {'SpaceCenter': [('AutoPilot', 'engage', 'AutoPilot_Engage'),
+                                 ('AutoPilot', 'disengage', 'AutoPilot_Disengage')]}
+
+
+class ProcedureError(Exception):
+    """
+    Raise this from a handler to send an error result back for that call
+    """
+    pass
+
+
+class _Recorded(Exception):
+    pass
+
+
+class _StubRecorder(object):
+    """
+    Stands in for both the client and the remote object when calling a stub, so the call it would make
+    comes back as an exception instead of going anywhere
+    """
+    def __init__(self, types):
+        self._client = self
+        self._types = types
+
+    def _invoke(self, service, procedure, args, names, types, returnType):
+        raise _Recorded(procedure, list(names), list(types), returnType)
+
+
+def stubProcedures(stub, types=None):
+    """
+    Read every procedure a pregenerated krpc service stub can call
+
+    :param stub: the stub's service class, e.g. krpc.services.spacecenter.SpaceCenter
+    :param types: krpc Types to build the parameter types with
+    :return: dict of procedure name -> Binding
+    """
+    recorder = _StubRecorder(types or Types())
+
+    def record(func, count):
+        try:
+            func(recorder, *([None] * count))
+        except _Recorded as e:
+            return e.args
+        except Exception:
+            # a handful of stubs are deliberately unimplemented client side
+            return None
+
+    def parameters(func):
+        return len(inspect.signature(func).parameters) - 1
+
+    table = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+
+        classes = [(None, stub)] + sorted(stub._classes.items())
+        for className, cls in classes:
+            for attribute, member in vars(cls).items():
+                if attribute.startswith('_'):
+                    continue
+
+                calls = []
+                if isinstance(member, property):
+                    calls.append(('get', record(member.fget, 0)))
+                    if member.fset is not None:
+                        calls.append(('set', record(member.fset, 1)))
+                elif isinstance(member, StaticMethod):
+                    calls.append(('static', record(member._func, parameters(member._func))))
+                elif inspect.isfunction(member):
+                    calls.append(('call', record(member, parameters(member))))
+
+                for kind, recorded in calls:
+                    if recorded is None:
+                        continue
+                    procedure, names, parameterTypes, returnType = recorded
+                    table[procedure] = Binding(kind, className, attribute, names, parameterTypes, returnType)
+
+    return table
+
+
+def _extraMethod(service, procedure, className):
+    """
+    :return: a stub method calling procedure on its object, like the pregenerated ones do
+    """
+    def method(self):
+        return self._client._invoke(service, procedure, [self], ['self'],
+                                    [self._client._types.class_type(service, className)], None)
+    return method
+
+
+class _Stream(object):
+    """
+    One stream (or event) a client has added
+    """
+    def __init__(self, streamId, evaluate):
+        self.id = streamId
+        self.evaluate = evaluate
+        self.started = False
+        self.rate = 0.0
+        self.lastSent = 0.0
+        self.last = None
+
+
+class _ClientState(object):
+    """
+    Whatever we're keeping for one connected client
+    """
+    def __init__(self, identifier, name):
+        self.identifier = identifier
+        self.name = name
+        self.streams = collections.OrderedDict()
+        self.byCall = {}
+        self.closed = False
+
+
+class _Expression(object):
+    """
+    A server side expression, evaluated whenever the event or stream holding it is
+    """
+    def __init__(self, evaluate):
+        self.evaluate = evaluate
+
+
+def _operator(operation):
+    """
+    :return: an _Expressions method building the expression operation(arg0, arg1)
+    """
+    def build(self, arg0, arg1):
+        return _Expression(lambda: operation(arg0.evaluate(), arg1.evaluate()))
+    return build
+
+
+class _Expressions(object):
+    """
+    Stands in for KRPC.Expression's static methods. Only the operators kspy builds conditions out of
+    """
+    def __init__(self, server):
+        self.server = server
+
+    @staticmethod
+    def _constant(value):
+        return _Expression(lambda: value)
+
+    def constant_bool(self, value):
+        return self._constant(value)
+
+    constant_float = constant_double = constant_int = constant_string = constant_bool
+
+    def call(self, call):
+        return _Expression(lambda: self.server.evaluate(call))
+
+    equal = _operator(operator.eq)
+    not_equal = _operator(operator.ne)
+    greater_than = _operator(operator.gt)
+    greater_than_or_equal = _operator(operator.ge)
+    less_than = _operator(operator.lt)
+    less_than_or_equal = _operator(operator.le)
+    and_ = _operator(lambda a, b: bool(a and b))
+    or_ = _operator(lambda a, b: bool(a or b))
+    exclusive_or = _operator(operator.xor)
+    add = _operator(operator.add)
+    subtract = _operator(operator.sub)
+    multiply = _operator(operator.mul)
+    divide = _operator(operator.truediv)
+
+    def not_(self, arg):
+        return _Expression(lambda: not arg.evaluate())
+
+    def count(self, arg):
+        return _Expression(lambda: len(arg.evaluate()))
+
+
+class _KrpcService(object):
+    """
+    The KRPC service: service discovery, streams and events
+    """
+    def __init__(self, server):
+        self.server = server
+        self.Expression = _Expressions(server)
+        self.paused = False
+
+    def get_services(self):
+        return self.server._getServices()
+
+    def get_status(self):
+        status = KRPC.Status()
+        status.version = 'standin'
+        return status
+
+    def get_client_id(self):
+        return self.server.currentClient().identifier
+
+    def get_client_name(self):
+        return self.server.currentClient().name or ''
+
+    def add_stream(self, call, start=True):
+        stream = self.server.addStream(call.SerializeToString(), lambda: self.server.evaluateEncoded(call), start)
+        return KRPC.Stream(id=stream.id)
+
+    def add_event(self, expression):
+        boolType = self.server.types.bool_type
+        stream = self.server.addStream(None, lambda: Encoder.encode(bool(expression.evaluate()), boolType), False)
+        event = KRPC.Event()
+        event.stream.id = stream.id
+        return event
+
+    def start_stream(self, id):
+        self.server.stream(id).started = True
+
+    def set_stream_rate(self, id, rate):
+        self.server.stream(id).rate = rate
+
+    def remove_stream(self, id):
+        client = self.server.currentClient()
+        stream = client.streams.pop(id, None)
+        if stream is not None:
+            client.byCall = dict((key, value) for key, value in client.byCall.items() if value is not stream)
+
+
+def _receiveMessage(sock, typ):
+    """
+    :return: the next size-prefixed message of type typ off the socket, None once it's closed
+    """
+    data = b''
+    while True:
+        byte = sock.recv(1)
+        if not byte:
+            return None
+        data += byte
+        try:
+            size = Decoder.decode_message_size(data)
+            break
+        except IndexError:
+            pass
+
+    payload = b''
+    while len(payload) < size:
+        chunk = sock.recv(min(65536, size - len(payload)))
+        if not chunk:
+            return None
+        payload += chunk
+    return Decoder.decode_message(payload, typ)
+
+
+def _sendMessage(sock, message):
+    sock.sendall(Encoder.encode_message_with_size(message))
+
+
+class StandInServer(object):
+    """
+    Answers kRPC requests from a table of (service, procedure) -> handler
+    """
+    def __init__(self, latency=0.0, jitter=0.0, seed=None):
+        """
+        :param latency: seconds to hold every RPC response back for
+        :param jitter: +/- seconds of uniform random variation on the latency
+        :param seed: for the jitter
+        """
+        self.types = Types()
+        self.procedures = {}
+        self.lock = threading.Lock()
+
+        # everything that touches bound objects happens under this, so whatever else moves them
+        # (a simulation stepping, say) can take it too
+        self.callLock = threading.RLock()
+
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+
+        # how much work we've been asked to do, for checking how well calls are batched
+        self.requests = 0
+        self.calls = 0
+
+        # bound objects by the id the clients know them by
+        self.objects = {}
+        # (service, class name) -> [(method name, procedure)] served beyond the stubs
+        self.extraMethods = collections.defaultdict(list)
+        self._lastId = 1 << 32
+
+        self.clients = {}
+        self._local = threading.local()
+        self._defaultClient = _ClientState(b'\0' * 16, 'loopback')
+        self._lastStreamId = 0
+
+        self.streamInterval = 0.01
+        self.address = None
+        self.rpcPort = None
+        self.streamPort = None
+        self._stopped = threading.Event()
+        self._sockets = []
+
+        self.bind('KRPC', _KrpcService(self))
+
+    def register(self, service, procedure, handler, parameterTypes=(), returnType=None, parameterNames=None):
+        """
+        Add (or replace) a procedure
+
+        :param service: service name, e.g. SpaceCenter
+        :param procedure: procedure name, e.g. CelestialBody_SurfaceHeight or Vessel_get_Mass
+        :param handler: callable receiving the decoded arguments and returning the result
+        :param parameterTypes: krpc TypeBase for each positional argument
+        :param returnType: krpc TypeBase of the result, None if the procedure doesn't return anything
+        :param parameterNames: pass the arguments by these names, leaving out any the client left at
+                               their defaults, rather than positionally with None for those
+        """
+        self.procedures[(service, procedure)] = Procedure(handler, list(parameterTypes), returnType, parameterNames)
+
+    def services(self):
+        """
+        :return: the names of every service we have at least one procedure for
+        """
+        return sorted(set(service for service, _ in self.procedures))
+
+    def _getServices(self):
+        services = KRPC.Services()
+        for name in self.services():
+            services.services.add(name=name)
+        return services
+
+    def resetCounters(self):
+        self.requests = 0
+        self.calls = 0
+
+    # binding objects
+
+    def bind(self, service, root, stub=None):
+        """
+        Serve every procedure of a krpc service off a Python object shaped like the krpc client's one.
+        Procedures the object doesn't have come back to the client as errors
+
+        :param service: service name, e.g. SpaceCenter
+        :param root: object standing in for the service itself, e.g. client.space_center. Static methods
+                     of a class are looked up on root's attribute named after the class
+        :param stub: pregenerated stub class to read the procedures from, defaults to krpc's own
+        """
+        if stub is None:
+            stub = getattr(krpc.services, service)
+
+        table = stubProcedures(stub, self.types)
+        for className, attribute, procedure in EXTRA_METHODS.get(service, ()):
+            if procedure not in table:
+                table[procedure] = Binding('call', className, attribute, ['self'],
+                                           [self.types.class_type(service, className)], None)
+                self.extraMethods[(service, className)].append((attribute, procedure))
+
+        for procedure, binding in table.items():
+            self.register(service, procedure, self._boundHandler(binding, root),
+                          [self._wireType(t) for t in binding.parameterTypes],
+                          self._wireType(binding.returnType), binding.parameterNames)
+
+    def _extendStubs(self, client):
+        """
+        Give a client its own subclasses of the stub classes we serve extra methods for, so objects it
+        decodes have them. Other clients, and the stub classes themselves, are left alone
+
+        :return: client
+        """
+        for (service, className), methods in self.extraMethods.items():
+            classType = client._types.class_type(service, className)
+            stubClass = classType.python_type
+            subclass = type(stubClass.__name__, (stubClass,),
+                            dict((attribute, _extraMethod(service, procedure, className))
+                                 for attribute, procedure in methods if not hasattr(stubClass, attribute)))
+            key = classType.protobuf_type.SerializeToString()
+            client._types._types[key] = ClassType(classType.protobuf_type, None, subclass)
+        return client
+
+    def _boundHandler(self, binding, root):
+        types = dict(zip(binding.parameterNames, binding.parameterTypes))
+
+        def handler(**kwargs):
+            kwargs = dict((name, self._fromWire(value, types[name])) for name, value in kwargs.items())
+
+            if binding.kind == 'static':
+                target = getattr(root, binding.className)
+            elif binding.className is None:
+                target = root
+            else:
+                target = kwargs.pop('self', None)
+                if target is None:
+                    raise ProcedureError('No such {0} object'.format(binding.className))
+
+            if binding.kind == 'get':
+                result = getattr(target, binding.attribute)
+            elif binding.kind == 'set':
+                setattr(target, binding.attribute, kwargs[binding.parameterNames[-1]])
+                return None
+            else:
+                result = getattr(target, binding.attribute)(**kwargs)
+
+            return self._toWire(result, binding.returnType)
+
+        return handler
+
+    def objectId(self, obj):
+        """
+        :return: the id clients know obj by, handing it one if it's new
+        """
+        objectId = getattr(obj, '_object_id', None)
+        if objectId is None:
+            self._lastId += 1
+            objectId = self._lastId
+            try:
+                obj._object_id = objectId
+            except AttributeError:
+                pass
+        self.objects[objectId] = obj
+        return objectId
+
+    def _wireType(self, typ):
+        """
+        :return: the type typ goes over the wire as, with objects as ids and enumerations as integers
+        """
+        if isinstance(typ, ClassType):
+            return self.types.uint64_type
+        if isinstance(typ, EnumerationType):
+            return self.types.sint32_type
+        if isinstance(typ, ListType):
+            return self.types.list_type(self._wireType(typ.value_type))
+        if isinstance(typ, SetType):
+            return self.types.set_type(self._wireType(typ.value_type))
+        if isinstance(typ, TupleType):
+            return self.types.tuple_type(*[self._wireType(t) for t in typ.value_types])
+        if isinstance(typ, DictionaryType):
+            return self.types.dictionary_type(self._wireType(typ.key_type), self._wireType(typ.value_type))
+        return typ
+
+    def _toWire(self, value, typ):
+        if typ is None or value is None and not isinstance(typ, ClassType):
+            return value
+        if isinstance(typ, ClassType):
+            return 0 if value is None else self.objectId(value)
+        if isinstance(typ, EnumerationType):
+            return int(getattr(value, 'value', value))
+        if isinstance(typ, ListType):
+            return [self._toWire(v, typ.value_type) for v in value]
+        if isinstance(typ, SetType):
+            return set(self._toWire(v, typ.value_type) for v in value)
+        if isinstance(typ, TupleType):
+            return tuple(self._toWire(v, t) for v, t in zip(value, typ.value_types))
+        if isinstance(typ, DictionaryType):
+            return dict((self._toWire(k, typ.key_type), self._toWire(v, typ.value_type)) for k, v in value.items())
+        if hasattr(value, 'item'):
+            # NumPy scalars
+            return value.item()
+        return value
+
+    def _fromWire(self, value, typ):
+        if isinstance(typ, ClassType):
+            return self.objects.get(value) if value else None
+        if isinstance(typ, ListType):
+            return [self._fromWire(v, typ.value_type) for v in value]
+        if isinstance(typ, SetType):
+            return set(self._fromWire(v, typ.value_type) for v in value)
+        if isinstance(typ, TupleType):
+            return tuple(self._fromWire(v, t) for v, t in zip(value, typ.value_types))
+        if isinstance(typ, DictionaryType):
+            return dict((self._fromWire(k, typ.key_type), self._fromWire(v, typ.value_type)) for k, v in value.items())
+        return value
+
+    # calls
+
+    def handle(self, request):
+        """
+        :param request: a KRPC.Request
+        :return: the KRPC.Response to send back
+        """
+        response = KRPC.Response()
+
+        with self.lock:
+            self.requests += 1
+            self.calls += len(request.calls)
+
+        for call in request.calls:
+            result = response.results.add()
+            try:
+                with self.callLock:
+                    value, returnType = self._invoke(call)
+                if returnType is not None:
+                    result.value = Encoder.encode(value, returnType)
+            except ProcedureError as e:
+                result.error.service = call.service
+                result.error.description = str(e)
+            except Exception as e:
+                result.error.description = '{0}.{1}: {2}: {3}'.format(call.service, call.procedure,
+                                                                     type(e).__name__, e)
+
+        return response
+
+    def _invoke(self, call):
+        procedure = self.procedures.get((call.service, call.procedure))
+        if procedure is None:
+            raise ProcedureError('Procedure not found: {0}.{1}'.format(call.service, call.procedure))
+
+        args = {}
+        for argument in call.arguments:
+            args[argument.position] = Decoder.decode(None, argument.value,
+                                                     procedure.parameterTypes[argument.position])
+
+        if procedure.parameterNames is None:
+            value = procedure.handler(*[args.get(i) for i in range(len(procedure.parameterTypes))])
+        else:
+            value = procedure.handler(**dict((procedure.parameterNames[i], v) for i, v in args.items()))
+        return value, procedure.returnType
+
+    def evaluate(self, call):
+        """
+        :param call: KRPC.ProcedureCall
+        :return: its result as it would go on the wire (ids for objects)
+        """
+        with self.callLock:
+            return self._invoke(call)[0]
+
+    def evaluateEncoded(self, call):
+        with self.callLock:
+            value, returnType = self._invoke(call)
+        return b'' if returnType is None else Encoder.encode(value, returnType)
+
+    # streams
+
+    def currentClient(self):
+        """
+        :return: state for the client whose request we're handling
+        """
+        return getattr(self._local, 'client', None) or self._defaultClient
+
+    def addStream(self, key, evaluate, start):
+        """
+        :param key: identical calls from the same client share a stream, None to always add one
+        :param evaluate: function returning the stream's encoded value
+        :param start: start sending updates right away
+        :return: the _Stream
+        """
+        client = self.currentClient()
+        stream = client.byCall.get(key) if key is not None else None
+        if stream is None:
+            with self.lock:
+                self._lastStreamId += 1
+                stream = _Stream(self._lastStreamId, evaluate)
+            client.streams[stream.id] = stream
+            if key is not None:
+                client.byCall[key] = stream
+        if start:
+            stream.started = True
+        return stream
+
+    def stream(self, streamId):
+        stream = self.currentClient().streams.get(streamId)
+        if stream is None:
+            raise ProcedureError('Stream does not exist: {0}'.format(streamId))
+        return stream
+
+    def streamUpdate(self, client):
+        """
+        :return: KRPC.StreamUpdate with whichever of the client's started streams have changed
+        """
+        update = KRPC.StreamUpdate()
+        now = time.time()
+        for stream in list(client.streams.values()):
+            if not stream.started or (stream.rate and now - stream.lastSent < 1.0 / stream.rate):
+                continue
+
+            result = KRPC.ProcedureResult()
+            try:
+                result.value = stream.evaluate()
+            except Exception as e:
+                result.error.description = '{0}: {1}'.format(type(e).__name__, e)
+
+            encoded = result.SerializeToString()
+            if encoded == stream.last:
+                continue
+            stream.last = encoded
+            stream.lastSent = now
+            update.results.add(id=stream.id, result=result)
+        return update
+
+    # TCP
+
+    def delay(self):
+        """
+        :return: how long to hold the next response back for
+        """
+        if not self.jitter:
+            return self.latency
+        return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def serve(self, address='127.0.0.1', rpcPort=0, streamPort=0):
+        """
+        Start listening for krpc clients in the background, on free ports unless told otherwise
+
+        :return: (rpcPort, streamPort)
+        """
+        self._stopped.clear()
+        self.address = address
+        listeners = []
+        for port, target in ((rpcPort, self._serveRpc), (streamPort, self._serveStreams)):
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind((address, port))
+            listener.listen(8)
+            listeners.append(listener.getsockname()[1])
+            self._sockets.append(listener)
+            self._startThread(self._accept, listener, target)
+
+        self.rpcPort, self.streamPort = listeners
+        return self.rpcPort, self.streamPort
+
+    def connectTcp(self, name=None):
+        """
+        :return: a real krpc client connected over TCP, streams and all
+        """
+        if self.rpcPort is None:
+            self.serve()
+        return self._extendStubs(krpc.connect(name=name, address=self.address, rpc_port=self.rpcPort,
+                                              stream_port=self.streamPort))
+
+    def shutdown(self):
+        """
+        Stop listening and drop every client
+        """
+        self._stopped.set()
+        for sock in self._sockets:
+            try:
+                sock.close()
+            except socket.error:
+                pass
+        del self._sockets[:]
+        self.rpcPort = self.streamPort = None
+
+    @staticmethod
+    def _startThread(target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _accept(self, listener, target):
+        while not self._stopped.is_set():
+            try:
+                sock, _ = listener.accept()
+            except socket.error:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._sockets.append(sock)
+            self._startThread(target, sock)
+
+    def _handshake(self, sock, expected):
+        request = _receiveMessage(sock, KRPC.ConnectionRequest)
+        response = KRPC.ConnectionResponse()
+        if request is None:
+            return None, response
+        if request.type != expected:
+            response.status = KRPC.ConnectionResponse.WRONG_TYPE
+            response.message = 'Wrong connection type'
+        return request, response
+
+    def _serveRpc(self, sock):
+        request, response = self._handshake(sock, KRPC.ConnectionRequest.RPC)
+        if request is None or response.status != KRPC.ConnectionResponse.OK:
+            _sendMessage(sock, response)
+            return sock.close()
+
+        client = _ClientState(os.urandom(16), request.client_name)
+        self.clients[client.identifier] = client
+        self._local.client = client
+        response.client_identifier = client.identifier
+        _sendMessage(sock, response)
+
+        try:
+            while not self._stopped.is_set():
+                request = _receiveMessage(sock, KRPC.Request)
+                if request is None:
+                    break
+                response = self.handle(request)
+
+                delay = self.delay()
+                if delay > 0:
+                    time.sleep(delay)
+                _sendMessage(sock, response)
+        except socket.error:
+            pass
+        finally:
+            client.closed = True
+            self.clients.pop(client.identifier, None)
+            sock.close()
+
+    def _serveStreams(self, sock):
+        request, response = self._handshake(sock, KRPC.ConnectionRequest.STREAM)
+        client = self.clients.get(request.client_identifier) if request is not None else None
+        if client is None and response.status == KRPC.ConnectionResponse.OK:
+            response.status = KRPC.ConnectionResponse.MALFORMED_MESSAGE
+            response.message = 'Unknown client'
+        _sendMessage(sock, response)
+        if response.status != KRPC.ConnectionResponse.OK:
+            return sock.close()
+
+        try:
+            while not self._stopped.is_set() and not client.closed:
+                with self.callLock:
+                    update = self.streamUpdate(client)
+                if update.results:
+                    _sendMessage(sock, update)
+                self._stopped.wait(self.streamInterval)
+        except socket.error:
+            pass
+        finally:
+            sock.close()
+
+    def connect(self):
+        """
+        :return: a real krpc client talking to this server in-process, without streams
+        """
+        return self._extendStubs(Client(LoopbackConnection(self), None))
+
+
+class LoopbackConnection(object):
+    """
+    Stands in for krpc.connection.Connection, handing each request straight to a StandInServer.
+    Messages still get serialized both ways, so what the server sees is exactly what went on the wire
+    """
+    def __init__(self, server):
+        self.server = server
+        self.responses = collections.deque()
+        self.bytesSent = 0
+        self.bytesReceived = 0
+
+    def send_message(self, message):
+        data = message.SerializeToString()
+        self.bytesSent += len(data)
+
+        request = Decoder.decode_message(data, KRPC.Request)
+        response = self.server.handle(request).SerializeToString()
+
+        self.bytesReceived += len(response)
+        self.responses.append(response)
+
+    def receive_message(self, typ):
+        return Decoder.decode_message(self.responses.popleft(), typ)
+
+    def close(self):
+        self.responses.clear()
@@ -0,0 +1,202 @@
+"""
+Tick-consistent telemetry snapshots for programs
+
+Programs declare the telemetry they need through their telemetryFields, a TelemetrySource
+builds one stream-backed snapshot per tick, and that same snapshot gets handed to every
+program running that tick. Reading a field off the snapshot is a plain attribute read,
+so a control law can look at the same value as often as it likes without another RPC.
+"""
+from __future__ import print_function, absolute_import, division
+
+import collections
+import threading
+
+from . import utils
+
+# where a field's value comes from, and the krpc attribute we read there
+Field = collections.namedtuple('Field', 'source attribute')
+
+UT = 'ut'  # space_center.ut
+FLIGHT = 'flight'  # vessel.flight(referenceFrame)
+ORBIT = 'orbit'  # vessel.orbit
+VESSEL = 'vessel'  # the vessel itself
+CONTROL = 'control'  # vessel.control
+BODY = 'body'  # vessel.orbit.body, read once since it never changes
+
+FIELDS = {
+    'ut': Field(UT, 'ut'),
+
+    'meanAltitude': Field(FLIGHT, 'mean_altitude'),
+    'surfaceAltitude': Field(FLIGHT, 'surface_altitude'),
+    'verticalSpeed': Field(FLIGHT, 'vertical_speed'),
+    'horizontalSpeed': Field(FLIGHT, 'horizontal_speed'),
+    'speed': Field(FLIGHT, 'speed'),
+    'velocity': Field(FLIGHT, 'velocity'),
+    'latitude': Field(FLIGHT, 'latitude'),
+    'longitude': Field(FLIGHT, 'longitude'),
+    'heading': Field(FLIGHT, 'heading'),
+    'pitch': Field(FLIGHT, 'pitch'),
+    'roll': Field(FLIGHT, 'roll'),
+    'dynamicPressure': Field(FLIGHT, 'dynamic_pressure'),
+    'atmosphereDensity': Field(FLIGHT, 'atmosphere_density'),
+
+    'apoapsisAltitude': Field(ORBIT, 'apoapsis_altitude'),
+    'periapsisAltitude': Field(ORBIT, 'periapsis_altitude'),
+    'eccentricity': Field(ORBIT, 'eccentricity'),
+
+    'mass': Field(VESSEL, 'mass'),
+    'availableThrust': Field(VESSEL, 'available_thrust'),
+    'maxThrust': Field(VESSEL, 'max_thrust'),
+    'specificImpulse': Field(VESSEL, 'specific_impulse'),
+    'situation': Field(VESSEL, 'situation'),
+
+    'throttle': Field(CONTROL, 'throttle'),
+    'abort': Field(CONTROL, 'abort'),
+    'brakes': Field(CONTROL, 'brakes'),
+    'currentStage': Field(CONTROL, 'current_stage'),
+
+    'surfaceGravity': Field(BODY, 'surface_gravity'),
+    'equatorialRadius': Field(BODY, 'equatorial_radius'),
+    'gravitationalParameter': Field(BODY, 'gravitational_parameter'),
+}
+
+
+class TelemetryFrame(object):
+    """
+    Base class for snapshots. The concrete classes are made by frameType so that each
+    combination of fields gets its own __slots__ and no per-instance __dict__
+    """
+    __slots__ = ()
+
+    def __repr__(self):
+        return '{0}({1})'.format(type(self).__name__,
+                                 ', '.join('{0}={1!r}'.format(name, getattr(self, name, None))
+                                           for name in self.__slots__))
+
+    def asDict(self):
+        """
+        :return: the snapshot as a plain {field: value} dictionary
+        """
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+
+_frameTypes = {}
+
+
+def frameType(fields):
+    """
+    Get the snapshot class holding exactly the input fields
+
+    :param fields: iterable of field names from FIELDS
+    :return: a TelemetryFrame subclass with one slot per field
+    """
+    fields = tuple(sorted(set(fields)))
+
+    for name in fields:
+        if name not in FIELDS:
+            raise ValueError("Unknown telemetry field {0}".format(name))
+
+    if fields not in _frameTypes:
+        _frameTypes[fields] = type('TelemetryFrame', (TelemetryFrame,), {'__slots__': fields})
+
+    return _frameTypes[fields]
+
+
+def fieldsFor(*programs):
+    """
+    :param programs: program objects (or classes) that may declare telemetryFields
+    :return: the union of all the fields the input programs want
+    """
+    fields = set()
+    for program in programs:
+        fields.update(getattr(program, 'telemetryFields', ()))
+    return fields
+
+
+class TelemetrySource(object):
+    """
+    Builds TelemetryFrame snapshots for one vessel out of shared streams
+
+    When the connection supports stream update callbacks the snapshot is rebuilt once
+    each stream update message has been fully applied, so every value in a frame comes
+    from the same server update. Otherwise the frame is read out of the streams on demand.
+    """
+    def __init__(self, connection, vessel, fields, referenceFrame=None):
+        """
+        :param connection: krpc.Connection the streams will live on
+        :param vessel: the vessel we're watching
+        :param fields: iterable of field names from FIELDS
+        :param referenceFrame: reference frame for the flight fields, defaults to the body's reference frame
+        """
+        self.connection = connection
+        self.vessel = vessel
+        self.frameType = frameType(fields)
+        self.fields = self.frameType.__slots__
+
+        body = vessel.orbit.body
+        if referenceFrame is None:
+            referenceFrame = body.reference_frame
+
+        streams = utils.streams(connection)
+        self.streams = {}
+        self.constants = {}
+
+        for name in self.fields:
+            field = FIELDS[name]
+            if field.source == UT:
+                self.streams[name] = streams.add_ut()
+            elif field.source == FLIGHT:
+                self.streams[name] = streams.add_flight(vessel, field.attribute, referenceFrame)
+            elif field.source == ORBIT:
+                self.streams[name] = streams.add_orbit(vessel, field.attribute)
+            elif field.source == VESSEL:
+                self.streams[name] = streams.add_attribute(vessel, field.attribute)
+            elif field.source == CONTROL:
+                self.streams[name] = streams.add_attribute(vessel.control, field.attribute)
+            elif field.source == BODY:
+                self.constants[name] = getattr(body, field.attribute)
+
+        self._lock = threading.Lock()
+        self._latest = None
+        self._callback = None
+
+        if self.streams and hasattr(connection, 'add_stream_update_callback'):
+            # make sure every stream has a value before the first snapshot
+            self._latest = self._build()
+            self._callback = self._onUpdate
+            connection.add_stream_update_callback(self._callback)
+
+    def _build(self):
+        frame = self.frameType()
+        for name, stream in self.streams.items():
+            setattr(frame, name, stream())
+        for name, value in self.constants.items():
+            setattr(frame, name, value)
+        return frame
+
+    def _onUpdate(self):
+        frame = self._build()
+        with self._lock:
+            self._latest = frame
+
+    def __call__(self):
+        """
+        :return: the most recent complete TelemetryFrame
+        """
+        if self._callback is None:
+            return self._build()
+
+        with self._lock:
+            return self._latest
+
+    def release(self):
+        """
+        Stop building snapshots and release every stream this source holds
+        """
+        if self._callback is not None:
+            self.connection.remove_stream_update_callback(self._callback)
+            self._callback = None
+
+        for stream in self.streams.values():
+            stream.release()
+        self.streams.clear()
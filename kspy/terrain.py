@@ -0,0 +1,283 @@
+"""
+Client-side terrain height cache
+
+The ground under a landing vessel barely changes from one tick to the next, so rather than asking the
+server for surface_height at every point we check, sample the terrain in lat/lon tiles (each tile's
+samples fetched in a single batched request) and answer queries by bilinear interpolation.
+Least recently used tiles are thrown away once the cache grows past its memory cap.
+
+Given a heightmap.HeightmapStore, tiles are read out of the on-disk heightmap and only the samples it
+doesn't have yet are fetched from the server (and written back to it for next time).
+"""
+from __future__ import print_function, absolute_import, division
+
+import collections
+import math
+import weakref
+
+import numpy as np
+
+from . import batch
+
+
+class TerrainCache(object):
+    """
+    Tiled, LRU-evicted terrain heights for one body
+
+    A tile nobody has asked for yet costs samplesPerTile ** 2 surface_height samples, 289 with the
+    defaults, all in one batched request. That's far more than the handful of points one terrain check
+    wants, and only pays off once the same tiles are queried again tick after tick (as they are through
+    a descent). Pass a smaller samplesPerTile for one-off queries.
+    """
+    # client -> {body id: cache}, only held for as long as somebody is using them
+    _caches = weakref.WeakKeyDictionary()
+
+    def __init__(self, body, tileDegrees=0.5, samplesPerTile=17, maxBytes=16 * 1024 * 1024, store=None):
+        """
+        :param body: the krpc CelestialBody whose terrain we're caching
+        :param tileDegrees: width and height of a tile, in degrees
+        :param samplesPerTile: samples along each edge of a tile, edges included
+        :param maxBytes: how much sample memory we can hold on to before evicting tiles
+        :param store: optional heightmap.HeightmapStore backing the cache, its resolution overrides samplesPerTile
+        """
+        if store is not None:
+            cells = tileDegrees / store.resolution
+            if abs(cells - round(cells)) > 1e-9:
+                raise ValueError("Tile size has to be a whole number of heightmap samples")
+            samplesPerTile = int(round(cells)) + 1
+
+        if samplesPerTile < 2:
+            raise ValueError("Need at least two samples per tile edge to interpolate")
+        if tileDegrees <= 0 or 180 % tileDegrees or 360 % tileDegrees:
+            raise ValueError("Tile size has to divide evenly into 180 and 360 degrees")
+
+        self.body = body
+        self.tileDegrees = float(tileDegrees)
+        self.samplesPerTile = samplesPerTile
+        self.step = self.tileDegrees / (samplesPerTile - 1)
+        self.maxBytes = maxBytes
+        self.lonTiles = int(round(360 / self.tileDegrees))
+        self.store = store
+
+        self.tiles = collections.OrderedDict()
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.samplesFetched = 0
+
+    @classmethod
+    def forBody(cls, body, **kwargs):
+        """
+        Get the shared cache for the input body, making it if nobody is using one already
+
+        :param body: krpc CelestialBody
+        :param kwargs: passed to the constructor if the cache doesn't exist yet, and otherwise have to
+                       match the existing cache's (None matches anything)
+        :return: the TerrainCache for that body
+        """
+        caches = cls._caches.setdefault(batch.clientOf(body), weakref.WeakValueDictionary())
+        key = getattr(body, '_object_id', id(body))
+        cache = caches.get(key)
+        if cache is None:
+            cache = caches[key] = cls(body, **kwargs)
+        else:
+            for name, value in kwargs.items():
+                if value is not None and getattr(cache, name) is not value and getattr(cache, name) != value:
+                    raise ValueError("This body's terrain cache already has {0}={1!r}, not {2!r}".format(
+                        name, getattr(cache, name), value))
+        return cache
+
+    def stats(self):
+        """
+        :return: dictionary of hit/miss counters and memory use
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'samplesFetched': self.samplesFetched,
+                'tiles': len(self.tiles),
+                'bytes': self.bytes}
+
+    def clear(self):
+        self.tiles.clear()
+        self.bytes = 0
+
+    def tileFor(self, lat, lon):
+        """
+        :return: (latIndex, lonIndex) of the tile holding the input point
+        """
+        lat = clampLat(lat)
+        i = int(math.floor((lat + 90.0) / self.tileDegrees))
+        i = min(i, int(round(180 / self.tileDegrees)) - 1)  # the north pole belongs to the last row
+        j = int(math.floor((wrapLon(lon) + 180.0) / self.tileDegrees)) % self.lonTiles
+        return i, j
+
+    def tileOrigin(self, tile):
+        """
+        :return: (latitude, longitude) of the south west corner of the input tile
+        """
+        i, j = tile
+        return i * self.tileDegrees - 90.0, j * self.tileDegrees - 180.0
+
+    def _samplePoints(self, tile):
+        lat0, lon0 = self.tileOrigin(tile)
+        offsets = np.arange(self.samplesPerTile) * self.step
+        return lat0 + offsets, lon0 + offsets
+
+    def _touch(self, tile):
+        """
+        :return: True if the tile was already cached, marking it most recently used
+        """
+        if tile in self.tiles:
+            self.tiles.move_to_end(tile)
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        return False
+
+    def _fetch(self, tiles):
+        """
+        Pull the samples for every input tile from the server in one request
+        """
+        if not tiles:
+            return
+
+        if self.store is not None:
+            self._fetchFromStore(tiles)
+            return
+
+        pending = []
+        with batch.Batch(self.body) as b:
+            for tile in tiles:
+                lats, lons = self._samplePoints(tile)
+                futures = [b.add(self.body.surface_height, float(lat), float(lon)) for lat in lats for lon in lons]
+                pending.append((tile, futures))
+
+        for tile, futures in pending:
+            samples = np.array([future() for future in futures], dtype=np.float64)
+            self.samplesFetched += samples.size
+            self._store(tile, samples.reshape(self.samplesPerTile, self.samplesPerTile))
+
+    def _fetchFromStore(self, tiles):
+        corners = [self.store.index(*self.tileOrigin(tile)) for tile in tiles]
+
+        # anything the heightmap hasn't seen yet gets sampled in one request and saved for next time
+        missing = []
+        for row, col in corners:
+            missing.extend(self.store.missing(row, col, self.samplesPerTile))
+        self.store.fill(self.body, missing)
+
+        for tile, (row, col) in zip(tiles, corners):
+            self._store(tile, self.store.block(row, col, self.samplesPerTile))
+
+        self.samplesFetched += len(set(missing))
+
+    def _store(self, tile, samples):
+        self.tiles[tile] = samples
+        self.bytes += samples.nbytes
+
+        # always keep the tile we just got, even if it alone is over the cap
+        while self.bytes > self.maxBytes and len(self.tiles) > 1:
+            _, evicted = self.tiles.popitem(last=False)
+            self.bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def prefetch(self, points):
+        """
+        Make sure every tile covering the input points is cached, fetching any missing ones together
+
+        :param points: iterable of (latitude, longitude) pairs in degrees
+        """
+        missing = []
+        for lat, lon in points:
+            tile = self.tileFor(lat, lon)
+            if tile not in missing and not self._touch(tile):
+                missing.append(tile)
+
+        self._fetch(missing)
+
+    def _cell(self, lat, lon):
+        """
+        :return: (samples, i, j, fy, fx), the tile's samples, the south west corner of the grid cell
+                 holding the input point and how far across that cell the point is
+        """
+        lat = clampLat(lat)
+        lon = wrapLon(lon)
+        tile = self.tileFor(lat, lon)
+        samples = self.tiles.get(tile)
+        if samples is None:
+            # a big prefetch can push out tiles it fetched itself
+            self._fetch([tile])
+            samples = self.tiles[tile]
+        lat0, lon0 = self.tileOrigin(tile)
+
+        # fractional sample coordinates inside the tile
+        y = min((lat - lat0) / self.step, self.samplesPerTile - 1)
+        x = min(((lon - lon0) % 360.0) / self.step, self.samplesPerTile - 1)
+        i = min(int(y), self.samplesPerTile - 2)
+        j = min(int(x), self.samplesPerTile - 2)
+        return samples, i, j, y - i, x - j
+
+    def _interpolate(self, lat, lon):
+        samples, i, j, fy, fx = self._cell(lat, lon)
+
+        south = samples[i, j] * (1 - fx) + samples[i, j + 1] * fx
+        north = samples[i + 1, j] * (1 - fx) + samples[i + 1, j + 1] * fx
+        return float(south * (1 - fy) + north * fy)
+
+    def _peak(self, lat, lon):
+        samples, i, j, _, _ = self._cell(lat, lon)
+        return float(samples[i:i + 2, j:j + 2].max())
+
+    def height(self, lat, lon):
+        """
+        :param lat: latitude in degrees
+        :param lon: longitude in degrees
+        :return: interpolated terrain height at the input point
+        """
+        tile = self.tileFor(lat, lon)
+        if not self._touch(tile):
+            self._fetch([tile])
+
+        return self._interpolate(lat, lon)
+
+    def heights(self, points):
+        """
+        :param points: list of (latitude, longitude) pairs in degrees
+        :return: list of interpolated terrain heights, with any missing tiles fetched in one request
+        """
+        points = list(points)
+        self.prefetch(points)
+        return [self._interpolate(lat, lon) for lat, lon in points]
+
+    def peaks(self, points):
+        """
+        Interpolating between samples flattens any peak that falls between them, so when what we want
+        is the highest the ground could be (clearing terrain rather than touching down on it) take the
+        highest corner of the grid cell each point is in instead.
+
+        :param points: list of (latitude, longitude) pairs in degrees
+        :return: list of the highest sample around each point, with any missing tiles fetched in one request
+        """
+        points = list(points)
+        self.prefetch(points)
+        return [self._peak(lat, lon) for lat, lon in points]
+
+
+def wrapLon(lon):
+    """
+    :return: the input longitude wrapped into [-180, 180)
+    """
+    return ((lon + 180.0) % 360.0) - 180.0
+
+
+def clampLat(lat):
+    """
+    :return: the input latitude clamped to the poles
+    """
+    return max(-90.0, min(90.0, lat))
@@ -1,5 +1,8 @@
 from __future__ import absolute_import, print_function, division
 
+from . import controls
+from . import utils
+
 
 class MaxQController(object):
     """
@@ -7,28 +10,42 @@ class MaxQController(object):
     to keep the vessel just shy of maxQ
     """
 
-    def __init__(self, connection, vessel, maxQ):
+    def __init__(self, connection, vessel, maxQ, controlBuffer=None):
         """
         :param connection: connection to use
         :param vessel: vessel to control
         :param maxQ: maximum aerodynamic force allowed on the vessel
+        :param controlBuffer: controls.ControlBuffer to write the throttle through, whoever owns it flushes it.
+                              Defaults to one of our own, which we flush every call
         """
         self.vessel = vessel
-        self.flight = vessel.flight(vessel.orbit.body.reference_frame)
+        self.ownsBuffer = controlBuffer is None
+        self.controls = controlBuffer or controls.ControlBuffer(vessel)
         self.maxQ = maxQ
         self.high = maxQ * 1.1
         self.low = maxQ * 0.9
-        self.q = connection.add_stream(getattr, self.flight, 'dynamic_pressure')
+        self.q = utils.streams(connection).add_flight(vessel, 'dynamic_pressure', vessel.orbit.body.reference_frame)
 
     def __call__(self):
+        q = self.q()
+
         # if dynamic press is low, full throttle
-        if self.q() < self.low:
-            self.vessel.control.throttle = 1.0
+        if q < self.low:
+            self.controls.control.throttle = 1.0
 
         # if we've somehow gone beyond our upper limit, kill the throttle
-        elif self.q() > self.high:
-            self.vessel.control.throttle = 0.0
+        elif q > self.high:
+            self.controls.control.throttle = 0.0
 
         # otherwise tune the throttle proportional to aerodynamic pressure within our upper and lower bounds
         else:
-            self.vessel.control.throttle = (self.high - self.q()) / (self.high - self.low)
+            self.controls.control.throttle = (self.high - q) / (self.high - self.low)
+
+        if self.ownsBuffer:
+            self.controls.flush()
+
+    def release(self):
+        """
+        Release our hold on the dynamic pressure stream
+        """
+        self.q.release()
@@ -0,0 +1,196 @@
+"""
+Cached knowledge of which parts, engines and tanks belong to which stage of a vessel
+
+Walking the part tree over RPC is the most expensive thing a tick can do on a big vessel, and the
+answer only changes when we stage or lose parts. A VesselTopology builds a decouple stage -> parts
+index once, in a couple of batched requests, and watches the current stage with a shared stream
+(which the server only sends when it changes). The part list itself isn't streamed, that would send
+every part id each time anything about it changed: instead the server counts the parts itself, in a
+kRPC expression, and raises an event once the count is no longer what we built the index from. The
+index is rebuilt the next time it's asked for after either of them moves.
+
+    topology = topology.VesselTopology.forVessel(vessel)
+    engines = topology.engines(vessel.control.current_stage - 1)
+"""
+from __future__ import print_function, absolute_import, division
+
+import collections
+import threading
+
+from . import batch
+from . import utils
+
+FUEL = frozenset(['LiquidFuel', 'Oxidizer', 'SolidFuel', 'MonoPropellant', 'XenonGas'])
+
+# everything we know about the parts that get dropped in one decouple stage
+StageParts = collections.namedtuple('StageParts', 'parts engines tanks')
+
+EMPTY_STAGE = StageParts((), (), ())
+
+
+class VesselTopology(object):
+    """
+    A stage -> parts/engines/tanks index for one vessel that rebuilds itself after staging or part loss
+    """
+    _topologies = {}
+
+    def __init__(self, vessel, fuel=FUEL):
+        """
+        :param vessel: the vessel to index
+        :param fuel: resource names that make a part count as a tank
+        """
+        self.vessel = vessel
+        self.fuel = frozenset(fuel)
+        self.connection = batch.clientOf(vessel)
+
+        shared = utils.streams(self.connection)
+        self.currentStageStream = shared.add_attribute(vessel.control, 'current_stage')
+
+        # without a server to evaluate expressions for us, counting the parts ourselves costs nothing
+        self.eventDriven = batch.isRemote(self.connection)
+        self.knownPartCount = None
+        self.partsChanged = threading.Event()
+        self.partsWatch = None
+
+        self.builtStage = None
+        self.builtPartCount = None
+        self.stages = {}
+
+        self.rebuilds = 0
+
+    @classmethod
+    def forVessel(cls, vessel, **kwargs):
+        """
+        Get the shared topology for the input vessel, making it if this is the first time we've asked
+
+        :param vessel: krpc Vessel
+        :param kwargs: passed to the constructor if the topology doesn't exist yet
+        :return: the VesselTopology for that vessel
+        """
+        key = (id(batch.clientOf(vessel)), getattr(vessel, '_object_id', id(vessel)))
+        if key not in cls._topologies:
+            cls._topologies[key] = cls(vessel, **kwargs)
+        return cls._topologies[key]
+
+    @property
+    def currentStage(self):
+        """
+        :return: the vessel's current stage, straight off the stream
+        """
+        return self.currentStageStream()
+
+    @property
+    def partCount(self):
+        """
+        :return: how many parts the vessel has, only going to the server once it's told us that's changed
+        """
+        if not self.eventDriven:
+            return len(self.vessel.parts.all)
+        if self.knownPartCount is None or self.partsChanged.is_set():
+            self._watchParts(len(self.vessel.parts.all))
+        return self.knownPartCount
+
+    def _watchParts(self, count):
+        """
+        Have the server count the vessel's parts and tell us once there aren't count of them any more
+        """
+        if self.partsWatch is not None:
+            self.partsWatch.remove()
+
+        Expression = self.connection.krpc.Expression
+        parts = Expression.count(Expression.call(self.connection.get_call(getattr, self.vessel.parts, 'all')))
+
+        self.knownPartCount = count
+        self.partsChanged = threading.Event()
+        self.partsWatch = self.connection.krpc.add_event(Expression.not_equal(parts, Expression.constant_int(count)))
+        self.partsWatch.add_callback(self.partsChanged.set)
+        self.partsWatch.start()
+
+    def valid(self, currentStage=None):
+        """
+        :param currentStage: the vessel's current stage if the caller knows better than the stream,
+                             say just after staging
+        :return: True if nothing has staged or fallen off since the index was built
+        """
+        if currentStage is None:
+            currentStage = self.currentStage
+        return self.builtStage == currentStage and self.builtPartCount == self.partCount
+
+    def invalidate(self):
+        self.builtStage = None
+
+    def _build(self, stage=None):
+        if stage is None:
+            stage = self.currentStage
+        parts = self.vessel.parts.all
+        if self.eventDriven:
+            self._watchParts(len(parts))
+
+        with batch.Batch(self.connection) as b:
+            details = [(part, b.add(getattr, part, 'decouple_stage'), b.add(getattr, part, 'engine'),
+                        b.add(getattr, part, 'resources'))
+                       for part in parts]
+
+        with batch.Batch(self.connection) as b:
+            details = [(part, decoupleStage(), engine(), b.add(getattr, resources(), 'names'))
+                       for part, decoupleStage, engine, resources in details]
+
+        stages = collections.defaultdict(lambda: ([], [], []))
+        for part, decoupleStage, engine, names in details:
+            stageParts, engines, tanks = stages[decoupleStage]
+            stageParts.append(part)
+            if engine is not None:
+                engines.append(engine)
+            if self.fuel.intersection(names()):
+                tanks.append(part)
+
+        self.stages = dict((number, StageParts(*[tuple(items) for items in entry]))
+                           for number, entry in stages.items())
+        self.builtStage = stage
+        self.builtPartCount = len(parts)
+        self.rebuilds += 1
+
+    def index(self, currentStage=None):
+        """
+        :param currentStage: see valid
+        :return: {decouple stage: StageParts}, rebuilt first if the vessel has changed
+        """
+        if not self.valid(currentStage):
+            self._build(currentStage)
+        return self.stages
+
+    def stage(self, decoupleStage, currentStage=None):
+        """
+        :param decoupleStage: the stage the parts get dropped in, like vessel.parts.in_decouple_stage takes
+        :param currentStage: see valid
+        :return: StageParts for that stage
+        """
+        return self.index(currentStage).get(decoupleStage, EMPTY_STAGE)
+
+    def parts(self, decoupleStage, currentStage=None):
+        return self.stage(decoupleStage, currentStage).parts
+
+    def engines(self, decoupleStage, currentStage=None):
+        return self.stage(decoupleStage, currentStage).engines
+
+    def tanks(self, decoupleStage, currentStage=None):
+        return self.stage(decoupleStage, currentStage).tanks
+
+    def engineStages(self):
+        """
+        :return: decouple stages that have engines in, highest (first to be dropped) first
+        """
+        return sorted((number for number, entry in self.index().items() if entry.engines), reverse=True)
+
+    def release(self):
+        """
+        Let go of our streams, the topology can't be used after this
+        """
+        self.currentStageStream.release()
+        if self.partsWatch is not None:
+            self.partsWatch.remove()
+            self.partsWatch = None
+
+        for key, topology in list(self._topologies.items()):
+            if topology is self:
+                del self._topologies[key]
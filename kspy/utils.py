@@ -6,11 +6,18 @@ from __future__ import print_function, absolute_import, division
 
 import collections
 import math
+import os
 import time
 
 import krpc
 
+from ozzybear_krpc import telemetry
+
+from . import batch
+from . import bodies
 from . import maths
+from . import staging
+from . import topology
 
 
 def defaultConnection(connectionName):
@@ -28,6 +35,39 @@ def defaultConnection(connectionName):
     return krpc.connect(connectionName)
 
 
+def streams(connection):
+    """
+    Get the shared stream registry for the input connection, so programs asking for the
+    same telemetry share one server-side stream instead of each adding their own
+
+    :param connection: the krpc.Connection the streams live on
+    :return: the ozzybear_krpc.telemetry.StreamManager for that connection
+    """
+    return telemetry.StreamManager(connection)
+
+
+def dataPath(*parts):
+    """
+    Get a path inside kspy's local data directory (~/.kspy, or $KSPY_DATA if it's set),
+    making sure the folder holding it exists
+
+    :param parts: path components below the data directory
+    :return: the full path
+    """
+    root = os.environ.get('KSPY_DATA') or os.path.join(os.path.expanduser('~'), '.kspy')
+    path = os.path.join(root, *parts)
+
+    folder = os.path.dirname(path) if parts else path
+    try:
+        os.makedirs(folder)
+    except OSError:
+        # somebody else (maybe another process) beat us to it
+        if not os.path.isdir(folder):
+            raise
+
+    return path
+
+
 def gHere(body, vessel):
     """
     Get the gravitational parameter for the input vessel orbiting the given body
@@ -37,8 +77,9 @@ def gHere(body, vessel):
 
     :return: the gravity parameter at the vessel's current altitude
     """
-    return body.surface_gravity * (body.mass / ((vessel.flight(body.reference_frame).mean_altitude +
-                                                 body.equatorial_radius) ** 2))
+    constants = bodies.constants(body)
+    return constants.surface_gravity * (constants.mass / ((vessel.flight(body.reference_frame).mean_altitude +
+                                                           constants.equatorial_radius) ** 2))
 
 
 def fgHere(body, vessel):
@@ -96,11 +137,38 @@ class AutoStage(object):
     """
     A class to check and handle the need for autostaging and will return true
     if the vessel needs to stage based on fuel and engine values
+
+    On a real krpc connection the check is a staging.StageTrigger the server evaluates for us,
+    so calling this costs no RPCs at all until it's time to stage
     """
     def __init__(self, vessel):
         self.vessel = vessel
+        self.trigger = None
+        self.eventDriven = batch.isRemote(batch.clientOf(vessel))
+        self.topology = topology.VesselTopology.forVessel(vessel) if self.eventDriven else None
+
+    def _arm(self):
+        # ask the server, the stage stream won't have caught up yet if we've only just staged
+        stage = self.vessel.control.current_stage
+        self.trigger = staging.StageTrigger(self.vessel, stage,
+                                            engines=self.topology.engines(stage - 1, currentStage=stage))
 
     def __call__(self):
+        if not self.eventDriven:
+            return self._poll()
+
+        if self.trigger is None:
+            self._arm()
+
+        if not self.trigger():
+            return
+
+        self._stage()
+
+        # arm a fresh trigger for the stage we just moved on to next time round
+        self.release()
+
+    def _poll(self):
         stage = self.vessel.control.current_stage
         parts = self.vessel.parts.in_decouple_stage(stage - 1)
 
@@ -109,9 +177,37 @@ class AutoStage(object):
             if engine and engine.active and engine.has_fuel:
                 return
 
+        self._stage()
+
+    def _stage(self):
         print("Staging")
         self.vessel.control.activate_next_stage()
 
+    def wait(self, timeout=None):
+        """
+        Block until the current stage is spent, then stage
+
+        :param timeout: give up after this many seconds
+        :return: True if we staged
+        """
+        if self.trigger is None:
+            self._arm()
+
+        if not self.trigger.wait(timeout):
+            return False
+
+        self._stage()
+        self.release()
+        return True
+
+    def release(self):
+        """
+        Take our trigger off the server
+        """
+        if self.trigger is not None:
+            self.trigger.remove()
+            self.trigger = None
+
 
 class Fairing(object):
     """
@@ -125,8 +221,7 @@ class Fairing(object):
         :param vessel: vessel to check for fairings on
         :param deployAtms: Minimum atmosphereic density threshold at which to deploy fairings
         """
-        flight = vessel.flight(vessel.orbit.body.reference_frame)
-        self.atms = connection.add_stream(getattr, flight, 'atmosphere_density')
+        self.atms = streams(connection).add_flight(vessel, 'atmosphere_density', vessel.orbit.body.reference_frame)
         self.deployAtms = deployAtms
 
         self.fairings = []
@@ -140,7 +235,13 @@ class Fairing(object):
         self.deployed = False
 
     def __call__(self):
-        if self.atms() <= self.deployAtms and not self.deployed:
+        """
+        :return: True once the fairings have been deployed
+        """
+        if self.deployed:
+            return True
+
+        if self.atms() <= self.deployAtms:
             for fairing in self.fairings:
                 try:
                     print("fairings")
@@ -150,17 +251,31 @@ class Fairing(object):
                     pass
             self.deployed = True
 
+            # we'll never need to check again
+            self.release()
+
+        return self.deployed
+
+    def release(self):
+        """
+        Release our hold on the atmospheric density stream
+        """
+        self.atms.release()
+
 
 class Abort(object):
     """
     A class to check and handle user-initiated abort sequence, when called
     will return True or False based on the abort condition of the vessel
     """
+    telemetryFields = ('abort',)
+
     def __init__(self, vessel):
         self.vessel = vessel
 
-    def __call__(self):
-        if self.vessel.control.abort:
+    def __call__(self, frame=None):
+        abort = frame.abort if frame is not None else self.vessel.control.abort
+        if abort:
             # disengage the throttle
             self.vessel.control.throttle = 0.0
 
@@ -214,7 +329,17 @@ class Program(object):
     """
     The base class for all looping programs that we'll run to accomplish a given task
     Provides some additional functionality that we'll use later for displays
+
+    Programs list the kspy.telemetry fields they read in telemetryFields, so whatever drives them
+    can build one TelemetryFrame per tick and pass it to every program's __call__, and declare how
+    often they want ticking in rate
     """
+    # names from kspy.telemetry.FIELDS this program reads every tick
+    telemetryFields = ()
+
+    # how many times a second a scheduler.Scheduler should tick this program
+    rate = 20
+
     def __init__(self, prettyName):
         """
 
@@ -222,10 +347,29 @@ class Program(object):
         """
         self.prettyName = prettyName
         self.messages = collections.deque()
+        self.sharedStreams = []
 
-    def __call__(self):
+    def __call__(self, frame=None):
         raise NotImplementedError("Sublcass of Program has not been set up correctly. Implement a __call__ method.")
 
     def displayValues(self):
         raise NotImplementedError(
             "Sublcass of Program has not been set up correctly. Implement a displayValues method.")
+
+    def holdStream(self, stream):
+        """
+        Keep track of a shared stream handle so it gets released along with the program
+
+        :param stream: ozzybear_krpc.telemetry.SharedStream handle, or anything else with a release method
+        :return: the same handle, for easy assignment
+        """
+        self.sharedStreams.append(stream)
+        return stream
+
+    def release(self):
+        """
+        Release every shared stream this program holds, call this once the program is done
+        """
+        for stream in self.sharedStreams:
+            stream.release()
+        del self.sharedStreams[:]
@@ -0,0 +1,42 @@
+"""
+Run this script to find the cheapest transfer window from the body we're orbiting to the target body
+
+Searches departures over the next two synodic periods against flight times around the hohmann
+transfer time, and prints the best window it finds
+"""
+import math
+
+import numpy as np
+
+import kspy.orbit
+import kspy.porkchop
+import kspy.utils
+
+SECONDS_PER_DAY = 6 * 60 * 60
+
+if __name__ == '__main__':
+    connection = kspy.utils.defaultConnection("TransferWindow")
+    vessel = connection.space_center.active_vessel
+    target = connection.space_center.target_body
+
+    # climb out to whichever body orbits the same thing as the target
+    origin = vessel.orbit.body
+    while origin.orbit and origin.orbit.body != target.orbit.body:
+        origin = origin.orbit.body
+
+    originOrbit = kspy.orbit.LocalOrbit.fromOrbit(origin.orbit)
+    targetOrbit = kspy.orbit.LocalOrbit.fromOrbit(target.orbit, originOrbit.gravitational_parameter)
+
+    synodicPeriod = 2 * math.pi / abs(originOrbit.mean_motion - targetOrbit.mean_motion)
+    transferAxis = (originOrbit.semi_major_axis + targetOrbit.semi_major_axis) / 2
+    hohmannTime = math.pi * math.sqrt(transferAxis ** 3 / originOrbit.gravitational_parameter)
+
+    departures = np.linspace(originOrbit.ut, originOrbit.ut + 2 * synodicPeriod, 1000)
+    timesOfFlight = np.linspace(0.5 * hohmannTime, 1.5 * hohmannTime, 500)
+
+    # a half million point grid, worth a process per core
+    best = kspy.porkchop.search(originOrbit, targetOrbit, departures, timesOfFlight, workers=None)
+
+    print("{0} -> {1}".format(origin.name, target.name))
+    print("depart in {0:.1f} days, {1:.1f} days in flight, {2:.0f} m/s".format(
+        (best.departure - originOrbit.ut) / SECONDS_PER_DAY, best.timeOfFlight / SECONDS_PER_DAY, best.deltaV))
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+"""
+Installs kspy together with the ozzybear_krpc package it shares telemetry with.
+
+kspy registers its streams through ozzybear_krpc.telemetry, so the two have to be importable
+side by side. From a checkout:
+
+    pip install -e .
+
+after which the scripts under scripts/ and sketches/ run directly, e.g.
+
+    python scripts/launchToOrbit.py
+
+To run without installing, put both source roots on the path instead:
+
+    PYTHONPATH=src:. python scripts/launchToOrbit.py
+"""
+
+import setuptools
+
+
+setuptools.setup(
+    name='kspy',
+    version='0.1',
+    description="kRPC autopilot programs for Kerbal Space Program",
+    license="MIT License",
+    packages=(setuptools.find_packages(include=['kspy', 'kspy.*']) +
+              setuptools.find_packages('src', include=['ozzybear_krpc', 'ozzybear_krpc.*'])),
+    package_dir={'ozzybear_krpc': 'src/ozzybear_krpc'},
+    install_requires=['krpc', 'numpy'],
+)
@@ -1,7 +1,8 @@
 import krpc
-import time
 
-outCSV = [("ut", "alt", "speed", "conduction", "convection", "radiation", "ablator")]
+from kspy import recorder
+from kspy import scheduler
+from kspy import utils
 
 connection = krpc.connect("thermalFlux")
 vessel = connection.space_center.active_vessel
@@ -9,26 +10,23 @@ vessel = connection.space_center.active_vessel
 heatShield = vessel.parts.with_tag("heatShield")[0]
 print(heatShield)
 
-vesselActive = True
+streams = utils.streams(connection)
+channels = [recorder.Channel("alt", streams.add_flight(vessel, "mean_altitude")),
+            recorder.Channel("speed", streams.add_flight(vessel, "speed")),
+            recorder.Channel("conduction", streams.add_attribute(heatShield, "thermal_conduction_flux")),
+            recorder.Channel("convection", streams.add_attribute(heatShield, "thermal_convection_flux")),
+            recorder.Channel("radiation", streams.add_attribute(heatShield, "thermal_radiation_flux")),
+            recorder.Channel("ablator", streams.add_call(heatShield.resources, "amount", "Ablator"))]
 
-try:
-    while vesselActive:
-        ut = str(connection.space_center.ut)
-        alt = str(vessel.flight().mean_altitude)
-        speed = str(vessel.flight().speed)
-        conduction_flux = str(heatShield.thermal_conduction_flux)
-        convection_flux = str(heatShield.thermal_convection_flux)
-        radiation_flux = str(heatShield.thermal_radiation_flux)
-        ablator = str(heatShield.resources.amount("Ablator"))
+# samples go to disk a chunk at a time as we fly, so a crash only loses the last few seconds
+rec = recorder.Recorder(connection, channels, interval=0.1,
+                        writer=recorder.CsvWriter("C:\\krpc\\mapThermalFluxSteep.csv"))
 
-        outCSV.append((ut, alt, speed, conduction_flux, convection_flux, radiation_flux, ablator))
-        time.sleep(0.1)
-except:
+try:
+    scheduler.Scheduler.forProgram(rec).runWhile(rec)
+except Exception:
     print("we crashed")
-
-
-with open("C:\\krpc\\mapThermalFluxSteep.csv", "w") as fh:
-    outString = '\n'.join([','.join(line) for line in outCSV])
-    fh.write(outString)
+finally:
+    rec.release()
 
 print("we done")
@@ -1,43 +1,17 @@
 import krpc
 import math
 
+from kspy.orbit import LocalOrbit
+
 connection = krpc.connect("Launcher")
 vessel = connection.space_center.active_vessel
 
-def total_area(orbit):
-    a = orbit.semi_major_axis
-    b = orbit.semi_minor_axis
-    return math.pi * a * b
-
-def area_since_periapsis(orbit, E):
-    a = orbit.semi_major_axis
-    b = orbit.semi_minor_axis
-    return 0.5 * a * b * E
-
-def mean_anomaly_from_true_anomaly(orbit, theta):
-    e = orbit.eccentricity
-    adj = e + math.cos(theta)
-    hyp = 1 + e*math.cos(theta)
-    return math.acos(adj / hyp)
-
-def area_between_mean_anomalies(orbit, E0, E1):
-    A0 = area_since_periapsis(orbit, E0)
-    A1 = area_since_periapsis(orbit, E1)
-    return A1 - A0
-
 def time_to_ascending_node(orbit):
-    A0 = total_area(orbit)
-
-    E = orbit.mean_anomaly
-    Ap = area_since_periapsis(orbit, E)
-
-    theta = orbit.argument_of_periapsis - math.pi
-    En = mean_anomaly_from_true_anomaly(orbit, theta)
-    En += math.pi
-    An = area_since_periapsis(orbit, En)
+    local = LocalOrbit.fromOrbit(orbit)
 
-    frac = (An-Ap)/A0
-    return orbit.period * frac
+    # the ascending node is where the true anomaly swings back round past the argument of periapsis
+    theta = -local.argument_of_periapsis
+    return local.ut_at_true_anomaly(theta) - local.ut
 
 def change_inclination(conn, vessel, new_inclination):
     orbit = vessel.orbit
@@ -2,46 +2,229 @@
 telemetry.py
 
 Class and functions for reading data from the server
+
+StreamManager hands out shared handles to server-side streams. Every consumer
+asking for the same (object id, attribute, reference frame) gets a handle on the
+same krpc stream, and the stream is only removed from the server once the last
+handle on it has been released.
+
+The refcounting matters because the server already dedups identical calls: two
+add_stream calls for the same attribute come back with the same stream id, so
+without it one consumer calling remove() kills the stream for everybody else.
 """
 
+import threading
+import weakref
+
 from ozzybear_krpc import const
 
 
-class StreamManager(object):
-    _instance = None
+UT = 'ut'
+
+
+def _object_id(obj):
+    """
+    Key component for a remote object. Service objects (space_center) don't
+    carry an object id, so they are keyed by their type name instead.
+    """
+    if obj is None:
+        return None
+    return getattr(obj, '_object_id', type(obj).__name__)
+
+
+def _argument_key(arg):
+    """
+    Key component for a call argument: remote objects by id, plain values as-is.
+    """
+    if hasattr(arg, '_object_id'):
+        return arg._object_id
+    return arg
+
+
+class SharedStream(object):
+    """
+    A refcounted handle on a stream owned by a StreamManager. Call it like a
+    krpc stream to get the latest value, and release it when you're done.
+    Releasing a handle more than once is harmless.
+    """
+
+    def __init__(self, manager, key, stream):
+        self._manager = manager
+        self._stream = stream
+        self.key = key
+        self.released = False
+
+    def __call__(self):
+        return self._stream()
+
+    @property
+    def stream(self):
+        return self._stream
 
-    def __new__(cls, *args, **kwargs):
+    def release(self):
+        if not self.released:
+            self.released = True
+            self._manager.release(self.key)
 
-        if cls._instance is None:
-            cls._instance = object.__new__(cls, *args, **kwargs)
+    def __enter__(self):
+        return self
 
-        return cls._instance
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class StreamManager(object):
+    """
+    One registry per connection; constructing a StreamManager for a connection
+    that already has one returns the existing registry.
+    """
+    _instances = weakref.WeakKeyDictionary()
+    _instances_lock = threading.Lock()
+
+    def __new__(cls, conn):
+        with cls._instances_lock:
+            instance = cls._instances.get(conn)
+            if instance is None:
+                instance = object.__new__(cls)
+                instance._initialized = False
+                cls._instances[conn] = instance
+
+        return instance
 
     def __init__(self, conn):
+        if self._initialized:
+            return
+
         self._conn = conn
+        # key -> [stream, refcount]
         self._streams = {}
+        # (vessel id, reference frame id) -> Flight, since every call to
+        # vessel.flight() makes a brand new object on the server
+        self._flights = {}
+        self._lock = threading.RLock()
+        self._initialized = True
 
         super(StreamManager, self).__init__()
 
+    def __len__(self):
+        return len(self._streams)
+
+    def __contains__(self, key):
+        return key in self._streams
+
+    @property
+    def conn(self):
+        return self._conn
+
+    def refcount(self, key):
+        with self._lock:
+            entry = self._streams.get(key)
+            return entry[1] if entry else 0
+
+    def acquire(self, key, *args):
+        """
+        Get a handle on the stream for key, adding it to the server with
+        conn.add_stream(*args) if nobody holds it yet.
+        """
+        with self._lock:
+            entry = self._streams.get(key)
+            if entry is None:
+                entry = [self._add_stream(*args), 0]
+                self._streams[key] = entry
+            entry[1] += 1
+
+            return SharedStream(self, key, entry[0])
+
+    def release(self, key):
+        """
+        Drop one reference to the stream for key, removing it from the server
+        when that was the last one.
+        """
+        with self._lock:
+            entry = self._streams.get(key)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self._streams[key]
+
+            # still under the lock: the server hands identical calls the
+            # same stream, so an acquire slipping in before the remove
+            # would get a stream that's about to go away
+            entry[0].remove()
+
+    def clear(self):
+        """
+        Remove every stream this manager added, regardless of who still holds it.
+        """
+        with self._lock:
+            for stream, _ in self._streams.values():
+                stream.remove()
+            self._streams.clear()
+            self._flights.clear()
+
     def _add_stream(self, *args):
         return self._conn.add_stream(*args)
 
-    def add_apoapsis_altitude(self, vessel):
-        key = 'vessel[{0}]'.format(vessel._object_id)
-        stream = self._conn.add_stream()
-
-    def add_accelleration_(self, vessel, reference_frame):
-        key = 'vessel[{0}]'.format(vessel._object_id)
-        stream = self._add_stream(getattr, vessel.flight)
-
-    def add_vessel_altitude(self, vessel):
-        key = vessel
-        stream = self._add_stream(getattr, vessel.flight, const.MEAN_ALTITUDE)
-
-    def get_stage_resource_stream(vessel, stage, resource, cumulative=False):
-        key = '{0}'
-
-        resource_obj = vessel.resources_in_decouple_stage(stage=stage, cumulative=cumulative)
-        stream = self._conn.add_stream(resource_obj, resource)
-
+    def _flight(self, vessel, reference_frame):
+        key = (_object_id(vessel), _object_id(reference_frame))
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                if reference_frame is None:
+                    flight = vessel.flight()
+                else:
+                    flight = vessel.flight(reference_frame)
+                self._flights[key] = flight
+
+        return flight
+
+    def add_ut(self):
+        space_center = self._conn.space_center
+        key = (_object_id(space_center), UT, None)
+        return self.acquire(key, getattr, space_center, UT)
+
+    def add_attribute(self, obj, attribute):
+        key = (_object_id(obj), attribute, None)
+        return self.acquire(key, getattr, obj, attribute)
+
+    def add_call(self, obj, method, *args):
+        """
+        Stream the result of obj.method(*args), e.g. node.remaining_burn_vector
+        """
+        key = (_object_id(obj), method, tuple(_argument_key(arg) for arg in args))
+        return self.acquire(key, getattr(obj, method), *args)
+
+    def add_flight(self, vessel, attribute, reference_frame=None):
+        key = (_object_id(vessel), 'flight.{0}'.format(attribute), _object_id(reference_frame))
+        with self._lock:
+            if key in self._streams:
+                return self.acquire(key)
+            return self.acquire(key, getattr, self._flight(vessel, reference_frame), attribute)
+
+    def add_orbit(self, vessel, attribute):
+        key = (_object_id(vessel), 'orbit.{0}'.format(attribute), None)
+        with self._lock:
+            if key in self._streams:
+                return self.acquire(key)
+            return self.acquire(key, getattr, vessel.orbit, attribute)
 
+    def add_apoapsis_altitude(self, vessel):
+        return self.add_orbit(vessel, const.APOAPSIS_ALTITUDE)
+
+    def add_periapsis_altitude(self, vessel):
+        return self.add_orbit(vessel, const.PERIAPSIS_ALTITUDE)
+
+    def add_vessel_altitude(self, vessel, reference_frame=None):
+        return self.add_flight(vessel, const.MEAN_ALTITUDE, reference_frame)
+
+    def get_stage_resource_stream(self, vessel, stage, resource, cumulative=False):
+        key = (_object_id(vessel),
+               'resources_in_decouple_stage[{0}, {1}].amount'.format(stage, cumulative),
+               resource)
+        with self._lock:
+            if key in self._streams:
+                return self.acquire(key)
+            resource_obj = vessel.resources_in_decouple_stage(stage=stage, cumulative=cumulative)
+            return self.acquire(key, resource_obj.amount, resource)
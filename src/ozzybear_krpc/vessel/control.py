@@ -17,6 +17,7 @@ TODO:
 import ozzybear_krpc.telemetry
 from ozzybear_krpc import const
 
+import threading
 import time
 
 INTERRUPT_STOP = 'stop'
@@ -85,6 +86,32 @@ def _stage_ready(resources_obj, autostage_resources, mode=const.AND):
         return False
 
 
+def _stage_empty_condition(conn, resources_obj, autostage_resources, mode=const.AND):
+    """
+    Server-side version of _stage_ready: an Expression that becomes true when
+    the stage's resources run low, so the server can tell us instead of us asking.
+    """
+    if mode not in [const.AND, const.OR]:
+        raise ValueError('mode must be one of [{0}], {1} was provided'.format(', '.join([const.AND, const.OR]), mode))
+    Expression = conn.krpc.Expression
+
+    names = [name for name in resources_obj.names if name in autostage_resources]
+    if not names:
+        return Expression.constant_bool(True)
+
+    conditions = []
+    for name in names:
+        amount = Expression.call(conn.get_call(resources_obj.amount, name))
+        threshold = Expression.constant_float(resources_obj.max(name) * 0.05)
+        conditions.append(Expression.less_than_or_equal(amount, threshold))
+
+    combine = Expression.and_ if mode == const.AND else Expression.or_
+    condition = conditions[0]
+    for other in conditions[1:]:
+        condition = combine(condition, other)
+    return condition
+
+
 def _get_autostage_stages(vessel, autostage_resources=const.RESOURCES_FUEL, stop_if_skipping=True):
     # I /think/ this needs the +1, as the dox say it corresponds to the
     # in-game UI, but I haven't checked yet
@@ -123,24 +150,21 @@ def autostage(
         stages = _get_autostage_stages(vessel, autostage_resources=autostage_resources, stop_if_skipping=stop_if_skipping)
 
     interrupts = set(interrupts or [])
+    conn = vessel._client
 
     for stage in stages:
         if stage is None:
             raise NonEngineStage()
-        while True:
-            resources = vessel.resources_in_decouple_stage(stage)
-            if _stage_ready(resources, autostage_resources  , mode=const.AND):
-                print("firing stage {0}".format(stage))
-                time.sleep(0.5)
-                vessel.control.activate_next_stage()
-                print("stage {0} fired.".format(stage))
-                break
-            if noisy:
-                for resource in autostage_resources:
-                    pass
-                    #if resources.amount(resource):
-                        #print("{0} level: {1}".format(resource, resources.amount(resource)))
-            if interrupts is not None:
+
+        # let the server watch the fuel, we just wait to hear that it's run low
+        resources = vessel.resources_in_decouple_stage(stage)
+        event = conn.krpc.add_event(_stage_empty_condition(conn, resources, autostage_resources, mode=const.AND))
+        empty = threading.Event()
+        event.add_callback(empty.set)
+        event.start()
+        try:
+            # only wake up before the stage runs dry if there are interrupts to check on
+            while not empty.wait(0.1 if interrupts else None):
                 for interrupt in set(interrupts):
                     try:
                         interrupt(vessel)
@@ -151,7 +175,13 @@ def autostage(
                             raise exc
                         if exc.skip_stage:
                             break
-            time.sleep(0.1)
+        finally:
+            event.remove()
+
+        print("firing stage {0}".format(stage))
+        time.sleep(0.5)
+        vessel.control.activate_next_stage()
+        print("stage {0} fired.".format(stage))
 
     print('no more stages!')
 